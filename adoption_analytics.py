@@ -0,0 +1,281 @@
+"""Adoption counts over time, by breed or adopter country, from precomputed rollups plus a live tail.
+
+Rollups are stored as ``{"_id": {"granularity", "dimension", "value", "start"}, "count"}`` in the
+``adoption_rollups`` collection: one per day and one per month, for every adoption (``dimension`` "all"), every
+breed and every owner country. They cover adoptions dated before a watermark (midnight of the day they were last
+rolled forward); anything later is counted live from the ``adoption_date`` index. Rolling forward only recounts the
+days since the watermark and rewrites their months from the daily rollups, so it is cheap, idempotent and safe to
+run from several processes. Queries roll forward on their own when the watermark is a day or more behind.
+
+Adoptions inserted with a date before the watermark (a loader run) need ``python adoption_analytics.py build``,
+which the loader runs itself. Deleting adoptions through ``app.py`` takes them out of their rollups as it goes: their
+rollup keys are read with ``counted_adoptions`` before anything is deleted, and subtracted with ``decrement_rollups``
+in the same transaction.
+
+All dates are naive UTC, as the driver returns them.
+"""
+import argparse
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+from connection import LazyDatabase
+
+db = LazyDatabase()
+
+ROLLUP_COLLECTION = "adoption_rollups"
+STATE_ID = "watermark"
+DIMENSIONS = ("all", "breed", "country")
+GRANULARITIES = ("day", "week", "month", "quarter", "year")
+# Granularities that are whole months, and so can be summed from the monthly rollups.
+MONTHLY = ("month", "quarter", "year")
+
+
+def utc_now() -> datetime:
+    """The current time as a naive UTC datetime, comparable with the dates the driver returns."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def day_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, moment.day)
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def _next_day(moment: datetime) -> datetime:
+    start = day_start(moment)
+    return start if start == moment else start + timedelta(days=1)
+
+
+def _next_month(moment: datetime) -> datetime:
+    start = month_start(moment)
+    if start == moment:
+        return start
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    """The start of the bucket ``moment`` falls in. Weeks start on Monday, quarters in January, April, ..."""
+    if granularity == "day":
+        return day_start(moment)
+    if granularity == "week":
+        return day_start(moment) - timedelta(days=moment.weekday())
+    if granularity == "month":
+        return month_start(moment)
+    if granularity == "quarter":
+        return datetime(moment.year, moment.month - (moment.month - 1) % 3, 1)
+    if granularity == "year":
+        return datetime(moment.year, 1, 1)
+    raise ValueError(f"Unknown granularity {granularity!r}; expected one of {', '.join(GRANULARITIES)}.")
+
+
+def _adoption_stages(dimension: Optional[str] = None) -> List[Dict]:
+    """Adoptions -> ``{"day", "keys": [{"dimension", "value"}]}``, joining only what ``dimension`` needs."""
+    dimensions = DIMENSIONS if dimension is None else (dimension,)
+    stages = []
+    values = {"all": None}
+    if "breed" in dimensions:
+        stages.append({"$lookup": {"from": "dog", "localField": "dog_id", "foreignField": "_id", "as": "dog",
+                                   "pipeline": [{"$project": {"breed.name": 1}}]}})
+        values["breed"] = {"$ifNull": [{"$arrayElemAt": ["$dog.breed.name", 0]}, None]}
+    if "country" in dimensions:
+        stages.append({"$lookup": {"from": "owner", "localField": "owner_id", "foreignField": "_id", "as": "owner",
+                                   "pipeline": [{"$project": {"address.country": 1}}]}})
+        values["country"] = {"$ifNull": [{"$arrayElemAt": ["$owner.address.country", 0]}, None]}
+    return stages + [
+        {"$project": {"_id": 0, "day": {"$dateTrunc": {"date": "$adoption_date", "unit": "day"}},
+                      "keys": [{"dimension": name, "value": values[name]} for name in dimensions]}},
+        {"$unwind": "$keys"},
+    ]
+
+
+def _date_filter(start: Optional[datetime], end: Optional[datetime]) -> Dict:
+    bounds = {}
+    if start is not None:
+        bounds["$gte"] = start
+    if end is not None:
+        bounds["$lt"] = end
+    return {"adoption_date": bounds} if bounds else {}
+
+
+def _roll_up(database: Database, start: Optional[datetime], end: datetime):
+    """Recount the daily rollups of adoptions in [start, end), then the monthly rollups of the months touched."""
+    merge = {"$merge": {"into": ROLLUP_COLLECTION, "whenMatched": "replace", "whenNotMatched": "insert"}}
+    database["adoption"].aggregate([{"$match": _date_filter(start, end)}] + _adoption_stages() + [
+        {"$group": {"_id": {"granularity": "day", "dimension": "$keys.dimension", "value": "$keys.value",
+                            "start": "$day"}, "count": {"$sum": 1}}},
+        merge,
+    ])
+
+    days = {"$lt": end} if start is None else {"$gte": month_start(start), "$lt": end}
+    database[ROLLUP_COLLECTION].aggregate([
+        {"$match": {"_id.granularity": "day", "_id.start": days}},
+        {"$group": {"_id": {"granularity": "month", "dimension": "$_id.dimension", "value": "$_id.value",
+                            "start": {"$dateTrunc": {"date": "$_id.start", "unit": "month"}}},
+                    "count": {"$sum": "$count"}}},
+        merge,
+    ])
+    database[ROLLUP_COLLECTION].update_one({"_id": STATE_ID}, {"$max": {"through": end}}, upsert=True)
+
+
+def build_rollups(database: Database):
+    """Recount every rollup from the adoption collection, up to midnight today."""
+    database[ROLLUP_COLLECTION].drop()
+    through = day_start(utc_now())
+    _roll_up(database, None, through)
+    print(f"Built adoption rollups through {through:%Y-%m-%d}.")
+
+
+def get_watermark(database: Database, session=None) -> Optional[datetime]:
+    state = database[ROLLUP_COLLECTION].find_one({"_id": STATE_ID}, session=session)
+    return state["through"] if state else None
+
+
+def refresh_rollups(database: Database) -> Optional[datetime]:
+    """Roll the rollups forward to midnight today, if they were built and are behind. Returns the watermark."""
+    watermark = get_watermark(database)
+    today = day_start(utc_now())
+    if watermark is not None and watermark < today:
+        _roll_up(database, watermark, today)
+        watermark = today
+    return watermark
+
+
+def counted_pipeline(adoption_filter: Dict, watermark: datetime) -> List[Dict]:
+    """The daily rollup keys of the adoptions matching ``adoption_filter`` that the rollups count.
+
+    Rows are ``{"_id": {"day", "dimension", "value"}, "count"}``.
+    """
+    return [{"$match": {"$and": [adoption_filter, {"adoption_date": {"$lt": watermark}}]}}] + _adoption_stages() + [
+        {"$group": {"_id": {"day": "$day", "dimension": "$keys.dimension", "value": "$keys.value"},
+                    "count": {"$sum": 1}}},
+    ]
+
+
+def decrement_requests(counted: Iterable[Dict]) -> List[UpdateOne]:
+    """Updates taking ``counted_pipeline`` rows out of their daily and monthly rollups."""
+    deltas = defaultdict(int)
+    for row in counted:
+        day, dimension, value = row["_id"]["day"], row["_id"]["dimension"], row["_id"]["value"]
+        deltas[("day", dimension, value, day)] += row["count"]
+        deltas[("month", dimension, value, month_start(day))] += row["count"]
+    # The key fields are in the order _roll_up groups them in, since _id is matched as a whole document.
+    return [UpdateOne({"_id": {"granularity": granularity, "dimension": dimension, "value": value, "start": start}},
+                      {"$inc": {"count": -count}})
+            for (granularity, dimension, value, start), count in deltas.items()]
+
+
+def counted_adoptions(database: Database, adoption_filter: Dict, session=None) -> List[Dict]:
+    """The rollup keys of the adoptions matching ``adoption_filter``; none if the rollups have not been built.
+
+    Read before the adoptions are deleted, and before their dogs and owners are, which give their breed and country.
+    """
+    watermark = get_watermark(database, session)
+    if watermark is None:
+        return []
+    return list(database["adoption"].aggregate(counted_pipeline(adoption_filter, watermark), session=session))
+
+
+def decrement_rollups(database: Database, counted: List[Dict], session=None):
+    """Subtract deleted adoptions, as read by ``counted_adoptions``, with one unordered bulk write."""
+    requests = decrement_requests(counted)
+    if requests:
+        database[ROLLUP_COLLECTION].bulk_write(requests, ordered=False, session=session)
+
+
+def _segments(start: datetime, end: datetime, watermark: Optional[datetime],
+              granularity: str) -> List[Tuple[str, datetime, datetime]]:
+    """Split [start, end) into (source, start, end) pieces: "live", "day" or "month" rollups."""
+    rolled_start = _next_day(start)
+    rolled_end = min(day_start(end), watermark) if watermark is not None else rolled_start
+    if rolled_start >= rolled_end:
+        return [("live", start, end)]
+
+    segments = [("live", start, rolled_start)]
+    months_start, months_end = _next_month(rolled_start), month_start(rolled_end)
+    if granularity in MONTHLY and months_start < months_end:
+        segments += [("day", rolled_start, months_start), ("month", months_start, months_end),
+                     ("day", months_end, rolled_end)]
+    else:
+        segments.append(("day", rolled_start, rolled_end))
+    segments.append(("live", rolled_end, end))
+    return [(source, piece_start, piece_end) for source, piece_start, piece_end in segments
+            if piece_start < piece_end]
+
+
+def _rollup_counts(database: Database, source: str, dimension: str, start: datetime,
+                   end: datetime) -> List[Tuple[datetime, object, int]]:
+    # Rollups whose adoptions have all been deleted are left at zero.
+    rollups = database[ROLLUP_COLLECTION].find({"_id.dimension": dimension, "_id.granularity": source,
+                                                "_id.start": {"$gte": start, "$lt": end}, "count": {"$gt": 0}})
+    return [(rollup["_id"]["start"], rollup["_id"]["value"], rollup["count"]) for rollup in rollups]
+
+
+def _live_counts(database: Database, dimension: str, start: datetime,
+                 end: datetime) -> List[Tuple[datetime, object, int]]:
+    rows = database["adoption"].aggregate([{"$match": _date_filter(start, end)}] + _adoption_stages(dimension) + [
+        {"$group": {"_id": {"day": "$day", "value": "$keys.value"}, "count": {"$sum": 1}}},
+    ])
+    return [(row["_id"]["day"], row["_id"]["value"], row["count"]) for row in rows]
+
+
+def adoption_counts(database: Database, start: datetime, end: datetime, granularity: str = "month",
+                    dimension: str = "all") -> List[Dict]:
+    """Adoptions dated in [start, end), per ``granularity`` bucket and per value of ``dimension``.
+
+    Returns ``{"start", "value", "count"}`` rows ordered by bucket, then by descending count; ``value`` is None for
+    ``dimension="all"``. Buckets at the ends of the range only count the part inside it.
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown dimension {dimension!r}; expected one of {', '.join(DIMENSIONS)}.")
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity {granularity!r}; expected one of {', '.join(GRANULARITIES)}.")
+
+    watermark = refresh_rollups(database)
+    counts = defaultdict(int)
+    for source, piece_start, piece_end in _segments(start, end, watermark, granularity):
+        if source == "live":
+            rows = _live_counts(database, dimension, piece_start, piece_end)
+        else:
+            rows = _rollup_counts(database, source, dimension, piece_start, piece_end)
+        for moment, value, count in rows:
+            counts[(bucket_start(moment, granularity), value)] += count
+
+    return [{"start": bucket, "value": value, "count": count}
+            for (bucket, value), count in sorted(counts.items(), key=lambda item: (item[0][0], -item[1]))]
+
+
+def print_adoption_counts(rows: List[Dict], granularity: str):
+    formats = {"day": "%Y-%m-%d", "week": "%Y-%m-%d", "month": "%Y-%m", "quarter": "%Y-%m", "year": "%Y"}
+    for row in rows:
+        label = row["start"].strftime(formats[granularity])
+        if granularity == "quarter":
+            label = f"{row['start'].year}-Q{(row['start'].month - 1) // 3 + 1}"
+        value = "" if row["value"] is None else f" {row['value']}"
+        print(f"{label}{value}: {row['count']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Adoption counts over time from precomputed rollups.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="Recount every rollup from the adoption collection.")
+    subparsers.add_parser("refresh", help="Roll the rollups forward to midnight today.")
+    report_parser = subparsers.add_parser("report", help="Print adoption counts for a date range.")
+    report_parser.add_argument("--start", type=datetime.fromisoformat, required=True, help="e.g. 2023-01-01")
+    report_parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="Exclusive; default now.")
+    report_parser.add_argument("--granularity", choices=GRANULARITIES, default="month")
+    report_parser.add_argument("--by", choices=DIMENSIONS, default="all")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_rollups(db)
+    elif args.command == "refresh":
+        print(f"Adoption rollups are current through {refresh_rollups(db)}.")
+    else:
+        print_adoption_counts(adoption_counts(db, args.start, args.end or utc_now(), args.granularity,
+                                              args.by), args.granularity)
@@ -1,194 +1,441 @@
-from typing import Dict, List
-from datetime import datetime
+import argparse
+import os
+import re
+import shlex
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from bson import ObjectId
-from pymongo import MongoClient
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from adoption_analytics import counted_adoptions, decrement_rollups, utc_now
+from bulk import BulkResult, chunks, parse_object_ids, record_write_errors
+from connection import LazyDatabase, run_in_transaction
+from facet_counts import FACETS, STATS_COLLECTION, facet_counts_built, get_facet_count, increment_facets, \
+    merge_facet_changes, owner_facet_changes
+from indexes import ensure_indexes
+import instrumentation
+from instrumentation import instrumented
+from owner_search import KEYS, best_similarity, get_search_index, index_owners, normalize, prefix_filter, search_keys, \
+    unindex_owners
+from pagination import fetch_page, iter_documents
+from query_cache import cached, query_cache
+import read_replica
+from read_replica import writer
+
+db = LazyDatabase()
+
+# Cache tags, one per slice of data a cached read depends on.
+OWNER_ADDRESSES = "owner.address"
+OWNER_LIST = "owner.list"
+DOG_BREEDS = "dog.breed"
+
+# Dogs are returned with just their breed reference; pass include_breed_details=True to attach the full breed.
+DOG_PROJECTION = {"name": 1, "country": 1, "breed._id": 1, "breed.name": 1}
+
+# Keyset sort orders for the paged listings; each ends in _id so pages never overlap.
+BY_ID = [("_id", 1)]
+BY_NAME = [("name", 1), ("_id", 1)]
+
+# Picker name -> facet; each picker lists a field's most frequent values.
+PICKERS = {"city": "owner.city", "zip": "owner.zip", "country": "owner.country", "breed": "dog.breed"}
+
+# Requests per bulk_write round trip in the bulk variants of the write functions.
+BULK_CHUNK_SIZE = 1000
+# Owners deleted per transaction, and dog ids per $in, in the cascading deletes.
+OWNERS_PER_TRANSACTION = 100
+CASCADE_CHUNK_SIZE = 1000
+# Fuzzy owner search re-ranks this many trigram candidates against the owners' current names and emails.
+FUZZY_CANDIDATES = 50
+
+
+def _reads():
+    """Where the hot reads go: the read replica while it is running and current (read_replica.py), else the server."""
+    return read_replica.serving() or db
+
+
+@instrumented
+def attach_breed_details(dogs: List[Dict]) -> List[Dict]:
+    breed_ids = list({dog["breed"]["_id"] for dog in dogs if "_id" in dog.get("breed", {})})
+    breeds = {breed["_id"]: breed for breed in db["breed"].find({"_id": {"$in": breed_ids}})}
+    for dog in dogs:
+        breed_id = dog.get("breed", {}).get("_id")
+        if breed_id in breeds:
+            dog["breed"] = breeds[breed_id]
+    return dogs
+
+
+def _dog_results(cursor, include_breed_details: bool) -> List[Dict]:
+    dogs = list(cursor)
+    return attach_breed_details(dogs) if include_breed_details else dogs
+
+
+@instrumented
+def find_dogs_of_breed_page(breed_name: str, page_size: int = 5, token: Optional[str] = None,
+                            include_breed_details: bool = False) -> Tuple[List[Dict], Optional[str]]:
+    dogs, token = fetch_page(_reads()["dog"], {"breed.name": breed_name}, BY_NAME, page_size, token, DOG_PROJECTION)
+    return _dog_results(dogs, include_breed_details), token
+
+
+def iter_dogs_of_breed(breed_name: str, batch_size: int = 1000) -> Iterator[Dict]:
+    return iter_documents(db["dog"], {"breed.name": breed_name}, BY_NAME, DOG_PROJECTION, batch_size)
+
+
+@instrumented
+def find_top_5_dogs_of_breed(breed_name: str, include_breed_details: bool = False) -> List[Dict]:
+    return find_dogs_of_breed_page(breed_name, 5, include_breed_details=include_breed_details)[0]
+
+
+def adopted_dogs_stages(limit: int) -> List[Dict]:
+    # Adoption documents -> the adopted dogs, joined server-side and projected like every other dog listing.
+    return [
+        {"$limit": limit},
+        {"$lookup": {"from": "dog", "localField": "dog_id", "foreignField": "_id", "as": "dog"}},
+        {"$unwind": "$dog"},
+        {"$replaceRoot": {"newRoot": "$dog"}},
+        {"$project": DOG_PROJECTION}
+    ]
 
-client = MongoClient("mongodb://localhost:27017/")
-db = client["pet_adoption"]
 
+@instrumented
+def find_top_5_dogs_by_owner(owner_id: str, include_breed_details: bool = False) -> List[Dict]:
+    adoption_collection = db["adoption"]
+    dogs = adoption_collection.aggregate(
+        [{"$match": {"owner_id": ObjectId(owner_id)}}] + adopted_dogs_stages(5) + [{"$sort": {"name": 1}}]
+    )
+    return _dog_results(dogs, include_breed_details)
 
-def find_top_5_dogs_of_breed(breed_name: str) -> List[Dict]:
-    collection = db["dog"]
-    dogs = collection.find({"breed.name": breed_name}).sort("name", 1).limit(5)
-    return list(dogs)
 
+@instrumented
+def list_owners_page(page_size: int = 10, token: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    return fetch_page(_reads()["owner"], {}, BY_ID, page_size, token)
 
-def find_top_5_dogs_by_owner(owner_id: str) -> List[Dict]:
-    adoption_collection = db["adoption"]
-    dog_collection = db["dog"]
 
-    adopted_dog_ids = adoption_collection.find({"owner_id": ObjectId(owner_id)}).limit(5)
-    adopted_dog_ids_list = [doc["dog_id"] for doc in adopted_dog_ids]
-
-    dogs = dog_collection.find({"_id": {"$in": adopted_dog_ids_list}}).sort("name", 1)
-    return list(dogs)
+def iter_owners(batch_size: int = 1000) -> Iterator[Dict]:
+    return iter_documents(db["owner"], {}, BY_ID, batch_size=batch_size)
 
 
+@instrumented
+@cached(ttl=60, tags=[OWNER_LIST])
 def get_top_10_owners():
-    owners_collection = db["owner"]
-    top_10_owners = list(owners_collection.find().sort("_id", 1).limit(10))
-    return top_10_owners
+    return list_owners_page(10)[0]
 
 
+@instrumented
+@writer
 def update_dog_name(dog_id: object, new_name: str):
     collection = db["dog"]
     result = collection.update_one({"_id": ObjectId(dog_id)}, {"$set": {"name": new_name}})
     return result.modified_count
 
 
+@instrumented
+@writer
 def add_owner(owner: Dict):
     collection = db["owner"]
+    owner["search"] = search_keys(owner)
     result = collection.insert_one(owner)
+    increment_facets(db, owner_facet_changes(owner, 1))
+    index_owners(db, [owner])
+    query_cache.invalidate(OWNER_ADDRESSES, OWNER_LIST)
     return result.inserted_id
 
 
+def _delete_owners_cascade(owner_ids: List[ObjectId], chunk_size: int, session) -> Dict[str, int]:
+    # Children before parents: if this runs without a transaction and stops part-way, what is left is an owner
+    # with fewer dogs, never a dog or adoption pointing at a missing owner.
+    adoption_filter = {"owner_id": {"$in": owner_ids}}
+    counted = counted_adoptions(db, adoption_filter, session)
+    adopted = db["adoption"].find(adoption_filter, {"dog_id": 1}, session=session).batch_size(chunk_size)
+    breed_counts = defaultdict(int)
+    dogs = 0
+    for dog_ids in chunks((adoption["dog_id"] for adoption in adopted), chunk_size):
+        for dog in db["dog"].find({"_id": {"$in": dog_ids}}, {"breed.name": 1}, session=session):
+            breed_counts[dog["breed"]["name"]] -= 1
+        dogs += db["dog"].delete_many({"_id": {"$in": dog_ids}}, session=session).deleted_count
+    adoptions = db["adoption"].delete_many(adoption_filter, session=session).deleted_count
+
+    owners = list(db["owner"].find({"_id": {"$in": owner_ids}}, {"address": 1}, session=session))
+    db["owner"].delete_many({"_id": {"$in": owner_ids}}, session=session)
+    increment_facets(db, merge_facet_changes({"dog.breed": breed_counts},
+                                             *[owner_facet_changes(owner, -1) for owner in owners]), session)
+    decrement_rollups(db, counted, session)
+    return {"owners": len(owners), "dogs": dogs, "adoptions": adoptions}
+
+
+@instrumented
+@writer
+def delete_owners(owner_ids: Iterable[object], chunk_size: int = CASCADE_CHUNK_SIZE) -> Dict[str, int]:
+    """Delete owners with their adopted dogs and adoption rows, OWNERS_PER_TRANSACTION owners per transaction.
+
+    Returns how many owners, dogs and adoption rows were deleted.
+    """
+    totals = {"owners": 0, "dogs": 0, "adoptions": 0}
+    for chunk in chunks((ObjectId(owner_id) for owner_id in owner_ids), OWNERS_PER_TRANSACTION):
+        deleted = run_in_transaction(db, lambda session: _delete_owners_cascade(chunk, chunk_size, session))
+        unindex_owners(db, chunk)
+        for name, count in deleted.items():
+            totals[name] += count
+
+    if totals["owners"]:
+        query_cache.invalidate(OWNER_ADDRESSES, OWNER_LIST)
+    if totals["dogs"]:
+        query_cache.invalidate(DOG_BREEDS)
+    return totals
+
+
+@instrumented
 def delete_owner(owner_id: object):
-    # Delete owner
-    owner_collection = db["owner"]
-    owner_result = owner_collection.delete_one({"_id": ObjectId(owner_id)})
-
-    # Find adoption entries
-    adoption_collection = db["adoption"]
-    adoption_entries = adoption_collection.find({"owner_id": ObjectId(owner_id)})
-
-    # Extract dog_ids from adoption entries
-    dog_ids_to_delete = [entry["dog_id"] for entry in adoption_entries]
-
-    # Delete dogs from dog collection based on dog_ids
-    dogs_collection = db["dog"]
-    dog_result = dogs_collection.delete_many({"_id": {"$in": [ObjectId(dog_id) for dog_id in dog_ids_to_delete]}})
-
-    # Delete adoption entries
-    adoption_result = adoption_collection.delete_many({"owner_id": ObjectId(owner_id)})
-
-    print(f"Deleted {owner_result.deleted_count} owner(s).")
-    print(f"Deleted {dog_result.deleted_count} dog(s) associated with the owner.")
-    print(f"Deleted {adoption_result.deleted_count} adoption entry/entries associated with the owner.")
-
-
+    deleted = delete_owners([owner_id])
+    print(f"Deleted {deleted['owners']} owner(s).")
+    print(f"Deleted {deleted['dogs']} dog(s) associated with the owner.")
+    print(f"Deleted {deleted['adoptions']} adoption entry/entries associated with the owner.")
+
+
+def _value_filter(prefix: str) -> Dict:
+    return {"$regex": f"^{re.escape(prefix)}"} if prefix else {"$type": "string"}
+
+
+def picker_stats_pipeline(pickers: Tuple[str, ...], limit: int, prefix: str) -> List[Dict]:
+    """Top values of every picker from the stats collection, one index-backed branch per picker.
+
+    Branches are joined with $unionWith rather than $facet because $facet sub-pipelines cannot use indexes.
+    """
+    def branch(picker: str) -> List[Dict]:
+        return [
+            {"$match": {"_id.facet": PICKERS[picker], "count": {"$gt": 0}, "_id.value": _value_filter(prefix)}},
+            {"$sort": {"count": -1, "_id.value": 1}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "picker": {"$literal": picker}, "value": "$_id.value", "count": 1}},
+        ]
+
+    first, *rest = pickers
+    return branch(first) + [{"$unionWith": {"coll": STATS_COLLECTION, "pipeline": branch(picker)}} for picker in rest]
+
+
+def picker_live_pipeline(pickers: Tuple[str, ...], limit: int, prefix: str) -> List[Dict]:
+    """Top values of pickers on the same collection, counted live in a single $facet pass."""
+    facets = {}
+    for picker in pickers:
+        field = FACETS[PICKERS[picker]][1]
+        facets[picker] = [
+            {"$match": {field: _value_filter(prefix)}},
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "value": "$_id", "count": 1}},
+        ]
+    return [{"$facet": facets}]
+
+
+@instrumented
+@cached(ttl=300, tags=[OWNER_ADDRESSES, DOG_BREEDS])
+def get_pickers(pickers: Tuple[str, ...] = tuple(PICKERS), limit: int = 10, prefix: str = "") -> Dict[str, List[Dict]]:
+    """The ``limit`` most frequent values (``{"value", "count"}``, ties by value) of each picker.
+
+    ``prefix`` keeps only values starting with it, for type-ahead. Served in one round trip from the stats collection;
+    counted live, one pass per collection, until facet counts have been built.
+    """
+    results = {picker: [] for picker in pickers}
+    if facet_counts_built(db):
+        for row in db[STATS_COLLECTION].aggregate(picker_stats_pipeline(tuple(pickers), limit, prefix)):
+            results[row["picker"]].append({"value": row["value"], "count": row["count"]})
+        return results
+
+    for collection_name in sorted({FACETS[PICKERS[picker]][0] for picker in pickers}):
+        collection_pickers = tuple(picker for picker in pickers if FACETS[PICKERS[picker]][0] == collection_name)
+        for row in db[collection_name].aggregate(picker_live_pipeline(collection_pickers, limit, prefix)):
+            results.update(row)
+    return results
+
+
+def _picker_values(picker: str, limit: int = 10) -> List[str]:
+    return [row["value"] for row in get_pickers((picker,), limit)[picker]]
+
+
+@instrumented
 def get_unique_cities() -> List[str]:
-    collection = db["owner"]
-    pipeline = [
-        {"$group": {"_id": "$address.city"}},
-        {"$project": {"_id": 0, "city": "$_id"}},
-        {"$limit": 10}
-    ]
-    result = collection.aggregate(pipeline)
-    return [doc["city"] for doc in result]
+    return _picker_values("city")
 
 
+@instrumented
 def get_unique_zip_codes() -> List[str]:
-    collection = db["owner"]
-    pipeline = [
-        {"$group": {"_id": "$address.zip"}},
-        {"$project": {"_id": 0, "zip": "$_id"}},
-        {"$limit": 10}
-    ]
-    result = collection.aggregate(pipeline)
-    return [doc["zip"] for doc in result]
+    return _picker_values("zip")
 
 
+@instrumented
 def get_unique_countries() -> List[str]:
-    collection = db["owner"]
-    pipeline = [
-        {"$group": {"_id": "$address.country"}},
-        {"$project": {"_id": 0, "country": "$_id"}},
-        {"$limit": 10}
-    ]
-    result = collection.aggregate(pipeline)
-    return [doc["country"] for doc in result]
+    return _picker_values("country")
 
 
+@instrumented
 def get_owner_emails() -> List[str]:
     collection = db["owner"]
     owners = collection.find({}, {"email": 1}).limit(5)
     return list(set([owner["email"] for owner in owners]))
 
 
-def get_top_5_dogs() -> List[Dict]:
-    collection = db["dog"]
-    dogs = collection.find({}).sort("_id", 1).limit(5)
-    return list(dogs)
+@instrumented
+def list_dogs_page(page_size: int = 5, token: Optional[str] = None,
+                   include_breed_details: bool = False) -> Tuple[List[Dict], Optional[str]]:
+    dogs, token = fetch_page(db["dog"], {}, BY_ID, page_size, token, DOG_PROJECTION)
+    return _dog_results(dogs, include_breed_details), token
+
+
+def iter_dogs(batch_size: int = 1000) -> Iterator[Dict]:
+    return iter_documents(db["dog"], {}, BY_ID, DOG_PROJECTION, batch_size)
+
+
+@instrumented
+def get_top_5_dogs(include_breed_details: bool = False) -> List[Dict]:
+    return list_dogs_page(5, include_breed_details=include_breed_details)[0]
+
+
+@instrumented
+def search_owners_by_city_page(city: str, page_size: int = 10,
+                               token: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    return fetch_page(_reads()["owner"], {"address.city": city}, BY_ID, page_size, token)
+
+
+@instrumented
+def search_owners_by_zip_page(zip_code: str, page_size: int = 10,
+                              token: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    return fetch_page(_reads()["owner"], {"address.zip": zip_code}, BY_ID, page_size, token)
+
+
+@instrumented
+def search_owners_by_country_page(country: str, page_size: int = 10,
+                                  token: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    return fetch_page(_reads()["owner"], {"address.country": country}, BY_ID, page_size, token)
+
+
+def iter_owners_by_city(city: str, batch_size: int = 1000) -> Iterator[Dict]:
+    return iter_documents(db["owner"], {"address.city": city}, BY_ID, batch_size=batch_size)
+
 
+def iter_owners_by_zip(zip_code: str, batch_size: int = 1000) -> Iterator[Dict]:
+    return iter_documents(db["owner"], {"address.zip": zip_code}, BY_ID, batch_size=batch_size)
 
+
+def iter_owners_by_country(country: str, batch_size: int = 1000) -> Iterator[Dict]:
+    return iter_documents(db["owner"], {"address.country": country}, BY_ID, batch_size=batch_size)
+
+
+@instrumented
 def search_owners_by_city(city: str) -> List[Dict]:
-    collection = db["owner"]
-    owners = collection.find({"address.city": city}).limit(10)
-    return list(owners)
+    return search_owners_by_city_page(city)[0]
 
 
+@instrumented
 def search_owners_by_zip(zip_code: str) -> List[Dict]:
-    collection = db["owner"]
-    owners = collection.find({"address.zip": zip_code}).limit(10)
-    return list(owners)
+    return search_owners_by_zip_page(zip_code)[0]
 
 
+@instrumented
 def search_owners_by_country(country: str) -> List[Dict]:
-    collection = db["owner"]
-    owners = collection.find({"address.country": country}).limit(10)
-    return list(owners)
+    return search_owners_by_country_page(country)[0]
 
 
-def count_owners_by_city(city: str) -> int:
-    collection = db["owner"]
-    count = collection.count_documents({"address.city": city})
-    return count
+def _count_by_facet(facet: str, collection_name: str, field: str, value, live: bool) -> int:
+    # Served from the precomputed stats collection unless asked to count live or the counts were never built.
+    if live or not facet_counts_built(db):
+        return db[collection_name].count_documents({field: value})
+    return get_facet_count(db, facet, value)
 
 
-def count_owners_by_zip(zip_code: str) -> int:
-    collection = db["owner"]
-    count = collection.count_documents({"address.zip": zip_code})
-    return count
+@instrumented
+def count_owners_by_city(city: str, live: bool = False) -> int:
+    return _count_by_facet("owner.city", "owner", "address.city", city, live)
 
 
-def count_owners_by_country(country: str) -> int:
-    collection = db["owner"]
-    count = collection.count_documents({"address.country": country})
-    return count
+@instrumented
+def count_owners_by_zip(zip_code: str, live: bool = False) -> int:
+    return _count_by_facet("owner.zip", "owner", "address.zip", zip_code, live)
 
 
-def delete_dog_entry(dog_id: str):
-    dogs_collection = db["dog"]
-    dog_result = dogs_collection.delete_one({"_id": ObjectId(dog_id)})
+@instrumented
+def count_owners_by_country(country: str, live: bool = False) -> int:
+    return _count_by_facet("owner.country", "owner", "address.country", country, live)
 
-    adoption_collection = db["adoption"]
-    adoption_result = adoption_collection.delete_many({"dog_id": ObjectId(dog_id)})
 
-    print(f"Removed {dog_result.deleted_count} dog listing.")
-    print(f"Removed {adoption_result.deleted_count} adoption entries.")
+def _delete_dog_cascade(dog_id: ObjectId, session):
+    counted = counted_adoptions(db, {"dog_id": dog_id}, session)
+    adoptions = db["adoption"].delete_many({"dog_id": dog_id}, session=session).deleted_count
+    deleted_dog = db["dog"].find_one_and_delete({"_id": dog_id}, {"breed.name": 1}, session=session)
+    if deleted_dog:
+        increment_facets(db, {"dog.breed": {deleted_dog["breed"]["name"]: -1}}, session)
+    decrement_rollups(db, counted, session)
+    return deleted_dog, adoptions
 
 
-def count_dogs_by_breed(breed_name):
-    dogs_collection = db['dog']
-    breed_count = dogs_collection.count_documents({"breed.name": breed_name})
-    return breed_count
+@instrumented
+@writer
+def delete_dog_entry(dog_id: str):
+    deleted_dog, adoptions = run_in_transaction(db, lambda session: _delete_dog_cascade(ObjectId(dog_id), session))
+    if deleted_dog:
+        query_cache.invalidate(DOG_BREEDS)
 
+    print(f"Removed {1 if deleted_dog else 0} dog listing.")
+    print(f"Removed {adoptions} adoption entries.")
 
-def search_dogs_by_owner_email(email: str) -> List[Dict]:
-    owner_collection = db["owner"]
-    adoption_collection = db["adoption"]
-    dog_collection = db["dog"]
 
-    owner = owner_collection.find_one({"email": email})
-    if not owner:
+@instrumented
+def count_dogs_by_breed(breed_name, live: bool = False):
+    return _count_by_facet("dog.breed", "dog", "breed.name", breed_name, live)
+
+
+@instrumented
+def search_dogs_by_owner_email(email: str, include_breed_details: bool = False) -> List[Dict]:
+    owner_collection = _reads()["owner"]
+    owners = list(owner_collection.aggregate([
+        {"$match": {"email": email}},
+        {"$limit": 1},
+        {"$lookup": {"from": "adoption", "localField": "_id", "foreignField": "owner_id", "as": "adopted_dogs",
+                     "pipeline": adopted_dogs_stages(10)}}
+    ]))
+    if not owners:
         return None, []
 
-    adopted_dog_ids = adoption_collection.find({"owner_id": owner["_id"]}).limit(10)
-    adopted_dog_ids_list = [doc["dog_id"] for doc in adopted_dog_ids]
+    owner = owners[0]
+    dogs = owner.pop("adopted_dogs")
+    return owner, attach_breed_details(dogs) if include_breed_details else dogs
 
-    dogs = dog_collection.find({"_id": {"$in": adopted_dog_ids_list}})
-    return owner, list(dogs)
 
+@instrumented
+def search_owners(query: str, limit: int = 10) -> List[Dict]:
+    """Owners by name or email, best first: exact and prefix matches, then typo-tolerant matches.
 
+    Prefix matches come from the ``search.name``/``search.email`` indexes; when there are fewer than ``limit``, the
+    rest are filled from the in-process trigram index, re-ranked against the owners as stored now.
+    """
+    key = normalize(query)
+    if not key:
+        return []
+
+    owners = {}
+    for field in KEYS:
+        for owner in db["owner"].find(prefix_filter(field, key)).sort(f"search.{field}", 1).limit(limit):
+            owners.setdefault(owner["_id"], owner)
+    ranked = sorted(owners.values(), key=lambda owner: (key not in owner["search"].values(),
+                                                        -best_similarity(key, owner)))[:limit]
+    if len(ranked) == limit:
+        return ranked
+
+    candidates = [owner_id for owner_id, _ in get_search_index(db).search(key, FUZZY_CANDIDATES)
+                  if owner_id not in owners]
+    # Owners deleted by another process since the index was loaded simply do not come back from this find.
+    fuzzy = list(db["owner"].find({"_id": {"$in": candidates}}))
+    fuzzy.sort(key=lambda owner: -best_similarity(key, owner))
+    return ranked + fuzzy[:limit - len(ranked)]
+
+
+@instrumented
 def find_top_5_unique_breeds():
-    dogs_collection = db["dog"]
-    top_5_breeds = list(dogs_collection.aggregate([
-        {"$group": {"_id": "$breed.name"}},
-        {"$limit": 5}
-    ]))
-    return [breed['_id'] for breed in top_5_breeds]
+    return _picker_values("breed", 5)
 
 
+@instrumented
 def list_top_10_owners():
     top_10_owners = get_top_10_owners()
     print("\nTop 10 Owners")
@@ -198,238 +445,467 @@ def list_top_10_owners():
         print(f"   Address: {owner['address']}")
 
 
-def display_top_10_dogs():
-    dogs_collection = db["dog"]
-    top_10_dogs = dogs_collection.find().limit(10)
+@instrumented
+def display_top_10_dogs(token: Optional[str] = None) -> Optional[str]:
+    top_10_dogs, next_token = list_dogs_page(10, token)
 
     print("\nTop 10 dogs")
     print("----------------")
     for dog in top_10_dogs:
         print(f"ID: {dog['_id']}, Name: {dog['name']}, Breed: {dog['breed']['name']}")
+    return next_token
 
 
-def find_top_5_dogs_not_adopted():
+@instrumented
+def find_top_5_dogs_not_adopted(limit: int = 5, after_dog_id: object = None) -> List[Dict]:
+    # Dogs carry the id of their adoption (or None), so availability is a single indexed range scan.
     dog_collection = db["dog"]
-    adoption_collection = db["adoption"]
+    query = {"adoption_id": None}
+    if after_dog_id is not None:
+        query["_id"] = {"$gt": ObjectId(after_dog_id)}
     dogs_not_adopted = dog_collection.find(
-        {"_id": {"$nin": adoption_collection.distinct("dog_id")}},
+        query,
         {"_id": 1, "name": 1, "breed.name": 1}
-    ).limit(5)
+    ).sort("_id", 1).limit(limit)
     return list(dogs_not_adopted)
 
 
+def _adopt(adoption_data: Dict, session) -> Optional[ObjectId]:
+    adoption_id = db["adoption"].insert_one(adoption_data, session=session).inserted_id
+    # Only a dog that is still available is claimed, so two adopters racing for it cannot both succeed.
+    claimed = db["dog"].update_one({"_id": adoption_data["dog_id"], "adoption_id": None},
+                                   {"$set": {"adoption_id": adoption_id}}, session=session)
+    if claimed.matched_count == 0:
+        # Undone explicitly as well, for deployments where this does not run in a transaction.
+        db["adoption"].delete_one({"_id": adoption_id}, session=session)
+        return None
+    return adoption_id
+
+
+@instrumented
+@writer
 def adopt_new_pet(owner_id: str, dog_id: str):
-    collection = db["adoption"]
     adoption_data = {
         "owner_id": ObjectId(owner_id),
         "dog_id": ObjectId(dog_id),
-        "adoption_date": datetime.utcnow()
+        "adoption_date": utc_now()
     }
-    result = collection.insert_one(adoption_data)
-    return result.inserted_id
+    adoption_id = run_in_transaction(db, lambda session: _adopt(adoption_data, session))
+    if adoption_id is None:
+        raise ValueError(f"Dog {dog_id} does not exist or has already been adopted.")
+    return adoption_id
+
+
+def _bulk_write(collection, requests: List, positions: List[int], result: BulkResult) -> set:
+    """Run ``requests`` unordered and record each failure against its input position. Returns failed positions."""
+    if not requests:
+        return set()
+    try:
+        collection.bulk_write(requests, ordered=False)
+    except BulkWriteError as e:
+        return record_write_errors(e, positions, result)
+    return set()
+
+
+@instrumented
+@writer
+def add_owners(owners: Iterable[Dict], chunk_size: int = BULK_CHUNK_SIZE) -> BulkResult:
+    """``add_owner`` for many owners: one bulk insert and one facet update per chunk. Results are the new ids."""
+    result = BulkResult()
+    for chunk in chunks(owners, chunk_size):
+        offset = len(result.results)
+        for owner in chunk:
+            owner.setdefault("_id", ObjectId())
+            owner["search"] = search_keys(owner)
+        positions = list(range(offset, offset + len(chunk)))
+        failed = _bulk_write(db["owner"], [InsertOne(owner) for owner in chunk], positions, result)
+
+        inserted = [owner for position, owner in zip(positions, chunk) if position not in failed]
+        result.results += [None if position in failed else owner["_id"] for position, owner in zip(positions, chunk)]
+        increment_facets(db, merge_facet_changes(*[owner_facet_changes(owner, 1) for owner in inserted]))
+        index_owners(db, inserted)
+    query_cache.invalidate(OWNER_ADDRESSES, OWNER_LIST)
+    return result
+
+
+def _adopt_chunk(adoptions: Dict[int, Dict], session) -> Dict[int, str]:
+    """Insert ``adoptions`` (by input position) and claim their dogs, as ``_adopt`` does for one.
+
+    Returns an error message for each position whose dog could not be claimed; those adoption rows are removed.
+    """
+    db["adoption"].insert_many(list(adoptions.values()), ordered=False, session=session)
+    db["dog"].bulk_write([UpdateOne({"_id": adoption["dog_id"], "adoption_id": None},
+                                    {"$set": {"adoption_id": adoption["_id"]}}) for adoption in adoptions.values()],
+                         ordered=False, session=session)
+    # A bulk update only reports how many dogs matched, so read back which adoptions now own their dog.
+    claimed = {dog["adoption_id"] for dog in db["dog"].find(
+        {"adoption_id": {"$in": [adoption["_id"] for adoption in adoptions.values()]}}, {"adoption_id": 1},
+        session=session)}
+    unclaimed = [position for position, adoption in adoptions.items() if adoption["_id"] not in claimed]
+    if unclaimed:
+        db["adoption"].delete_many({"_id": {"$in": [adoptions[position]["_id"] for position in unclaimed]}},
+                                   session=session)
+    return {position: f"Dog {adoptions[position]['dog_id']} does not exist or has already been adopted."
+            for position in unclaimed}
+
+
+@instrumented
+@writer
+def adopt_pets(adoptions: Iterable[Tuple[str, str]], chunk_size: int = BULK_CHUNK_SIZE) -> BulkResult:
+    """``adopt_new_pet`` for many (owner_id, dog_id) pairs, one transaction per chunk.
+
+    Results are the new adoption ids; a dog that is missing, already adopted or repeated in the input is an error.
+    """
+    result = BulkResult()
+    for chunk in chunks(adoptions, chunk_size):
+        offset = len(result.results)
+        owner_ids = parse_object_ids([owner_id for owner_id, _ in chunk], offset, result)
+        dog_ids = parse_object_ids([dog_id for _, dog_id in chunk], offset, result)
+        adoption_date = utc_now()
+
+        pending = {}
+        for position, owner_id, dog_id in zip(range(offset, offset + len(chunk)), owner_ids, dog_ids):
+            if position not in result.errors:
+                pending[position] = {"_id": ObjectId(), "owner_id": owner_id, "dog_id": dog_id,
+                                     "adoption_date": adoption_date}
+        if pending:
+            result.errors.update(run_in_transaction(db, lambda session: _adopt_chunk(pending, session)))
+        result.results += [pending[position]["_id"] if position not in result.errors else None
+                           for position in range(offset, offset + len(chunk))]
+    return result
+
+
+@instrumented
+@writer
+def rename_dogs(renames: Iterable[Tuple[str, str]], chunk_size: int = BULK_CHUNK_SIZE) -> BulkResult:
+    """``update_dog_name`` for many (dog_id, new_name) pairs. Results are True for dogs renamed, False on error."""
+    result = BulkResult()
+    for chunk in chunks(renames, chunk_size):
+        offset = len(result.results)
+        dog_ids = parse_object_ids([dog_id for dog_id, _ in chunk], offset, result)
+        existing = set(db["dog"].distinct("_id", {"_id": {"$in": [dog_id for dog_id in dog_ids if dog_id]}}))
+        for position, dog_id in enumerate(dog_ids, offset):
+            if dog_id is not None and dog_id not in existing:
+                result.errors[position] = f"Dog {dog_id} does not exist."
+        positions = [position for position in range(offset, offset + len(chunk)) if position not in result.errors]
+        _bulk_write(db["dog"], [UpdateOne({"_id": dog_ids[position - offset]},
+                                          {"$set": {"name": chunk[position - offset][1]}})
+                                for position in positions], positions, result)
+        result.results += [position not in result.errors for position in range(offset, offset + len(chunk))]
+    return result
+
+
+def _delete_dogs_cascade(dog_ids: List[ObjectId], session) -> Dict[ObjectId, str]:
+    """Delete the dogs among ``dog_ids`` that exist, with their adoption rows. Returns their ids and breed names."""
+    existing = {dog["_id"]: dog["breed"]["name"]
+                for dog in db["dog"].find({"_id": {"$in": dog_ids}}, {"breed.name": 1}, session=session)}
+    if not existing:
+        return existing
+    # Children before parents, as in _delete_owners_cascade.
+    dog_filter = {"$in": list(existing)}
+    counted = counted_adoptions(db, {"dog_id": dog_filter}, session)
+    db["adoption"].delete_many({"dog_id": dog_filter}, session=session)
+    db["dog"].delete_many({"_id": dog_filter}, session=session)
+    breed_counts = defaultdict(int)
+    for breed_name in existing.values():
+        breed_counts[breed_name] -= 1
+    increment_facets(db, {"dog.breed": breed_counts}, session)
+    decrement_rollups(db, counted, session)
+    return existing
+
+
+@instrumented
+@writer
+def delete_dogs(dog_ids: Iterable[str], chunk_size: int = BULK_CHUNK_SIZE) -> BulkResult:
+    """``delete_dog_entry`` for many dogs, removing their adoption rows as well, one transaction per chunk.
+
+    Results are True for dogs that were deleted and False on error: an invalid id, one that matched no dog, or a
+    repeat of an earlier position, whose dog is already gone as it would be for a second single delete.
+    """
+    result = BulkResult()
+    deleted_any = False
+    for chunk in chunks(dog_ids, chunk_size):
+        offset = len(result.results)
+        object_ids = parse_object_ids(chunk, offset, result)
+        valid = list(dict.fromkeys(dog_id for dog_id in object_ids if dog_id))
+        deleted = run_in_transaction(db, lambda session: _delete_dogs_cascade(valid, session)) if valid else {}
+        # Each deleted dog is reported once, at the first position it appears.
+        first_positions = {}
+        for position, dog_id in enumerate(object_ids, offset):
+            if dog_id is None:
+                continue
+            if dog_id not in deleted:
+                result.errors[position] = f"Dog {dog_id} does not exist."
+            elif first_positions.setdefault(dog_id, position) != position:
+                result.errors[position] = f"Dog {dog_id} was already deleted at position {first_positions[dog_id]}."
+        result.results += [position not in result.errors for position in range(offset, offset + len(chunk))]
+        deleted_any = deleted_any or bool(deleted)
+
+    if deleted_any:
+        query_cache.invalidate(DOG_BREEDS)
+    return result
+
+
+def _print_numbered(values: Iterable[str]):
+    for index, value in enumerate(values):
+        print(f"{index + 1}. {value}")
+
+
+def _print_named(documents: List[Dict]):
+    for index, document in enumerate(documents):
+        print(f"{index + 1}. {document['name']} (ID: {document['_id']})")
+
+
+def _print_owners(owners: List[Dict], where: str):
+    if not owners:
+        print(f"No owners found in {where}.")
+        return
+    heading = f"Owners in {where}:"
+    print(f"\n{heading}")
+    print("-" * len(heading))
+    _print_named(owners)
+
+
+def _console_dogs_of_breed(breed_name: str):
+    print("\nTop 5 dogs of breed", breed_name)
+    print("----------------------------")
+    _print_named(find_top_5_dogs_of_breed(breed_name))
+
+
+def _console_dogs_of_owner(owner_id: str):
+    print(f"\nTop 5 dogs adopted by owner ID {owner_id}")
+    print("------------------------------------")
+    _print_named(find_top_5_dogs_by_owner(owner_id))
+
+
+def _console_rename_dog(dog_id: str, new_name: str):
+    print(f"Updated {update_dog_name(dog_id, new_name)} dog's name.")
+
+
+def _console_add_owner(name: str, email: str, mobile: str, street: str, city: str, country: str, zip_code: str):
+    owner = {
+        "name": name,
+        "email": email,
+        "mobile": mobile,
+        "address": {
+            "street": street,
+            "city": city,
+            "country": country,
+            "zip": zip_code
+        }
+    }
+    print(f"Added new owner with ID: {add_owner(owner)}")
+
+
+def _console_show_top_5_dogs():
+    dogs = get_top_5_dogs()
+    if not dogs:
+        print("No dogs found.")
+        return False
+    print("\nTop 5 dogs:")
+    print("-----------")
+    _print_named(dogs)
+
+
+def _console_show_adoptable():
+    print("\nTop 10 owners list:")
+    list_top_10_owners()
+    print("\nTop 5 dogs not adopted:")
+    for index, dog in enumerate(find_top_5_dogs_not_adopted()):
+        print(f"{index + 1}. ID: {dog['_id']} Name: {dog['name']} Breed: {dog['breed']['name']}")
+
+
+def _console_dogs_by_email(email: str):
+    owner, adopted_dogs = search_dogs_by_owner_email(email)
+    if owner:
+        print(f"\nOwner: {owner['name']} (ID: {owner['_id']}) Email: {owner['email']}")
+        if adopted_dogs:
+            print("\nAdopted pets:")
+            for index, dog in enumerate(adopted_dogs):
+                print(f"{index + 1}. Name: {dog['name']} (ID: {dog['_id']}) Breed: {dog['breed']['name']}")
+        else:
+            print("\nNo pets are adopted by this owner yet.")
+    else:
+        print("No owner found with the given email address.")
+        suggestions = search_owners(email, 5)
+        if suggestions:
+            print("Did you mean:")
+            for suggestion in suggestions:
+                print(f"  {suggestion['email']} ({suggestion['name']})")
+
+
+def _console_search_owners(query: str):
+    owners = search_owners(query)
+    if not owners:
+        print(f"No owners match {query!r}.")
+    for index, owner in enumerate(owners):
+        print(f"{index + 1}. {owner['name']} <{owner['email']}> (ID: {owner['_id']})")
+
+
+@dataclass
+class ConsoleOperation:
+    """A console menu entry: the action run on the answers to ``prompts``, and the listing shown before them.
+
+    ``show`` returns False when there is nothing to pick from, in which case the console doesn't prompt.
+    """
+    name: str
+    label: str
+    prompts: Tuple[str, ...]
+    run: Callable[..., None]
+    show: Optional[Callable[[], Optional[bool]]] = None
+
+
+# Menu number -> operation. Scripts and the load generator (benchmarks/load.py) name operations by number or name.
+CONSOLE_OPERATIONS: Dict[int, ConsoleOperation] = dict(enumerate([
+    ConsoleOperation("dogs-of-breed", "Find top 5 dogs of a specific breed", ("Enter the dog breed name: ",),
+                     _console_dogs_of_breed,
+                     lambda: print(f"Top 5 unique dog breeds: {', '.join(find_top_5_unique_breeds())}")),
+    ConsoleOperation("dogs-of-owner", "Find top 5 dogs adopted by a specific owner", ("Enter the owner ID: ",),
+                     _console_dogs_of_owner, list_top_10_owners),
+    ConsoleOperation("rename-dog", "Update Dog name by id", ("Enter the dog ID: ", "Enter the new name: "),
+                     _console_rename_dog, display_top_10_dogs),
+    ConsoleOperation("add-owner", "Add a new owner",
+                     ("Enter the owner's name: ", "Enter the owner's email: ", "Enter the owner's mobile number: ",
+                      "Enter the owner's street address: ", "Enter the owner's city: ", "Enter the owner's country: ",
+                      "Enter the owner's zip code: "), _console_add_owner),
+    ConsoleOperation("delete-owner", "Delete owner", ("Enter the owner ID: ",), delete_owner, list_top_10_owners),
+    ConsoleOperation("owners-in-city", "Search owners by city", ("Enter the city to search for owners: ",),
+                     lambda city: _print_owners(search_owners_by_city(city), city),
+                     lambda: _print_numbered(get_unique_cities())),
+    ConsoleOperation("owners-in-zip", "Search owners by zip", ("Enter the zip code to search for owners: ",),
+                     lambda zip_code: _print_owners(search_owners_by_zip(zip_code), f"zip code {zip_code}"),
+                     lambda: _print_numbered(get_unique_zip_codes())),
+    ConsoleOperation("owners-in-country", "Search owners by country", ("Enter the country to search for owners: ",),
+                     lambda country: _print_owners(search_owners_by_country(country), country),
+                     lambda: _print_numbered(get_unique_countries())),
+    ConsoleOperation("count-city", "Search for the number of owners in a city", ("Enter the city to count owners: ",),
+                     lambda city: print(f"There are {count_owners_by_city(city)} owners in {city}."),
+                     lambda: _print_numbered(get_unique_cities())),
+    ConsoleOperation("count-zip", "Search for the number of owners in a zip",
+                     ("Enter the zip code to count owners: ",),
+                     lambda zip_code: print(f"There are {count_owners_by_zip(zip_code)} owners in zip code "
+                                            f"{zip_code}."),
+                     lambda: _print_numbered(get_unique_zip_codes())),
+    ConsoleOperation("count-country", "Search for the number of owners in a country",
+                     ("Enter the country to count owners: ",),
+                     lambda country: print(f"There are {count_owners_by_country(country)} owners in {country}."),
+                     lambda: _print_numbered(get_unique_countries())),
+    ConsoleOperation("delete-dog", "Delete a dog's listing", ("Enter the dog ID to remove: ",),
+                     lambda dog_id: delete_dog_entry(ObjectId(dog_id)), _console_show_top_5_dogs),
+    ConsoleOperation("count-breed", "Search for the count of specific dog breeds listed for adoption",
+                     ("Enter the dog breed to count: ",),
+                     lambda breed_name: print(f"There are {count_dogs_by_breed(breed_name)} {breed_name} dogs listed "
+                                              f"for adoption."),
+                     lambda: _print_numbered(find_top_5_unique_breeds())),
+    ConsoleOperation("adopt", "Adopt a new pet", ("\nEnter the owner ID: ", "Enter the dog ID: "),
+                     lambda owner_id, dog_id: print(f"Adoption entry created with ID: "
+                                                    f"{adopt_new_pet(owner_id, dog_id)}"),
+                     _console_show_adoptable),
+    ConsoleOperation("dogs-by-email", "Search for pets by owner's email address",
+                     ("\nEnter the owner's email address: ",), _console_dogs_by_email,
+                     lambda: print("Top 5 owner emails:\n" + "\n".join(get_owner_emails()))),
+    ConsoleOperation("top-owners", "Display top 10 owners", (), list_top_10_owners),
+    ConsoleOperation("search-owners", "Search owners by name or email",
+                     ("Enter part of the owner's name or email: ",), _console_search_owners),
+], start=1))
+
+
+def console_operation(key: str) -> ConsoleOperation:
+    """The operation with menu number or name ``key``."""
+    if key.isdigit() and int(key) in CONSOLE_OPERATIONS:
+        return CONSOLE_OPERATIONS[int(key)]
+    for operation in CONSOLE_OPERATIONS.values():
+        if operation.name == key:
+            return operation
+    raise ValueError(f"Unknown operation {key!r}; expected 1-{len(CONSOLE_OPERATIONS)} or one of "
+                     f"{', '.join(operation.name for operation in CONSOLE_OPERATIONS.values())}.")
+
+
+def console_call(key: str, arguments: List[str]) -> ConsoleOperation:
+    """The operation ``key``, checking ``arguments`` answers each of its prompts."""
+    operation = console_operation(key)
+    if len(arguments) != len(operation.prompts):
+        raise ValueError(f"{operation.name} takes {len(operation.prompts)} argument(s), got {len(arguments)}.")
+    return operation
+
+
+def run_console_operation(key: str, arguments: List[str], listings: bool = False):
+    """Run an operation on ``arguments`` (its answers to the prompts), optionally printing its listing first."""
+    operation = console_call(key, arguments)
+    if listings and operation.show is not None:
+        operation.show()
+    operation.run(*arguments)
+
+
+def parse_console_script(lines: Iterable[str]) -> Iterator[Tuple[int, str, List[str]]]:
+    """``(line number, operation, arguments)`` per line of ``<number or name> <argument> ...``, quoted like a shell.
+
+    Blank lines and lines starting with # are skipped.
+    """
+    for number, line in enumerate(lines, 1):
+        words = shlex.split(line, comments=True)
+        if words:
+            yield number, words[0], words[1:]
+
+
+def run_console_script(lines: Iterable[str], listings: bool = False, stop_on_error: bool = False) -> int:
+    """Run every operation in a console script, echoing each line. Returns the number of lines that failed."""
+    errors = 0
+    for number, key, arguments in parse_console_script(lines):
+        print(f"\n> {shlex.join([key] + arguments)}")
+        try:
+            run_console_operation(key, arguments, listings)
+        except Exception as e:
+            errors += 1
+            print(f"Line {number}: {type(e).__name__}: {e}")
+            if stop_on_error:
+                break
+    return errors
 
 
-if __name__ == "__main__":
+def run_console():
     while True:
 
         try:
             print("\nPet Adoption Console Application")
             print("--------------------------------")
             print("Choose an option:")
-            print("1. Find top 5 dogs of a specific breed")
-            print("2. Find top 5 dogs adopted by a specific owner")
-            print("3. Update Dog name by id")
-            print("4. Add a new owner")
-            print("5. Delete owner")
-            print("6. Search owners by city")
-            print("7. Search owners by zip")
-            print("8. Search owners by country")
-            print("9. Search for the number of owners in a city")
-            print("10. Search for the number of owners in a zip")
-            print("11. Search for the number of owners in a country")
-            print("12. Delete a dog's listing")
-            print("13. Search for the count of specific dog breeds listed for adoption")
-            print("14. Adopt a new pet")
-            print("15. Search for pets by owner's email address")
-            print("16. Display top 10 owners")
+            for choice, operation in CONSOLE_OPERATIONS.items():
+                print(f"{choice}. {operation.label}")
 
             print("Any other. Exit")
 
-            choice = int(input("Enter your choice (1-16): "))
-
-            if choice == 1:
-                top_5_breeds = find_top_5_unique_breeds()
-                print(f"Top 5 unique dog breeds: {', '.join(top_5_breeds)}")
-                breed_name = input("Enter the dog breed name: ")
-                top_5_dogs = find_top_5_dogs_of_breed(breed_name)
-                print("\nTop 5 dogs of breed", breed_name)
-                print("----------------------------")
-                for index, dog in enumerate(top_5_dogs):
-                    print(f"{index + 1}. {dog['name']} (ID: {dog['_id']})")
-            elif choice == 2:
-                list_top_10_owners()
-                owner_id = input("Enter the owner ID: ")
-                top_5_dogs = find_top_5_dogs_by_owner(owner_id)
-                print(f"\nTop 5 dogs adopted by owner ID {owner_id}")
-                print("------------------------------------")
-                for index, dog in enumerate(top_5_dogs):
-                    print(f"{index + 1}. {dog['name']} (ID: {dog['_id']})")
-            elif choice == 3:
-                display_top_10_dogs()
-                dog_id = input("Enter the dog ID: ")
-                new_name = input("Enter the new name: ")
-                modified_count = update_dog_name(dog_id, new_name)
-                print(f"Updated {modified_count} dog's name.")
-            elif choice == 4:
-                name = input("Enter the owner's name: ")
-                email = input("Enter the owner's email: ")
-                mobile = input("Enter the owner's mobile number: ")
-                street = input("Enter the owner's street address: ")
-                city = input("Enter the owner's city: ")
-                country = input("Enter the owner's country: ")
-                zip_code = input("Enter the owner's zip code: ")
-
-                owner = {
-                    "name": name,
-                    "email": email,
-                    "mobile": mobile,
-                    "address": {
-                        "street": street,
-                        "city": city,
-                        "country": country,
-                        "zip": zip_code
-                    }
-                }
-                owner_id = add_owner(owner)
-                print(f"Added new owner with ID: {owner_id}")
-            elif choice == 5:
-                list_top_10_owners()
-                owner_id = input("Enter the owner ID: ")
-                delete_owner(owner_id)
-            elif choice == 6:
-                cities = get_unique_cities()
-                for index, city in enumerate(cities):
-                    print(f"{index + 1}. {city}")
-                city = input("Enter the city to search for owners: ")
-                owners = search_owners_by_city(city)
-                if not owners:
-                    print(f"No owners found in {city}.")
-                else:
-                    print(f"\nOwners in {city}:")
-                    print("-----------------")
-                    for index, owner in enumerate(owners):
-                        print(f"{index + 1}. {owner['name']} (ID: {owner['_id']})")
-
-            elif choice == 7:
-                zips = get_unique_zip_codes()
-                for index, zip_code in enumerate(zips):
-                    print(f"{index + 1}. {zip_code}")
-                zip_code = input("Enter the zip code to search for owners: ")
-                owners = search_owners_by_zip(zip_code)
-                if not owners:
-                    print(f"No owners found in zip code {zip_code}.")
-                else:
-                    print(f"\nOwners in zip code {zip_code}:")
-                    print("--------------------------")
-                    for index, owner in enumerate(owners):
-                        print(f"{index + 1}. {owner['name']} (ID: {owner['_id']})")
-
-            elif choice == 8:
-                countries = get_unique_countries()
-                for index, country in enumerate(countries):
-                    print(f"{index + 1}. {country}")
-                country = input("Enter the country to search for owners: ")
-                owners = search_owners_by_country(country)
-                if not owners:
-                    print(f"No owners found in {country}.")
-                else:
-                    print(f"\nOwners in {country}:")
-                    print("-------------------")
-                    for index, owner in enumerate(owners):
-                        print(f"{index + 1}. {owner['name']} (ID: {owner['_id']})")
-
-            elif choice == 9:
-                cities = get_unique_cities()
-                for index, city in enumerate(cities):
-                    print(f"{index + 1}. {city}")
-                city = input("Enter the city to count owners: ")
-                count = count_owners_by_city(city)
-                print(f"There are {count} owners in {city}.")
-
-            elif choice == 10:
-                zips = get_unique_zip_codes()
-                for index, zip_code in enumerate(zips):
-                    print(f"{index + 1}. {zip_code}")
-                zip_code = input("Enter the zip code to count owners: ")
-                count = count_owners_by_zip(zip_code)
-                print(f"There are {count} owners in zip code {zip_code}.")
-
-            elif choice == 11:
-                countries = get_unique_countries()
-                for index, country in enumerate(countries):
-                    print(f"{index + 1}. {country}")
-                country = input("Enter the country to count owners: ")
-                count = count_owners_by_country(country)
-                print(f"There are {count} owners in {country}.")
-
-            elif choice == 12:
-                dogs = get_top_5_dogs()
-                if not dogs:
-                    print("No dogs found.")
-                else:
-                    print("\nTop 5 dogs:")
-                    print("-----------")
-                    for index, dog in enumerate(dogs):
-                        print(f"{index + 1}. {dog['name']} (ID: {dog['_id']})")
-
-                    dog_id = input("Enter the dog ID to remove: ")
-                    try:
-                        delete_dog_entry(ObjectId(dog_id))
-                    except Exception as e:
-                        print("Error:", e)
-            elif choice == 13:
-                breeds = find_top_5_unique_breeds()
-                for index, breed in enumerate(breeds):
-                    print(f"{index + 1}. {breed}")
-                breed_name = input("Enter the dog breed to count: ")
-                count = count_dogs_by_breed(breed_name)
-                print(f"There are {count} {breed_name} dogs listed for adoption.")
-            # print("14. Adopt a new pet")
-            # print("15. Search for pets by owner's email address")
-            elif choice == 14:
-                print("\nTop 10 owners list:")
-                list_top_10_owners()
-                print("\nTop 5 dogs not adopted:")
-                dogs = find_top_5_dogs_not_adopted()
-                for index, dog in enumerate(dogs):
-                    print(f"{index + 1}. ID: {dog['_id']} Name: {dog['name']} Breed: {dog['breed']['name']}")
-
-                owner_id = input("\nEnter the owner ID: ")
-                dog_id = input("Enter the dog ID: ")
-
-                adoption_id = adopt_new_pet(owner_id, dog_id)
-                print(f"Adoption entry created with ID: {adoption_id}")
-
-            elif choice == 15:
-                top_5_emails = get_owner_emails()
-                print("Top 5 owner emails:\n" + '\n'.join(top_5_emails))
-                email = input("\nEnter the owner's email address: ")
-                owner, adopted_dogs = search_dogs_by_owner_email(email)
-
-                if owner:
-                    print(f"\nOwner: {owner['name']} (ID: {owner['_id']}) Email: {owner['email']}")
-                    if adopted_dogs:
-                        print("\nAdopted pets:")
-                        for index, dog in enumerate(adopted_dogs):
-                            print(f"{index + 1}. Name: {dog['name']} (ID: {dog['_id']}) Breed: {dog['breed']['name']}")
-                    else:
-                        print("\nNo pets are adopted by this owner yet.")
-                else:
-                    print("No owner found with the given email address.")
-
-            elif choice == 16:
-                list_top_10_owners()
-            else:
+            choice = int(input(f"Enter your choice (1-{len(CONSOLE_OPERATIONS)}): "))
+            operation = CONSOLE_OPERATIONS.get(choice)
+            if operation is None:
                 print("Invalid choice. Please try again.")
+            elif operation.show is None or operation.show() is not False:
+                operation.run(*[input(prompt) for prompt in operation.prompts])
         except Exception as e:
-            print(e)
+            print(f"{type(e).__name__}: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pet adoption console. Interactive unless --script is given.")
+    parser.add_argument("--script", type=argparse.FileType("r", encoding="utf-8"),
+                        help="Run the operations in this file (- for stdin), one per line: <number or name> <args>.")
+    parser.add_argument("--listings", action="store_true",
+                        help="With --script, also run the listing each menu entry shows before prompting.")
+    parser.add_argument("--stop-on-error", action="store_true", help="With --script, stop at the first failed line.")
+    args = parser.parse_args()
+
+    ensure_indexes(db, wait=False)
+    if instrumentation.ENABLED and os.environ.get("PET_ADOPTION_METRICS_PORT"):
+        instrumentation.start_metrics_server(int(os.environ["PET_ADOPTION_METRICS_PORT"]))
+
+    if read_replica.enabled():
+        read_replica.start_replica(db)
+
+    try:
+        if args.script:
+            with args.script:
+                failed = run_console_script(args.script, args.listings, args.stop_on_error)
+            raise SystemExit(1 if failed else 0)
+        run_console()
+    finally:
+        read_replica.stop_replica()
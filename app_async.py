@@ -0,0 +1,558 @@
+"""Coroutine versions of the app.py queries for use inside an asyncio service.
+
+Every public function mirrors its app.py counterpart and returns the same shape, including the transactional
+cascading deletes. Needs pymongo 4.10 or later for ``AsyncMongoClient``.
+"""
+import asyncio
+from collections import defaultdict
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from adoption_analytics import ROLLUP_COLLECTION, STATE_ID, counted_pipeline, decrement_requests, utc_now
+from app import BULK_CHUNK_SIZE, BY_ID, BY_NAME, CASCADE_CHUNK_SIZE, DOG_BREEDS, DOG_PROJECTION, FUZZY_CANDIDATES, \
+    OWNER_ADDRESSES, OWNER_LIST, OWNERS_PER_TRANSACTION, PICKERS, adopted_dogs_stages, picker_live_pipeline, \
+    picker_stats_pipeline
+from bulk import BulkResult, chunks, parse_object_ids, record_write_errors
+from connection import LazyDatabase, get_async_db, get_db, run_in_transaction_async
+from facet_counts import BUILT_MARKER, FACETS, STATS_COLLECTION, built_databases, facet_key, increment_requests, \
+    merge_facet_changes, owner_facet_changes
+from owner_search import KEYS, best_similarity, get_search_index, index_owners, normalize, prefix_filter, search_keys, \
+    unindex_owners
+from pagination import Sort, page_limit, page_query, page_result
+from query_cache import async_cached, query_cache
+
+db = LazyDatabase(get_async_db)
+
+
+async def _increment_facets(changes: Dict[str, Dict[object, int]], session=None):
+    requests = increment_requests(changes)
+    if requests and await _facet_counts_built():
+        await db[STATS_COLLECTION].bulk_write(requests, ordered=False, session=session)
+
+
+async def _counted_adoptions(adoption_filter: Dict, session=None) -> List[Dict]:
+    state = await db[ROLLUP_COLLECTION].find_one({"_id": STATE_ID}, session=session)
+    if state is None:
+        return []
+    cursor = await db["adoption"].aggregate(counted_pipeline(adoption_filter, state["through"]), session=session)
+    return await cursor.to_list(None)
+
+
+async def _decrement_rollups(counted: List[Dict], session=None):
+    requests = decrement_requests(counted)
+    if requests:
+        await db[ROLLUP_COLLECTION].bulk_write(requests, ordered=False, session=session)
+
+
+async def _fetch_page(collection, query: Dict, sort: Sort, page_size: int, token: Optional[str],
+                      projection: Optional[Dict] = None) -> Tuple[List[Dict], Optional[str]]:
+    page_size = page_limit(page_size)
+    cursor = collection.find(page_query(query, sort, token), projection).sort(list(sort)).limit(page_size + 1)
+    return page_result(await cursor.to_list(None), sort, page_size)
+
+
+async def _iter_documents(collection, query: Dict, sort: Sort, projection: Optional[Dict] = None,
+                          batch_size: int = 1000) -> AsyncIterator[Dict]:
+    token = None
+    while True:
+        documents, token = await _fetch_page(collection, query, sort, batch_size, token, projection)
+        for document in documents:
+            yield document
+        if token is None:
+            return
+
+
+async def attach_breed_details(dogs: List[Dict]) -> List[Dict]:
+    breed_ids = list({dog["breed"]["_id"] for dog in dogs if "_id" in dog.get("breed", {})})
+    breeds = {breed["_id"]: breed async for breed in db["breed"].find({"_id": {"$in": breed_ids}})}
+    for dog in dogs:
+        breed_id = dog.get("breed", {}).get("_id")
+        if breed_id in breeds:
+            dog["breed"] = breeds[breed_id]
+    return dogs
+
+
+async def _dog_results(cursor, include_breed_details: bool) -> List[Dict]:
+    dogs = await cursor.to_list(None)
+    return await attach_breed_details(dogs) if include_breed_details else dogs
+
+
+async def find_dogs_of_breed_page(breed_name: str, page_size: int = 5, token: Optional[str] = None,
+                                  include_breed_details: bool = False) -> Tuple[List[Dict], Optional[str]]:
+    dogs, token = await _fetch_page(db["dog"], {"breed.name": breed_name}, BY_NAME, page_size, token, DOG_PROJECTION)
+    return await attach_breed_details(dogs) if include_breed_details else dogs, token
+
+
+def iter_dogs_of_breed(breed_name: str, batch_size: int = 1000) -> AsyncIterator[Dict]:
+    return _iter_documents(db["dog"], {"breed.name": breed_name}, BY_NAME, DOG_PROJECTION, batch_size)
+
+
+async def find_top_5_dogs_of_breed(breed_name: str, include_breed_details: bool = False) -> List[Dict]:
+    return (await find_dogs_of_breed_page(breed_name, 5, include_breed_details=include_breed_details))[0]
+
+
+async def find_top_5_dogs_by_owner(owner_id: str, include_breed_details: bool = False) -> List[Dict]:
+    dogs = await db["adoption"].aggregate(
+        [{"$match": {"owner_id": ObjectId(owner_id)}}] + adopted_dogs_stages(5) + [{"$sort": {"name": 1}}]
+    )
+    return await _dog_results(dogs, include_breed_details)
+
+
+async def list_owners_page(page_size: int = 10, token: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    return await _fetch_page(db["owner"], {}, BY_ID, page_size, token)
+
+
+def iter_owners(batch_size: int = 1000) -> AsyncIterator[Dict]:
+    return _iter_documents(db["owner"], {}, BY_ID, batch_size=batch_size)
+
+
+@async_cached(ttl=60, tags=[OWNER_LIST])
+async def get_top_10_owners():
+    return (await list_owners_page(10))[0]
+
+
+async def update_dog_name(dog_id: object, new_name: str):
+    collection = db["dog"]
+    result = await collection.update_one({"_id": ObjectId(dog_id)}, {"$set": {"name": new_name}})
+    return result.modified_count
+
+
+async def add_owner(owner: Dict):
+    collection = db["owner"]
+    owner["search"] = search_keys(owner)
+    result = await collection.insert_one(owner)
+    await _increment_facets(owner_facet_changes(owner, 1))
+    index_owners(db, [owner])
+    query_cache.invalidate(OWNER_ADDRESSES, OWNER_LIST)
+    return result.inserted_id
+
+
+async def _delete_owners_cascade(owner_ids: List[ObjectId], chunk_size: int, session) -> Dict[str, int]:
+    # Same order as app.py: dogs, then adoption rows, then the owners.
+    adoption_filter = {"owner_id": {"$in": owner_ids}}
+    counted = await _counted_adoptions(adoption_filter, session)
+    adopted = db["adoption"].find(adoption_filter, {"dog_id": 1}, session=session).batch_size(chunk_size)
+    breed_counts = defaultdict(int)
+    dogs = 0
+    dog_ids = []
+    async for adoption in adopted:
+        dog_ids.append(adoption["dog_id"])
+        if len(dog_ids) == chunk_size:
+            dogs += await _delete_dogs_chunk(dog_ids, breed_counts, session)
+            dog_ids = []
+    if dog_ids:
+        dogs += await _delete_dogs_chunk(dog_ids, breed_counts, session)
+    adoptions = (await db["adoption"].delete_many(adoption_filter, session=session)).deleted_count
+
+    owners = await db["owner"].find({"_id": {"$in": owner_ids}}, {"address": 1}, session=session).to_list(None)
+    await db["owner"].delete_many({"_id": {"$in": owner_ids}}, session=session)
+    await _increment_facets(merge_facet_changes({"dog.breed": breed_counts},
+                                                *[owner_facet_changes(owner, -1) for owner in owners]), session)
+    await _decrement_rollups(counted, session)
+    return {"owners": len(owners), "dogs": dogs, "adoptions": adoptions}
+
+
+async def _delete_dogs_chunk(dog_ids: List[ObjectId], breed_counts: Dict[str, int], session) -> int:
+    async for dog in db["dog"].find({"_id": {"$in": dog_ids}}, {"breed.name": 1}, session=session):
+        breed_counts[dog["breed"]["name"]] -= 1
+    return (await db["dog"].delete_many({"_id": {"$in": dog_ids}}, session=session)).deleted_count
+
+
+async def delete_owners(owner_ids: Iterable[object], chunk_size: int = CASCADE_CHUNK_SIZE) -> Dict[str, int]:
+    totals = {"owners": 0, "dogs": 0, "adoptions": 0}
+    owner_ids = [ObjectId(owner_id) for owner_id in owner_ids]
+    for start in range(0, len(owner_ids), OWNERS_PER_TRANSACTION):
+        chunk = owner_ids[start:start + OWNERS_PER_TRANSACTION]
+
+        async def cascade(session):
+            return await _delete_owners_cascade(chunk, chunk_size, session)
+
+        deleted = await run_in_transaction_async(db, cascade)
+        unindex_owners(db, chunk)
+        for name, count in deleted.items():
+            totals[name] += count
+
+    if totals["owners"]:
+        query_cache.invalidate(OWNER_ADDRESSES, OWNER_LIST)
+    if totals["dogs"]:
+        query_cache.invalidate(DOG_BREEDS)
+    return totals
+
+
+async def delete_owner(owner_id: object):
+    deleted = await delete_owners([owner_id])
+    print(f"Deleted {deleted['owners']} owner(s).")
+    print(f"Deleted {deleted['dogs']} dog(s) associated with the owner.")
+    print(f"Deleted {deleted['adoptions']} adoption entry/entries associated with the owner.")
+
+
+@async_cached(ttl=300, tags=[OWNER_ADDRESSES, DOG_BREEDS])
+async def get_pickers(pickers: Tuple[str, ...] = tuple(PICKERS), limit: int = 10,
+                      prefix: str = "") -> Dict[str, List[Dict]]:
+    results = {picker: [] for picker in pickers}
+    if await _facet_counts_built():
+        rows = await db[STATS_COLLECTION].aggregate(picker_stats_pipeline(tuple(pickers), limit, prefix))
+        async for row in rows:
+            results[row["picker"]].append({"value": row["value"], "count": row["count"]})
+        return results
+
+    for collection_name in sorted({FACETS[PICKERS[picker]][0] for picker in pickers}):
+        collection_pickers = tuple(picker for picker in pickers if FACETS[PICKERS[picker]][0] == collection_name)
+        rows = await db[collection_name].aggregate(picker_live_pipeline(collection_pickers, limit, prefix))
+        async for row in rows:
+            results.update(row)
+    return results
+
+
+async def _picker_values(picker: str, limit: int = 10) -> List[str]:
+    return [row["value"] for row in (await get_pickers((picker,), limit))[picker]]
+
+
+async def get_unique_cities() -> List[str]:
+    return await _picker_values("city")
+
+
+async def get_unique_zip_codes() -> List[str]:
+    return await _picker_values("zip")
+
+
+async def get_unique_countries() -> List[str]:
+    return await _picker_values("country")
+
+
+async def get_owner_emails() -> List[str]:
+    collection = db["owner"]
+    owners = collection.find({}, {"email": 1}).limit(5)
+    return list(set([owner["email"] async for owner in owners]))
+
+
+async def list_dogs_page(page_size: int = 5, token: Optional[str] = None,
+                         include_breed_details: bool = False) -> Tuple[List[Dict], Optional[str]]:
+    dogs, token = await _fetch_page(db["dog"], {}, BY_ID, page_size, token, DOG_PROJECTION)
+    return await attach_breed_details(dogs) if include_breed_details else dogs, token
+
+
+def iter_dogs(batch_size: int = 1000) -> AsyncIterator[Dict]:
+    return _iter_documents(db["dog"], {}, BY_ID, DOG_PROJECTION, batch_size)
+
+
+async def get_top_5_dogs(include_breed_details: bool = False) -> List[Dict]:
+    return (await list_dogs_page(5, include_breed_details=include_breed_details))[0]
+
+
+async def search_owners_by_city_page(city: str, page_size: int = 10,
+                                     token: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    return await _fetch_page(db["owner"], {"address.city": city}, BY_ID, page_size, token)
+
+
+async def search_owners_by_zip_page(zip_code: str, page_size: int = 10,
+                                    token: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    return await _fetch_page(db["owner"], {"address.zip": zip_code}, BY_ID, page_size, token)
+
+
+async def search_owners_by_country_page(country: str, page_size: int = 10,
+                                        token: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    return await _fetch_page(db["owner"], {"address.country": country}, BY_ID, page_size, token)
+
+
+def iter_owners_by_city(city: str, batch_size: int = 1000) -> AsyncIterator[Dict]:
+    return _iter_documents(db["owner"], {"address.city": city}, BY_ID, batch_size=batch_size)
+
+
+def iter_owners_by_zip(zip_code: str, batch_size: int = 1000) -> AsyncIterator[Dict]:
+    return _iter_documents(db["owner"], {"address.zip": zip_code}, BY_ID, batch_size=batch_size)
+
+
+def iter_owners_by_country(country: str, batch_size: int = 1000) -> AsyncIterator[Dict]:
+    return _iter_documents(db["owner"], {"address.country": country}, BY_ID, batch_size=batch_size)
+
+
+async def search_owners_by_city(city: str) -> List[Dict]:
+    return (await search_owners_by_city_page(city))[0]
+
+
+async def search_owners_by_zip(zip_code: str) -> List[Dict]:
+    return (await search_owners_by_zip_page(zip_code))[0]
+
+
+async def search_owners_by_country(country: str) -> List[Dict]:
+    return (await search_owners_by_country_page(country))[0]
+
+
+async def _facet_counts_built() -> bool:
+    if db.name not in built_databases:
+        if await db[STATS_COLLECTION].find_one({"_id": BUILT_MARKER}, {"_id": 1}) is None:
+            return False
+        built_databases.add(db.name)
+    return True
+
+
+async def _count_by_facet(facet: str, collection_name: str, field: str, value, live: bool) -> int:
+    if live or not await _facet_counts_built():
+        return await db[collection_name].count_documents({field: value})
+    stats = await db[STATS_COLLECTION].find_one({"_id": facet_key(facet, value)}, {"count": 1})
+    return stats["count"] if stats else 0
+
+
+async def count_owners_by_city(city: str, live: bool = False) -> int:
+    return await _count_by_facet("owner.city", "owner", "address.city", city, live)
+
+
+async def count_owners_by_zip(zip_code: str, live: bool = False) -> int:
+    return await _count_by_facet("owner.zip", "owner", "address.zip", zip_code, live)
+
+
+async def count_owners_by_country(country: str, live: bool = False) -> int:
+    return await _count_by_facet("owner.country", "owner", "address.country", country, live)
+
+
+async def delete_dog_entry(dog_id: str):
+    async def cascade(session):
+        counted = await _counted_adoptions({"dog_id": ObjectId(dog_id)}, session)
+        adoptions = (await db["adoption"].delete_many({"dog_id": ObjectId(dog_id)}, session=session)).deleted_count
+        deleted = await db["dog"].find_one_and_delete({"_id": ObjectId(dog_id)}, {"breed.name": 1}, session=session)
+        if deleted:
+            await _increment_facets({"dog.breed": {deleted["breed"]["name"]: -1}}, session)
+        await _decrement_rollups(counted, session)
+        return deleted, adoptions
+
+    deleted_dog, adoptions = await run_in_transaction_async(db, cascade)
+    if deleted_dog:
+        query_cache.invalidate(DOG_BREEDS)
+
+    print(f"Removed {1 if deleted_dog else 0} dog listing.")
+    print(f"Removed {adoptions} adoption entries.")
+
+
+async def count_dogs_by_breed(breed_name, live: bool = False):
+    return await _count_by_facet("dog.breed", "dog", "breed.name", breed_name, live)
+
+
+async def search_dogs_by_owner_email(email: str, include_breed_details: bool = False) -> List[Dict]:
+    cursor = await db["owner"].aggregate([
+        {"$match": {"email": email}},
+        {"$limit": 1},
+        {"$lookup": {"from": "adoption", "localField": "_id", "foreignField": "owner_id", "as": "adopted_dogs",
+                     "pipeline": adopted_dogs_stages(10)}}
+    ])
+    owners = await cursor.to_list(None)
+    if not owners:
+        return None, []
+
+    owner = owners[0]
+    dogs = owner.pop("adopted_dogs")
+    return owner, await attach_breed_details(dogs) if include_breed_details else dogs
+
+
+async def search_owners(query: str, limit: int = 10) -> List[Dict]:
+    key = normalize(query)
+    if not key:
+        return []
+
+    owners = {}
+    for field in KEYS:
+        async for owner in db["owner"].find(prefix_filter(field, key)).sort(f"search.{field}", 1).limit(limit):
+            owners.setdefault(owner["_id"], owner)
+    ranked = sorted(owners.values(), key=lambda owner: (key not in owner["search"].values(),
+                                                        -best_similarity(key, owner)))[:limit]
+    if len(ranked) == limit:
+        return ranked
+
+    # The trigram index is shared with app.py, keyed by database name; loading or building it blocks, so it runs in
+    # a thread over the synchronous client.
+    index = await asyncio.to_thread(get_search_index, get_db())
+    candidates = [owner_id for owner_id, _ in index.search(key, FUZZY_CANDIDATES) if owner_id not in owners]
+    fuzzy = await db["owner"].find({"_id": {"$in": candidates}}).to_list(None)
+    fuzzy.sort(key=lambda owner: -best_similarity(key, owner))
+    return ranked + fuzzy[:limit - len(ranked)]
+
+
+async def find_top_5_unique_breeds():
+    return await _picker_values("breed", 5)
+
+
+async def list_top_10_owners():
+    top_10_owners = await get_top_10_owners()
+    print("\nTop 10 Owners")
+    print("-------------")
+    for index, owner in enumerate(top_10_owners):
+        print(f"{index + 1}. {owner['name']} (ID: {owner['_id']})")
+        print(f"   Address: {owner['address']}")
+
+
+async def display_top_10_dogs(token: Optional[str] = None) -> Optional[str]:
+    top_10_dogs, next_token = await list_dogs_page(10, token)
+
+    print("\nTop 10 dogs")
+    print("----------------")
+    for dog in top_10_dogs:
+        print(f"ID: {dog['_id']}, Name: {dog['name']}, Breed: {dog['breed']['name']}")
+    return next_token
+
+
+async def find_top_5_dogs_not_adopted(limit: int = 5, after_dog_id: object = None) -> List[Dict]:
+    query = {"adoption_id": None}
+    if after_dog_id is not None:
+        query["_id"] = {"$gt": ObjectId(after_dog_id)}
+    dogs_not_adopted = db["dog"].find(query, {"_id": 1, "name": 1, "breed.name": 1}).sort("_id", 1).limit(limit)
+    return await dogs_not_adopted.to_list(None)
+
+
+async def _adopt(adoption_data: Dict, session) -> Optional[ObjectId]:
+    adoption_id = (await db["adoption"].insert_one(adoption_data, session=session)).inserted_id
+    claimed = await db["dog"].update_one({"_id": adoption_data["dog_id"], "adoption_id": None},
+                                         {"$set": {"adoption_id": adoption_id}}, session=session)
+    if claimed.matched_count == 0:
+        await db["adoption"].delete_one({"_id": adoption_id}, session=session)
+        return None
+    return adoption_id
+
+
+async def adopt_new_pet(owner_id: str, dog_id: str):
+    adoption_data = {
+        "owner_id": ObjectId(owner_id),
+        "dog_id": ObjectId(dog_id),
+        "adoption_date": utc_now()
+    }
+
+    async def adopt(session):
+        return await _adopt(adoption_data, session)
+
+    adoption_id = await run_in_transaction_async(db, adopt)
+    if adoption_id is None:
+        raise ValueError(f"Dog {dog_id} does not exist or has already been adopted.")
+    return adoption_id
+
+
+async def _bulk_write(collection, requests: List, positions: List[int], result: BulkResult) -> set:
+    if not requests:
+        return set()
+    try:
+        await collection.bulk_write(requests, ordered=False)
+    except BulkWriteError as e:
+        return record_write_errors(e, positions, result)
+    return set()
+
+
+async def add_owners(owners: Iterable[Dict], chunk_size: int = BULK_CHUNK_SIZE) -> BulkResult:
+    result = BulkResult()
+    for chunk in chunks(owners, chunk_size):
+        offset = len(result.results)
+        for owner in chunk:
+            owner.setdefault("_id", ObjectId())
+            owner["search"] = search_keys(owner)
+        positions = list(range(offset, offset + len(chunk)))
+        failed = await _bulk_write(db["owner"], [InsertOne(owner) for owner in chunk], positions, result)
+
+        inserted = [owner for position, owner in zip(positions, chunk) if position not in failed]
+        result.results += [None if position in failed else owner["_id"] for position, owner in zip(positions, chunk)]
+        await _increment_facets(merge_facet_changes(*[owner_facet_changes(owner, 1) for owner in inserted]))
+        index_owners(db, inserted)
+    query_cache.invalidate(OWNER_ADDRESSES, OWNER_LIST)
+    return result
+
+
+async def _adopt_chunk(adoptions: Dict[int, Dict], session) -> Dict[int, str]:
+    await db["adoption"].insert_many(list(adoptions.values()), ordered=False, session=session)
+    await db["dog"].bulk_write([UpdateOne({"_id": adoption["dog_id"], "adoption_id": None},
+                                          {"$set": {"adoption_id": adoption["_id"]}})
+                                for adoption in adoptions.values()], ordered=False, session=session)
+    claimed = {dog["adoption_id"] async for dog in db["dog"].find(
+        {"adoption_id": {"$in": [adoption["_id"] for adoption in adoptions.values()]}}, {"adoption_id": 1},
+        session=session)}
+    unclaimed = [position for position, adoption in adoptions.items() if adoption["_id"] not in claimed]
+    if unclaimed:
+        await db["adoption"].delete_many({"_id": {"$in": [adoptions[position]["_id"] for position in unclaimed]}},
+                                         session=session)
+    return {position: f"Dog {adoptions[position]['dog_id']} does not exist or has already been adopted."
+            for position in unclaimed}
+
+
+async def adopt_pets(adoptions: Iterable[Tuple[str, str]], chunk_size: int = BULK_CHUNK_SIZE) -> BulkResult:
+    result = BulkResult()
+    for chunk in chunks(adoptions, chunk_size):
+        offset = len(result.results)
+        owner_ids = parse_object_ids([owner_id for owner_id, _ in chunk], offset, result)
+        dog_ids = parse_object_ids([dog_id for _, dog_id in chunk], offset, result)
+        adoption_date = utc_now()
+
+        pending = {}
+        for position, owner_id, dog_id in zip(range(offset, offset + len(chunk)), owner_ids, dog_ids):
+            if position not in result.errors:
+                pending[position] = {"_id": ObjectId(), "owner_id": owner_id, "dog_id": dog_id,
+                                     "adoption_date": adoption_date}
+
+        async def adopt(session):
+            return await _adopt_chunk(pending, session)
+
+        if pending:
+            result.errors.update(await run_in_transaction_async(db, adopt))
+        result.results += [pending[position]["_id"] if position not in result.errors else None
+                           for position in range(offset, offset + len(chunk))]
+    return result
+
+
+async def rename_dogs(renames: Iterable[Tuple[str, str]], chunk_size: int = BULK_CHUNK_SIZE) -> BulkResult:
+    result = BulkResult()
+    for chunk in chunks(renames, chunk_size):
+        offset = len(result.results)
+        dog_ids = parse_object_ids([dog_id for dog_id, _ in chunk], offset, result)
+        existing = set(await db["dog"].distinct("_id", {"_id": {"$in": [dog_id for dog_id in dog_ids if dog_id]}}))
+        for position, dog_id in enumerate(dog_ids, offset):
+            if dog_id is not None and dog_id not in existing:
+                result.errors[position] = f"Dog {dog_id} does not exist."
+        positions = [position for position in range(offset, offset + len(chunk)) if position not in result.errors]
+        await _bulk_write(db["dog"], [UpdateOne({"_id": dog_ids[position - offset]},
+                                                {"$set": {"name": chunk[position - offset][1]}})
+                                      for position in positions], positions, result)
+        result.results += [position not in result.errors for position in range(offset, offset + len(chunk))]
+    return result
+
+
+async def _delete_dogs_cascade(dog_ids: List[ObjectId], session) -> Dict[ObjectId, str]:
+    existing = {dog["_id"]: dog["breed"]["name"]
+                async for dog in db["dog"].find({"_id": {"$in": dog_ids}}, {"breed.name": 1}, session=session)}
+    if not existing:
+        return existing
+    # Same order as app.py: adoption rows, then the dogs.
+    dog_filter = {"$in": list(existing)}
+    counted = await _counted_adoptions({"dog_id": dog_filter}, session)
+    await db["adoption"].delete_many({"dog_id": dog_filter}, session=session)
+    await db["dog"].delete_many({"_id": dog_filter}, session=session)
+    breed_counts = defaultdict(int)
+    for breed_name in existing.values():
+        breed_counts[breed_name] -= 1
+    await _increment_facets({"dog.breed": breed_counts}, session)
+    await _decrement_rollups(counted, session)
+    return existing
+
+
+async def delete_dogs(dog_ids: Iterable[str], chunk_size: int = BULK_CHUNK_SIZE) -> BulkResult:
+    result = BulkResult()
+    deleted_any = False
+    for chunk in chunks(dog_ids, chunk_size):
+        offset = len(result.results)
+        object_ids = parse_object_ids(chunk, offset, result)
+        valid = list(dict.fromkeys(dog_id for dog_id in object_ids if dog_id))
+
+        async def cascade(session):
+            return await _delete_dogs_cascade(valid, session)
+
+        deleted = await run_in_transaction_async(db, cascade) if valid else {}
+        first_positions = {}
+        for position, dog_id in enumerate(object_ids, offset):
+            if dog_id is None:
+                continue
+            if dog_id not in deleted:
+                result.errors[position] = f"Dog {dog_id} does not exist."
+            elif first_positions.setdefault(dog_id, position) != position:
+                result.errors[position] = f"Dog {dog_id} was already deleted at position {first_positions[dog_id]}."
+        result.results += [position not in result.errors for position in range(offset, offset + len(chunk))]
+        deleted_any = deleted_any or bool(deleted)
+
+    if deleted_any:
+        query_cache.invalidate(DOG_BREEDS)
+    return result
@@ -0,0 +1,65 @@
+"""Requests/sec of the async query module against the sync one driven from a thread pool.
+
+Run from the repository root against a loaded database:
+
+    python -m benchmarks.async_vs_sync --concurrency 100 --requests 5000
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Tuple
+
+import app
+import app_async
+
+
+def _workload(breeds: List[str], cities: List[str], owner_ids: List[str], module) -> List[Tuple[Callable, tuple]]:
+    """One round of the read mix: a breed listing, a city search and an owner's dogs."""
+    calls = []
+    for index in range(max(len(breeds), len(cities), len(owner_ids))):
+        calls.append((module.find_top_5_dogs_of_breed, (breeds[index % len(breeds)],)))
+        calls.append((module.search_owners_by_city, (cities[index % len(cities)],)))
+        calls.append((module.find_top_5_dogs_by_owner, (owner_ids[index % len(owner_ids)],)))
+    return calls
+
+
+def run_sync(calls: List[Tuple[Callable, tuple]], total: int, concurrency: int) -> float:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(*calls[index % len(calls)]) for index in range(total)]
+        for future in futures:
+            future.result()
+    return total / (time.perf_counter() - started)
+
+
+async def run_async(calls: List[Tuple[Callable, tuple]], total: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(index: int):
+        function, args = calls[index % len(calls)]
+        async with semaphore:
+            await function(*args)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call(index) for index in range(total)))
+    return total / (time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    breeds = app.find_top_5_unique_breeds()
+    cities = app.get_unique_cities()
+    owner_ids = [str(owner["_id"]) for owner in app.get_top_10_owners()]
+
+    sync_rate = run_sync(_workload(breeds, cities, owner_ids, app), args.requests, args.concurrency)
+    async_rate = asyncio.run(run_async(_workload(breeds, cities, owner_ids, app_async), args.requests,
+                                       args.concurrency))
+
+    print(f"{args.requests} requests at concurrency {args.concurrency}")
+    print(f"sync + thread pool: {sync_rate:>10,.0f} req/s")
+    print(f"async:              {async_rate:>10,.0f} req/s ({async_rate / sync_rate:.2f}x)")
@@ -0,0 +1,220 @@
+"""Replay a weighted mix of console operations from many threads or processes and report per-operation latency.
+
+Run from the repository root against a loaded database:
+
+    python -m benchmarks.load --workers 16 --rate 500 --duration 60
+    python -m benchmarks.load --mix owners-in-city=5,count-breed=2,search-owners=3 --requests 10000
+    python -m benchmarks.load --script traffic.txt --processes --workers 8
+
+Operations go through app.run_console_operation, the same code the console and ``app.py --script`` run. Arguments
+come from a sample of the loaded owners and dogs, or with ``--script`` from a console script whose lines are
+sampled at random, so a line's weight is how often it appears. With ``--rate`` each worker starts its calls on a
+fixed schedule and latency is measured from the scheduled start, so time spent queued behind a slow call counts.
+Processes connect on their own, so use threads with the memory backend.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import app
+from benchmarks.timing import percentiles
+
+SAMPLE_SIZE = 1000
+# The default mix: the console's read operations, weighted roughly as the console is used, plus renames.
+DEFAULT_MIX = {"dogs-of-breed": 3, "dogs-of-owner": 2, "owners-in-city": 3, "owners-in-zip": 1,
+               "owners-in-country": 1, "count-city": 2, "count-zip": 1, "count-country": 1, "count-breed": 2,
+               "dogs-by-email": 2, "top-owners": 1, "search-owners": 3, "rename-dog": 1}
+
+Sample = Dict[str, List[str]]
+
+
+def _new_owner(rng: random.Random, sample: Sample) -> List[str]:
+    return [f"Load Owner {rng.randrange(10 ** 6)}", f"load.{uuid4().hex}@puppyworld.in", "0000000000",
+            "1 Load Street", rng.choice(sample["cities"]), rng.choice(sample["countries"]), rng.choice(sample["zips"])]
+
+
+# Operation name -> arguments for one call. Deletes and adoptions use up their targets, so only --script runs them.
+ARGUMENTS: Dict[str, Callable[[random.Random, Sample], List[str]]] = {
+    "dogs-of-breed": lambda rng, sample: [rng.choice(sample["breeds"])],
+    "dogs-of-owner": lambda rng, sample: [rng.choice(sample["adopters"])],
+    "rename-dog": lambda rng, sample: [rng.choice(sample["dogs"]), f"Load {rng.randrange(10 ** 6)}"],
+    "add-owner": _new_owner,
+    "owners-in-city": lambda rng, sample: [rng.choice(sample["cities"])],
+    "owners-in-zip": lambda rng, sample: [rng.choice(sample["zips"])],
+    "owners-in-country": lambda rng, sample: [rng.choice(sample["countries"])],
+    "count-city": lambda rng, sample: [rng.choice(sample["cities"])],
+    "count-zip": lambda rng, sample: [rng.choice(sample["zips"])],
+    "count-country": lambda rng, sample: [rng.choice(sample["countries"])],
+    "count-breed": lambda rng, sample: [rng.choice(sample["breeds"])],
+    "dogs-by-email": lambda rng, sample: [rng.choice(sample["emails"])],
+    "top-owners": lambda rng, sample: [],
+    "search-owners": lambda rng, sample: [rng.choice(sample["names"]).split()[0][:rng.randint(2, 6)]],
+}
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """``name=weight,...`` -> weights, checking every operation can have its arguments generated."""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = app.console_operation(name.strip()).name
+        if name not in ARGUMENTS:
+            raise ValueError(f"{name} uses up what it acts on; replay it from a --script instead.")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def sample_arguments(database, size: int = SAMPLE_SIZE) -> Sample:
+    """Values to draw operation arguments from: real owners, dogs, breeds and adopters."""
+    owners = list(database["owner"].find({}, {"name": 1, "email": 1, "address": 1}).limit(size))
+    dogs = list(database["dog"].find({}, {"_id": 1}).limit(size))
+    adoptions = list(database["adoption"].find({}, {"owner_id": 1}).limit(size))
+    breeds = database["dog"].distinct("breed.name")
+    if not owners or not dogs or not breeds:
+        raise RuntimeError("The database has no owners or dogs to draw arguments from; run data_loader.py first.")
+    return {
+        "names": [owner["name"] for owner in owners],
+        "emails": [owner["email"] for owner in owners],
+        "cities": [owner["address"]["city"] for owner in owners],
+        "zips": [owner["address"]["zip"] for owner in owners],
+        "countries": [owner["address"]["country"] for owner in owners],
+        "dogs": [str(dog["_id"]) for dog in dogs],
+        "breeds": breeds,
+        "adopters": [str(adoption["owner_id"]) for adoption in adoptions] or [str(owners[0]["_id"])],
+    }
+
+
+def run_worker(seed: int, mix: Dict[str, float], sample: Sample, script: List[Tuple[str, List[str]]],
+               requests: Optional[int], duration: float, interval: float, listings: bool) -> Dict[str, Dict]:
+    """Make ``requests`` calls (or, if None, call for ``duration`` seconds), one every ``interval`` seconds if set.
+
+    Returns operation name -> ``{"latencies": [ms, ...], "errors": Counter of exception types}``.
+    """
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    results: Dict[str, Dict] = {}
+    started = time.perf_counter()
+    calls = 0
+    while calls < requests if requests is not None else time.perf_counter() - started < duration:
+        scheduled = started + calls * interval
+        if interval and scheduled > time.perf_counter():
+            time.sleep(scheduled - time.perf_counter())
+        if script:
+            key, arguments = rng.choice(script)
+        else:
+            key = rng.choices(names, weights)[0]
+            arguments = ARGUMENTS[key](rng, sample)
+        result = results.setdefault(app.console_operation(key).name, {"latencies": [], "errors": Counter()})
+
+        begun = scheduled if interval else time.perf_counter()
+        try:
+            app.run_console_operation(key, arguments, listings)
+        except Exception as e:
+            result["errors"][type(e).__name__] += 1
+        result["latencies"].append((time.perf_counter() - begun) * 1000)
+        calls += 1
+    return results
+
+
+def _run_quiet_worker(*args) -> Dict[str, Dict]:
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return run_worker(*args)
+
+
+def run_load(mix: Dict[str, float], sample: Sample, script: List[Tuple[str, List[str]]], workers: int,
+             processes: bool, requests: int, duration: float, rate: float, listings: bool,
+             seed: int) -> Tuple[Dict[str, Dict], float]:
+    """Run the workers and merge their results. Returns the merged results and the wall-clock seconds."""
+    interval = workers / rate if rate else 0.0
+    per_worker = [requests // workers + (index < requests % workers) for index in range(workers)] if requests \
+        else [None] * workers
+    if processes:
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        worker = _run_quiet_worker
+    else:
+        # Threads share sys.stdout, so it is redirected once around the whole run instead of per worker.
+        executor = ThreadPoolExecutor(workers)
+        worker = run_worker
+
+    merged: Dict[str, Dict] = {}
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), executor:
+        futures = [executor.submit(worker, seed + index, mix, sample, script, per_worker[index], duration, interval,
+                                   listings) for index in range(workers)]
+        for future in futures:
+            for name, result in future.result().items():
+                total = merged.setdefault(name, {"latencies": [], "errors": Counter()})
+                total["latencies"] += result["latencies"]
+                total["errors"].update(result["errors"])
+    return merged, time.perf_counter() - started
+
+
+def summarize(results: Dict[str, Dict], seconds: float) -> Dict[str, Dict]:
+    """Per operation, and in total: calls, errors by type, calls per second and latency percentiles in ms."""
+    summary = {}
+    everything = {"latencies": [], "errors": Counter()}
+    for name in sorted(results) + ["total"]:
+        result = results.get(name, everything)
+        if name != "total":
+            everything["latencies"] += result["latencies"]
+            everything["errors"].update(result["errors"])
+        latencies = result["latencies"]
+        summary[name] = dict(percentiles(latencies), calls=len(latencies), errors=sum(result["errors"].values()),
+                             error_types=dict(result["errors"]), max=max(latencies, default=0.0),
+                             ops_per_sec=len(latencies) / seconds if seconds else 0.0)
+    return summary
+
+
+def print_summary(summary: Dict[str, Dict]):
+    print(f"{'operation':<20} {'calls':>8} {'errors':>7} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'max ms':>9}")
+    for name, row in summary.items():
+        print(f"{name:<20} {row['calls']:>8} {row['errors']:>7} {row['ops_per_sec']:>9.1f} {row['p50']:>9.2f} "
+              f"{row['p95']:>9.2f} {row['p99']:>9.2f} {row['max']:>9.2f}")
+        if name != "total":
+            for error, count in row["error_types"].items():
+                print(f"    {error}: {count}")
+
+
+def _read_script(path: str) -> List[Tuple[str, List[str]]]:
+    with open(path, encoding="utf-8") as file:
+        script = [(key, arguments) for _, key, arguments in app.parse_console_script(file)]
+    for key, arguments in script:
+        app.console_call(key, arguments)
+    return script
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mix", type=parse_mix, default=None,
+                        help="Operations and weights, e.g. owners-in-city=5,count-breed=2 (default: a read mix).")
+    parser.add_argument("--script", help="Replay lines sampled from this console script instead of --mix.")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--processes", action="store_true", help="Run workers as processes instead of threads.")
+    parser.add_argument("--rate", type=float, default=0.0, help="Target calls per second in total; 0 is flat out.")
+    parser.add_argument("--requests", type=int, default=0, help="Total calls to make; 0 runs for --duration.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run for, without --requests.")
+    parser.add_argument("--listings", action="store_true", help="Also run the listing each operation shows first.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Also write the summary here as JSON.")
+    args = parser.parse_args()
+
+    load_script = _read_script(args.script) if args.script else []
+    load_sample = {} if load_script else sample_arguments(app.db)
+    merged_results, elapsed = run_load(args.mix or DEFAULT_MIX, load_sample, load_script, args.workers,
+                                       args.processes, args.requests, args.duration, args.rate, args.listings,
+                                       args.seed)
+    load_summary = summarize(merged_results, elapsed)
+    print_summary(load_summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump({"seconds": elapsed, "operations": load_summary}, output, indent=2)
+        print(f"Wrote {args.output}")
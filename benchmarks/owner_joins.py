@@ -0,0 +1,54 @@
+"""p50/p99 of the owner -> adoption -> dog lookups, multi-round-trip versus single $lookup pipeline.
+
+Run from the repository root against a loaded database:
+
+    python -m benchmarks.owner_joins --repeat 500
+"""
+import argparse
+from typing import Dict, List
+
+from bson import ObjectId
+
+import app
+from benchmarks.timing import percentiles, time_calls
+
+
+def find_top_5_dogs_by_owner_round_trips(owner_id: str) -> List[Dict]:
+    adopted_dog_ids = app.db["adoption"].find({"owner_id": ObjectId(owner_id)}).limit(5)
+    adopted_dog_ids_list = [doc["dog_id"] for doc in adopted_dog_ids]
+    return list(app.db["dog"].find({"_id": {"$in": adopted_dog_ids_list}}, app.DOG_PROJECTION).sort("name", 1))
+
+
+def search_dogs_by_owner_email_round_trips(email: str):
+    owner = app.db["owner"].find_one({"email": email})
+    if not owner:
+        return None, []
+    adopted_dog_ids = app.db["adoption"].find({"owner_id": owner["_id"]}).limit(10)
+    adopted_dog_ids_list = [doc["dog_id"] for doc in adopted_dog_ids]
+    return owner, list(app.db["dog"].find({"_id": {"$in": adopted_dog_ids_list}}, app.DOG_PROJECTION))
+
+
+def _same_dogs(left: List[Dict], right: List[Dict]) -> bool:
+    return sorted(dog["_id"] for dog in left) == sorted(dog["_id"] for dog in right)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    owners = app.get_top_10_owners()
+    owner_id, email = str(owners[0]["_id"]), owners[0]["email"]
+
+    assert _same_dogs(app.find_top_5_dogs_by_owner(owner_id), find_top_5_dogs_by_owner_round_trips(owner_id))
+    assert _same_dogs(app.search_dogs_by_owner_email(email)[1], search_dogs_by_owner_email_round_trips(email)[1])
+
+    cases = [
+        ("find_top_5_dogs_by_owner", find_top_5_dogs_by_owner_round_trips, app.find_top_5_dogs_by_owner, owner_id),
+        ("search_dogs_by_owner_email", search_dogs_by_owner_email_round_trips, app.search_dogs_by_owner_email,
+         email),
+    ]
+    for name, before, after, argument in cases:
+        for label, function in (("round trips", before), ("$lookup", after)):
+            stats = percentiles(time_calls(function, args.repeat, argument), points=(50, 99))
+            print(f"{name:<28} {label:<12} p50 {stats['p50']:>8.3f} ms  p99 {stats['p99']:>8.3f} ms")
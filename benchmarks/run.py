@@ -0,0 +1,247 @@
+"""Seed a benchmark database and time every app.py query and loader stage.
+
+Run from the repository root:
+
+    python -m benchmarks.run --scale 1M --seed 42 --output bench_output.json
+
+Results (latency percentiles, throughput, documents examined vs. returned and peak RSS) are written as JSON so
+runs from different commits can be diffed. ``--mongomock`` runs against an in-process stand-in instead of mongod;
+explain output and some aggregation stages are not available there and are reported as such. ``--memory`` runs
+against the indexed in-memory backend (memory_backend.py), with no explain output.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+from pymongo import MongoClient, monitoring
+
+import app
+import data_loader
+from benchmarks.timing import percentiles
+from connection import client_options
+from facet_counts import build_facet_counts
+from indexes import ensure_indexes
+from instrumentation import sum_plan_key
+from memory_backend import MemoryDatabase
+from source_data import load_source_data
+from synthetic_data import SyntheticDataGenerator
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1M": 1_000_000, "10M": 10_000_000}
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct"}
+
+
+class CommandRecorder(monitoring.CommandListener):
+    """Keeps the read commands issued while ``recording`` is set, so they can be explained afterwards."""
+
+    def __init__(self):
+        self.recording = False
+        self.commands: List[Dict] = []
+
+    def started(self, event):
+        if self.recording and event.command_name in EXPLAINABLE_COMMANDS:
+            self.commands.append({key: value for key, value in event.command.items()
+                                  if not key.startswith("$") and key not in ("lsid", "txnNumber")})
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _returned(result) -> int:
+    if isinstance(result, tuple):
+        result = result[-1]
+    if isinstance(result, list):
+        return len(result)
+    return 1 if result is not None else 0
+
+
+def _breed_documents(source) -> List[Dict]:
+    if source.breed_documents is not None:
+        return source.breed_documents
+    return [{"_id": breed_id, "name": f"Breed {breed_id}"} for breed_id in range(1, 201)]
+
+
+def seed(database, max_entries: int, seed_value: int, batch_size: int, mongomock: bool) -> Dict[str, Dict]:
+    """Load the database with data_loader's checkpointed loader, one timed stage at a time."""
+    data_loader.db = database
+    source = load_source_data()
+    with contextlib.redirect_stdout(io.StringIO()):
+        plan, breed_references = data_loader.start_load(_breed_documents(source), max_entries, batch_size, seed_value)
+    generator = SyntheticDataGenerator(source.names, source.addresses, source.cities, source.countries,
+                                       breed_references, seed=plan["seed"], reference_time=plan["reference_time"])
+
+    stages = [(name, lambda name=name: data_loader.run_stage(generator, plan, name).documents)
+              for name in data_loader.STAGE_GENERATORS]
+    stages.append(("indexes", lambda: ensure_indexes(database)))
+    if not mongomock:
+        stages.append(("facet_counts", lambda: build_facet_counts(database)))
+
+    report = {}
+    for name, stage in stages:
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            documents = stage()
+        seconds = time.perf_counter() - started
+        report[name] = {"seconds": seconds, "peak_rss_mb": _peak_rss_mb()}
+        if isinstance(documents, int):
+            report[name].update(documents=documents, docs_per_sec=documents / seconds if seconds else 0.0)
+    data_loader.finish_load_plan()
+    return report
+
+
+def _query_cases(database) -> Dict[str, Callable[[int], tuple]]:
+    """Public app.py functions mapped to a function producing the arguments for iteration ``i``."""
+    owner = database["owner"].find_one({}, sort=[("_id", 1)])
+    adoption = database["adoption"].find_one({}, sort=[("_id", 1)])
+    dog = database["dog"].find_one({}, sort=[("_id", 1)])
+    address = owner["address"]
+    breed = dog["breed"]["name"]
+    owner_with_dogs = str(adoption["owner_id"])
+    return {
+        "find_top_5_dogs_of_breed": lambda i: (breed,),
+        "find_top_5_dogs_by_owner": lambda i: (owner_with_dogs,),
+        "get_top_10_owners": lambda i: (),
+        "get_unique_cities": lambda i: (),
+        "get_unique_zip_codes": lambda i: (),
+        "get_unique_countries": lambda i: (),
+        "get_owner_emails": lambda i: (),
+        "get_top_5_dogs": lambda i: (),
+        "search_owners_by_city": lambda i: (address["city"],),
+        "search_owners_by_zip": lambda i: (address["zip"],),
+        "search_owners_by_country": lambda i: (address["country"],),
+        "count_owners_by_city": lambda i: (address["city"],),
+        "count_owners_by_zip": lambda i: (address["zip"],),
+        "count_owners_by_country": lambda i: (address["country"],),
+        "count_dogs_by_breed": lambda i: (breed,),
+        "search_dogs_by_owner_email": lambda i: (owner["email"],),
+        "find_top_5_unique_breeds": lambda i: (),
+        "find_top_5_dogs_not_adopted": lambda i: (),
+        "update_dog_name": lambda i: (str(dog["_id"]), f"Bench {i}"),
+    }
+
+
+def _write_cases(database, repeat: int) -> List[tuple]:
+    """Write functions run ``repeat`` times on fresh targets, in an order that leaves the data consistent."""
+    available = [str(dog["_id"]) for dog in app.find_top_5_dogs_not_adopted(limit=repeat * 2)]
+    stamp = int(time.time())
+    added_owners = []
+
+    def add_owner_arguments(i: int) -> tuple:
+        return ({"name": f"Bench Owner {i}", "email": f"bench.{stamp}.{i}@puppyworld.in", "mobile": "0000000000",
+                 "address": {"street": "1 Bench Street", "city": "Bench", "country": "Bench", "zip": "00000"}},)
+
+    return [
+        ("add_owner", add_owner_arguments, added_owners.append),
+        ("adopt_new_pet", lambda i: (added_owners[i % len(added_owners)], available[i]), None),
+        ("delete_dog_entry", lambda i: (available[repeat + i],), None),
+        ("delete_owner", lambda i: (added_owners[i],), None),
+    ]
+
+
+def _measure(function: Callable, arguments: Callable[[int], tuple], repeat: int, recorder: CommandRecorder,
+             database, explain: bool, keep: Callable = None) -> Dict:
+    latencies = []
+    returned = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(repeat):
+            args = arguments(i)
+            recorder.recording = explain and i == 0
+            started = time.perf_counter()
+            result = function(*args)
+            latencies.append((time.perf_counter() - started) * 1000)
+            recorder.recording = False
+            returned += _returned(result)
+            if keep:
+                keep(result)
+
+    total_seconds = sum(latencies) / 1000
+    measurement = dict(percentiles(latencies), calls=repeat,
+                       ops_per_sec=repeat / total_seconds if total_seconds else 0.0,
+                       docs_returned_per_call=returned / repeat)
+    if explain:
+        examined = 0
+        for command in recorder.commands:
+            plan = database.command({"explain": command, "verbosity": "executionStats"})
+            examined += sum_plan_key(plan, "totalDocsExamined")
+        measurement["docs_examined_first_call"] = examined
+        measurement["round_trips_first_call"] = len(recorder.commands)
+        recorder.commands.clear()
+    return measurement
+
+
+def run_queries(database, recorder: CommandRecorder, repeat: int, explain: bool) -> Dict[str, Dict]:
+    app.db = database
+    results = {}
+    cases = [(name, getattr(app, name), arguments, None) for name, arguments in _query_cases(database).items()]
+    cases += [(f"{name}[uncached]", getattr(app, name).uncached, arguments, None)
+              for name, arguments in _query_cases(database).items() if hasattr(getattr(app, name), "uncached")]
+    cases += [(name, getattr(app, name), arguments, keep) for name, arguments, keep in _write_cases(database, repeat)]
+
+    for name, function, arguments, keep in cases:
+        try:
+            results[name] = _measure(function, arguments, repeat, recorder, database, explain, keep)
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+        print(f"{name:<38} {json.dumps(results[name])}")
+    return results
+
+
+def _commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the pet adoption queries and loader stages.")
+    parser.add_argument("--scale", default="10k", help=f"Owners and dogs to seed: {', '.join(SCALES)} or a number.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=100, help="Calls per function.")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--database", default="pet_adoption_bench")
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the data from a previous run.")
+    parser.add_argument("--mongomock", action="store_true", help="Use mongomock instead of a local mongod.")
+    parser.add_argument("--memory", action="store_true", help="Use the in-process memory backend.")
+    parser.add_argument("--output", default="bench_output.json")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    max_entries = SCALES[args.scale] if args.scale in SCALES else int(args.scale)
+
+    recorder = CommandRecorder()
+    if args.mongomock:
+        import mongomock
+        database = mongomock.MongoClient()[args.database]
+    elif args.memory:
+        database = MemoryDatabase(args.database)
+    else:
+        database = MongoClient(**client_options(), event_listeners=[recorder])[args.database]
+
+    results = {
+        "meta": {"commit": _commit(), "scale": max_entries, "seed": args.seed, "repeat": args.repeat,
+                 "backend": "mongomock" if args.mongomock else "memory" if args.memory else "mongod",
+                 "started_at": datetime.now(timezone.utc).isoformat()},
+        "loader": {} if args.skip_seed else seed(database, max_entries, args.seed, args.batch_size, args.mongomock),
+    }
+    results["queries"] = run_queries(database, recorder, args.repeat, explain=not (args.mongomock or args.memory))
+    results["peak_rss_mb"] = _peak_rss_mb()
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2, default=str)
+    print(f"Wrote {args.output}")
@@ -0,0 +1,19 @@
+import time
+from typing import Callable, Dict, List
+
+
+def time_calls(function: Callable, repeat: int, *args, **kwargs) -> List[float]:
+    """Call ``function`` ``repeat`` times and return each call's latency in milliseconds."""
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(*args, **kwargs)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def percentiles(latencies: List[float], points=(50, 95, 99)) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    if not ordered:
+        return {f"p{point}": 0.0 for point in points}
+    return {f"p{point}": ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))] for point in points}
@@ -0,0 +1,52 @@
+"""Helpers shared by the bulk write functions in app.py and app_async.py.
+
+Bulk calls report per item, by position in the input: ``BulkResult.results`` holds one entry per input item and
+``BulkResult.errors`` an error message for each position that failed.
+"""
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+
+@dataclass
+class BulkResult:
+    """Per-item outcome of a bulk call, by position in the input: a result, or an error message."""
+    results: List[object] = field(default_factory=list)
+    errors: Dict[int, str] = field(default_factory=dict)
+
+    @property
+    def succeeded(self) -> int:
+        return len(self.results) - len(self.errors)
+
+
+def chunks(items: Iterable, size: int) -> Iterator[List]:
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_object_ids(values: List, offset: int, result: BulkResult) -> List[Optional[ObjectId]]:
+    """``values`` as ObjectIds, with None and an error recorded for each one that is not a valid id."""
+    object_ids = []
+    for position, value in enumerate(values, offset):
+        try:
+            object_ids.append(ObjectId(value))
+        except Exception as e:
+            result.errors[position] = f"Invalid id {value!r}: {e}"
+            object_ids.append(None)
+    return object_ids
+
+
+def record_write_errors(error: BulkWriteError, positions: List[int], result: BulkResult) -> set:
+    """Record each write error of an unordered bulk write against its input position. Returns failed positions."""
+    failed = set()
+    for write_error in error.details["writeErrors"]:
+        failed.add(positions[write_error["index"]])
+        result.errors[positions[write_error["index"]]] = write_error["errmsg"]
+    return failed
@@ -0,0 +1,254 @@
+"""The one MongoDB client every module shares, created on first use.
+
+Importing a module that has a ``db`` global costs nothing until a query runs, so ``--help`` and imports from tests
+never touch the network. Settings come from the environment (or ``configure()`` before the first query):
+
+- ``PET_ADOPTION_MONGO_URI`` (default ``mongodb://localhost:27017/``) and ``PET_ADOPTION_DATABASE`` (``pet_adoption``)
+- ``PET_ADOPTION_MAX_POOL_SIZE``, ``PET_ADOPTION_MIN_POOL_SIZE``
+- ``PET_ADOPTION_CONNECT_TIMEOUT_MS``, ``PET_ADOPTION_SOCKET_TIMEOUT_MS``, ``PET_ADOPTION_SERVER_SELECTION_TIMEOUT_MS``,
+  ``PET_ADOPTION_WAIT_QUEUE_TIMEOUT_MS``
+- ``PET_ADOPTION_COMPRESSORS``, e.g. ``zstd,snappy`` (needs the matching optional package installed)
+- ``PET_ADOPTION_READ_PREFERENCE``, e.g. ``secondaryPreferred``
+- ``PET_ADOPTION_BACKEND``: ``mongo`` (default) or ``memory`` for the in-process engine in memory_backend.py, which
+  restores from and snapshots to ``PET_ADOPTION_SNAPSHOT`` when that is set
+
+Anything left unset keeps pymongo's default.
+"""
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+import pymongo
+from pymongo import MongoClient, monitoring
+from pymongo.errors import OperationFailure
+
+# Environment variable -> MongoClient keyword, with the type to parse it as.
+ENVIRONMENT = {
+    "PET_ADOPTION_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "PET_ADOPTION_MIN_POOL_SIZE": ("minPoolSize", int),
+    "PET_ADOPTION_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "PET_ADOPTION_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "PET_ADOPTION_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "PET_ADOPTION_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "PET_ADOPTION_COMPRESSORS": ("compressors", str),
+    "PET_ADOPTION_READ_PREFERENCE": ("readPreference", str),
+}
+
+_overrides: Dict[str, object] = {}
+_lock = threading.Lock()
+_client = None
+_async_client = None
+_memory_database = None
+# Settings that pick the backend rather than configure MongoClient.
+BACKEND_SETTINGS = ("uri", "database", "backend", "snapshot")
+
+# Server code for "Transaction numbers are only allowed on a replica set member or mongos".
+ILLEGAL_OPERATION = 20
+# Databases on deployments (standalone mongod, mongomock) found not to support transactions.
+_without_transactions = set()
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters, for sizing maxPoolSize/minPoolSize under load."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkout_failures = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.checkout_wait_seconds = 0.0
+        self.pools_cleared = 0
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "created": self.created,
+                "closed": self.closed,
+                "open": self.created - self.closed,
+                "checked_out": self.checked_out,
+                "checkout_failures": self.checkout_failures,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "avg_checkout_wait_ms":
+                    self.checkout_wait_seconds * 1000 / self.checked_out if self.checked_out else 0.0,
+                "pools_cleared": self.pools_cleared,
+            }
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            self.checkout_wait_seconds += getattr(event, "duration", 0.0) or 0.0
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pools_cleared += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+pool_stats = PoolStats()
+
+
+def configure(**settings):
+    """Override settings (``uri``, ``database``, ``backend``, ``snapshot`` or any MongoClient keyword) before the first
+    client is created."""
+    if _client is not None or _async_client is not None or _memory_database is not None:
+        raise RuntimeError("configure() must be called before the first query.")
+    _overrides.update(settings)
+
+
+def database_name() -> str:
+    return _overrides.get("database", os.environ.get("PET_ADOPTION_DATABASE", "pet_adoption"))
+
+
+def backend() -> str:
+    return _overrides.get("backend", os.environ.get("PET_ADOPTION_BACKEND", "mongo"))
+
+
+def snapshot_path() -> Optional[str]:
+    return _overrides.get("snapshot", os.environ.get("PET_ADOPTION_SNAPSHOT") or None)
+
+
+def client_options() -> Dict[str, object]:
+    options = {"host": _overrides.get("uri", os.environ.get("PET_ADOPTION_MONGO_URI", "mongodb://localhost:27017/"))}
+    for variable, (keyword, parse) in ENVIRONMENT.items():
+        if os.environ.get(variable):
+            options[keyword] = parse(os.environ[variable])
+    options.update({key: value for key, value in _overrides.items() if key not in BACKEND_SETTINGS})
+    return options
+
+
+def get_client() -> MongoClient:
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = MongoClient(**client_options(), event_listeners=[pool_stats])
+    return _client
+
+
+def get_memory_db():
+    global _memory_database
+    if _memory_database is None:
+        from memory_backend import MemoryDatabase
+        with _lock:
+            if _memory_database is None:
+                _memory_database = MemoryDatabase(database_name(), snapshot_path())
+    return _memory_database
+
+
+def get_db():
+    if backend() == "memory":
+        return get_memory_db()
+    return get_client()[database_name()]
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        try:
+            from pymongo import AsyncMongoClient
+        except ImportError as e:
+            raise ImportError(f"The async client needs pymongo 4.10 or later (pip install 'pymongo>=4.10'); "
+                              f"pymongo {pymongo.version} is installed.") from e
+        with _lock:
+            if _async_client is None:
+                _async_client = AsyncMongoClient(**client_options(), event_listeners=[pool_stats])
+    return _async_client
+
+
+def get_async_db():
+    return get_async_client()[database_name()]
+
+
+class LazyDatabase:
+    """Stands in for a module's ``db`` global and resolves to the shared database on first use."""
+
+    def __init__(self, factory=get_db):
+        self._factory = factory
+
+    def __getitem__(self, name):
+        return self._factory()[name]
+
+    def __getattr__(self, name):
+        return getattr(self._factory(), name)
+
+
+def run_in_transaction(database, callback: Callable):
+    """Run ``callback(session)`` in a multi-document transaction, retried by pymongo on transient errors.
+
+    Deployments without transactions run ``callback(None)`` directly instead, so callbacks must order their writes
+    to be safe when interrupted (children before parents).
+    """
+    if database.name not in _without_transactions:
+        try:
+            with database.client.start_session() as session:
+                return session.with_transaction(callback)
+        except OperationFailure as e:
+            if e.code != ILLEGAL_OPERATION:
+                raise
+        except NotImplementedError:
+            pass
+        _without_transactions.add(database.name)
+    return callback(None)
+
+
+async def run_in_transaction_async(database, callback: Callable):
+    """``run_in_transaction`` for the async client; ``callback`` is a coroutine function."""
+    if database.name not in _without_transactions:
+        try:
+            async with database.client.start_session() as session:
+                return await session.with_transaction(callback)
+        except OperationFailure as e:
+            if e.code != ILLEGAL_OPERATION:
+                raise
+        except NotImplementedError:
+            pass
+        _without_transactions.add(database.name)
+    return await callback(None)
+
+
+if __name__ == "__main__":
+    print(f"Database: {database_name()} ({backend()} backend)")
+    if backend() == "memory":
+        print(f"Snapshot: {snapshot_path()}")
+        print(f"Collections: {', '.join(get_memory_db().list_collection_names()) or '-'}")
+    else:
+        for option, value in client_options().items():
+            print(f"{option}: {value}")
+        get_client().admin.command("ping")
+        print(f"Pool: {pool_stats.snapshot()}")
@@ -1,177 +1,286 @@
-import json
-import random
-import datetime
-from typing import List, Dict
-
-from pymongo import MongoClient
-
-client = MongoClient("mongodb://localhost:27017/")
-db = client["pet_adoption"]  # Replace "your_database_name" with the desired name of your MongoDB database
-
-
+import argparse
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Iterable, List, Dict, Optional, Tuple
+
+import bson
+from bson.raw_bson import RawBSONDocument
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+from adoption_analytics import ROLLUP_COLLECTION, build_rollups, utc_now
+from connection import LazyDatabase, backend, snapshot_path
+from facet_counts import build_facet_counts, built_databases
+from indexes import ensure_indexes
+from instrumentation import instrumented
+from owner_search import build_search_index
+from source_data import SourceData, load_source_data
+from synthetic_data import SyntheticDataGenerator
+
+db = LazyDatabase()
+
+# Holds the current load plan and one checkpoint per committed batch, so an interrupted load can resume.
+LOAD_STATE_COLLECTION = "load_state"
+PLAN_ID = "plan"
+DUPLICATE_KEY = 11000
+
+
+@instrumented
 def clear_database():
     db.owner.drop()
+    db.breed.drop()
     db.dog.drop()
     db.adoption.drop()
+    db.stats.drop()
+    db[ROLLUP_COLLECTION].drop()
+    db[LOAD_STATE_COLLECTION].drop()
+    built_databases.discard(db.name)
     print("Cleared the database.")
 
 
-def get_breed_documents(dog_breeds: List[Dict]):
-    breeds = []
-    for dog_breed in dog_breeds:
-        breed_document = {
-            "name": dog_breed["Name"],
-            "description": "\n".join(dog_breed["Description"]).replace("'", ""),
-            "profile_url": dog_breed["ProfileUrl"],
-            "breed_characteristics": dog_breed["BreedCharacteristics"],
-            "vital_stats": dog_breed["VitalStats"],
-            "more_about": dog_breed["MoreAbout"],
-            "images_urls": dog_breed["ImagesUrls"],
-        }
-        breeds.append(breed_document)
-    return breeds
-
-
-def insert_owners(owners):
-    collection = db["owner"]
-    batch_size = 10000
-
-    owner_id_results = []
-
-    for i in range(0, len(owners), batch_size):
-        batch = owners[i:i + batch_size]
-        result = collection.insert_many(batch)
-        owner_id_results += result.inserted_ids
-        print(f"Inserted {len(result.inserted_ids)} rows to owner collection (Batch {i // batch_size + 1}).")
-
-    print(f"Inserted {len(owner_id_results)} rows to owner collection in total.")
-    return owner_id_results
-
-
-def random_past_date(past_years: int = 5) -> datetime.datetime:
-    today = datetime.datetime.now()
-    past_date = today - datetime.timedelta(days=past_years * 365)
-    days_between = (today - past_date).days
-    random_days = random.randint(0, days_between)
-    random_datetime = past_date + datetime.timedelta(days=random_days, hours=random.randint(0, 23),
-                                                     minutes=random.randint(0, 59), seconds=random.randint(0, 59))
-    return random_datetime
-
-
-def insert_adoption(owner_ids_collection: List[object], dog_ids_collection: List[object], ignore_frequency: int = 10):
-    collection = db["adoption"]
-    dogs_count = len(dog_ids_collection)
-    adoption_list = []
-
-    adoption_id_results = []
-    for i in range(1, dogs_count + 1):
-        if i % ignore_frequency == 0:
-            continue
+def breed_reference(breed: Dict) -> Dict:
+    """The compact form of a breed stored on each dog; full details live in the ``breed`` collection."""
+    return {"_id": breed["_id"], "name": breed["name"]}
+
+
+@instrumented
+def insert_breeds(breeds: List[Dict]) -> List[Dict]:
+    db["breed"].insert_many(breeds)
+    print(f"Inserted {len(breeds)} rows to breed collection.")
+    return [breed_reference(breed) for breed in breeds]
+
+
+# Shared generator inputs for the parallel loader, set once per worker process.
+_worker_source: Dict = {}
+
+
+def _init_generator_worker(source: Dict):
+    global _worker_source
+    _worker_source = source
+
+
+def _generate_owner_batch(task: Tuple[int, int]) -> List[bytes]:
+    start, size = task
+    return [bson.encode(owner) for owner in _worker_source["generator"].owners(start, size)]
+
+
+def _generate_dog_batch(task: Tuple[int, int]) -> List[bytes]:
+    start, size = task
+    source = _worker_source
+    return [bson.encode(dog) for dog in source["generator"].dogs(start, size, source["ignore_frequency"])]
+
+
+def _generate_adoption_batch(task: Tuple[int, int]) -> List[bytes]:
+    start, size = task
+    source = _worker_source
+    adoptions = source["generator"].adoptions(start, size, source["num_owners"], source["ignore_frequency"])
+    return [bson.encode(adoption) for adoption in adoptions]
+
+
+STAGE_GENERATORS = {"owner": _generate_owner_batch, "dog": _generate_dog_batch, "adoption": _generate_adoption_batch}
+
+
+def new_load_plan(seed: int, reference_time: datetime, batch_size: int, ignore_frequency: int,
+                  owners: Tuple[int, int], dogs: Tuple[int, int]) -> Dict:
+    """Everything needed to regenerate any batch of a load: data depends only on the seed and batch start."""
+    return {
+        "_id": PLAN_ID,
+        "seed": seed,
+        "reference_time": reference_time,
+        "batch_size": batch_size,
+        "ignore_frequency": ignore_frequency,
+        # Index ranges [start, end) per collection; adoptions are generated per dog.
+        "owner": {"start": owners[0], "end": owners[1]},
+        "dog": {"start": dogs[0], "end": dogs[1]},
+        "adoption": {"start": dogs[0], "end": dogs[1]},
+        "status": "running",
+        "started_at": utc_now(),
+    }
+
+
+def get_load_plan() -> Optional[Dict]:
+    return db[LOAD_STATE_COLLECTION].find_one({"_id": PLAN_ID})
 
-        adoption_date = random_past_date()
-        adoption_record = {
-            "dog_id": dog_ids_collection[i - 1],
-            "owner_id": random.choice(owner_ids_collection),
-            "adoption_date": adoption_date
-        }
-        adoption_list.append(adoption_record)
-
-        if len(adoption_list) % 10000 == 0:
-            result = collection.insert_many(adoption_list)
-            print(f"Inserted {len(result.inserted_ids)} rows to adoption collection.")
-            adoption_id_results += result.inserted_ids
-            adoption_list = []
-
-    if adoption_list:
-        result = collection.insert_many(adoption_list)
-        print(f"Inserted {len(result.inserted_ids)} rows to adoption collection.")
-        adoption_id_results += result.inserted_ids
-
-    return adoption_id_results
-
-
-def get_owners() -> List[Dict]:
-    with open("./data/owners.json", "r", encoding="utf-8") as file:
-        return json.load(file)
-
-
-def get_dog_data() -> str:
-    with open("./data/dog_breed_data.json", "r", encoding="utf-8") as file:
-        return json.load(file)
-
-
-def get_owner_data() -> str:
-    with open("./data/owner_data.json", "r", encoding="utf-8") as file:
-        return json.load(file)
-
-
-def get_random_names() -> List[str]:
-    with open("./data/random_names.json", "r", encoding="utf-8") as file:
-        return json.load(file)
-
-
-def generate_dummy_owners(names: list, addresses: list, cities: list, countries: list, num_owners: int):
-    dummy_owners = []
-
-    for _ in range(num_owners):
-        first_name = random.choice(names)
-        last_name = random.choice(names)
-        name = f"{first_name} {last_name}"
-        email = f"{first_name.lower()}.{last_name.lower()}@puppyworld.in"
-        mobile = ''.join([str(random.randint(0, 9)) for _ in range(10)])
-
-        address = random.choice(addresses)
-        shuffled_address = ' '.join(random.sample(address.split(), len(address.split())))
-
-        city = random.choice(cities)
-        country = random.choice(countries)
-        zip_code = ''.join([str(random.randint(0, 9)) for _ in range(5)])
-
-        owner = {
-            "name": name,
-            "email": email,
-            "mobile": mobile,
-            "address": {
-                "street": shuffled_address,
-                "city": city,
-                "country": country,
-                "zip": zip_code
-            }
-        }
-        dummy_owners.append(owner)
-
-    return dummy_owners
-
-
-def insert_dog(dog_names_collections: List[str], breed_info_collections: List[object],
-               countries_collections: List[str],
-               max_entry: int = 1000):
-    collection = db["dog"]
-    dog_documents = []
-    num_entries = 0
-    dog_id_results = []
-    for _ in range(max_entry):
-        dog = {
-            "breed": random.choice(breed_info_collections),
-            "name": random.choice(dog_names_collections),
-            "country": random.choice(countries_collections)
-        }
-        dog_documents.append(dog)
-        num_entries += 1
-        if num_entries % 10000 == 0:
-            result = collection.insert_many(dog_documents)
-            print(f"Inserted {len(result.inserted_ids)} rows to dog collection.")
-            dog_id_results += result.inserted_ids
-            dog_documents = []
-
-    if dog_documents:
-        result = collection.insert_many(dog_documents)
-        print(f"Inserted {len(result.inserted_ids)} rows to dog collection.")
-        dog_id_results += result.inserted_ids
-
-    return dog_id_results
 
+def save_load_plan(plan: Dict):
+    state = db[LOAD_STATE_COLLECTION]
+    state.delete_many({"_id": {"$ne": PLAN_ID}})
+    state.replace_one({"_id": PLAN_ID}, plan, upsert=True)
 
+
+def finish_load_plan():
+    state = db[LOAD_STATE_COLLECTION]
+    state.update_one({"_id": PLAN_ID}, {"$set": {"status": "done", "finished_at": utc_now()}})
+    state.delete_many({"_id": {"$ne": PLAN_ID}})
+
+
+def record_batch(collection_name: str, start: int, size: int):
+    db[LOAD_STATE_COLLECTION].replace_one({"_id": {"stage": collection_name, "start": start}},
+                                          {"size": size, "committed_at": utc_now()}, upsert=True)
+
+
+def pending_batches(plan: Dict, collection_name: str) -> List[Tuple[int, int]]:
+    """(start, size) of every batch of a stage without a checkpoint."""
+    committed = {checkpoint["_id"]["start"] for checkpoint in
+                 db[LOAD_STATE_COLLECTION].find({"_id.stage": collection_name}, {"_id": 1})}
+    start, end, batch_size = plan[collection_name]["start"], plan[collection_name]["end"], plan["batch_size"]
+    return [(batch_start, min(batch_size, end - batch_start)) for batch_start in range(start, end, batch_size)
+            if batch_start not in committed]
+
+
+def insert_raw_batch(collection, raw_documents: List[bytes]) -> int:
+    """Insert a generated batch; documents already present from an interrupted attempt are skipped.
+
+    Ids are deterministic, so a replayed document collides with its earlier copy. Returns the number inserted.
+    """
+    if isinstance(collection, Collection):
+        documents = [RawBSONDocument(raw) for raw in raw_documents]
+    else:
+        # In-process backends (the memory backend, mongomock in the benchmarks) get plain documents.
+        documents = [bson.decode(raw) for raw in raw_documents]
+    try:
+        return len(collection.insert_many(documents, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        errors = e.details["writeErrors"]
+        replayed = [documents[error["index"]]["_id"] for error in errors if error["code"] == DUPLICATE_KEY]
+        if len(replayed) < len(errors) or collection.count_documents({"_id": {"$in": replayed}}) < len(replayed):
+            raise
+        return e.details["nInserted"]
+
+
+@dataclass
+class StageReport:
+    collection: str
+    documents: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def docs_per_sec(self) -> float:
+        return self.documents / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_sec(self) -> float:
+        return self.bytes / (1024 * 1024) / self.seconds if self.seconds else 0.0
+
+
+def _drain_batches(collection, batches: "queue.Queue", report: StageReport, lock: threading.Lock,
+                   errors: List[BaseException]):
+    while True:
+        batch = batches.get()
+        if batch is None:
+            return
+        if errors:
+            continue
+        (start, size), raw_documents = batch
+        try:
+            inserted = insert_raw_batch(collection, raw_documents) if raw_documents else 0
+            record_batch(collection.name, start, size)
+        except Exception as e:
+            errors.append(e)
+            continue
+        with lock:
+            report.documents += inserted
+            report.bytes += sum(len(raw) for raw in raw_documents)
+
+
+@instrumented
+def run_serial_stage(collection_name: str, generate: Callable, tasks: Iterable, source: Dict) -> StageReport:
+    """Generate and write one batch at a time, checkpointing each."""
+    collection = db[collection_name]
+    report = StageReport(collection_name)
+    _init_generator_worker(source)
+    started = time.perf_counter()
+    for start, size in tasks:
+        raw_documents = generate((start, size))
+        inserted = insert_raw_batch(collection, raw_documents) if raw_documents else 0
+        record_batch(collection_name, start, size)
+        report.documents += inserted
+        report.bytes += sum(len(raw) for raw in raw_documents)
+        print(f"Inserted {inserted} rows to {collection_name} collection (Batch starting at {start}).")
+    report.seconds = time.perf_counter() - started
+
+    print(f"Inserted {report.documents} rows to {collection_name} collection in total.")
+    return report
+
+
+@instrumented
+def run_pipelined_stage(collection_name: str, generate: Callable, tasks: Iterable, source: Dict,
+                        workers: int, writers: int, queue_depth: int) -> StageReport:
+    """Generate batches in a process pool and drain them with unordered, checkpointed writes from writer threads."""
+    collection = db[collection_name]
+    report = StageReport(collection_name)
+    batches = queue.Queue(maxsize=queue_depth)
+    lock = threading.Lock()
+    errors = []
+
+    writer_threads = [threading.Thread(target=_drain_batches, args=(collection, batches, report, lock, errors),
+                                       daemon=True) for _ in range(writers)]
+    started = time.perf_counter()
+    for thread in writer_threads:
+        thread.start()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_generator_worker,
+                                 initargs=(source,)) as executor:
+            # Keep a bounded window of batches in flight so generation never runs far ahead of the writers.
+            pending = []
+            for task in tasks:
+                pending.append((task, executor.submit(generate, task)))
+                if len(pending) >= workers * 2:
+                    task, future = pending.pop(0)
+                    batches.put((task, future.result()))
+            for task, future in pending:
+                batches.put((task, future.result()))
+    finally:
+        for _ in writer_threads:
+            batches.put(None)
+        for thread in writer_threads:
+            thread.join()
+    report.seconds = time.perf_counter() - started
+
+    if errors:
+        raise errors[0]
+    print(f"Inserted {report.documents} rows to {collection_name} collection in total.")
+    return report
+
+
+def run_stage(generator: SyntheticDataGenerator, plan: Dict, collection_name: str, parallel: bool = False,
+              workers: int = os.cpu_count() or 1, writers: int = 4, queue_depth: int = 16) -> StageReport:
+    """Write every batch of one stage of ``plan`` that has no checkpoint yet.
+
+    Adoptions pick their owners from every owner up to the plan's end, so appended dogs can go to old owners too.
+    """
+    source = dict(generator=generator, num_owners=plan["owner"]["end"], ignore_frequency=plan["ignore_frequency"])
+    generate = STAGE_GENERATORS[collection_name]
+    tasks = pending_batches(plan, collection_name)
+    if parallel:
+        return run_pipelined_stage(collection_name, generate, tasks, source, workers=workers, writers=writers,
+                                   queue_depth=queue_depth)
+    return run_serial_stage(collection_name, generate, tasks, source)
+
+
+def run_load(generator: SyntheticDataGenerator, plan: Dict, **options) -> List[StageReport]:
+    """Run every stage of ``plan`` (see ``run_stage`` for the options), then mark the plan done."""
+    reports = [run_stage(generator, plan, collection_name, **options) for collection_name in STAGE_GENERATORS]
+    finish_load_plan()
+    return reports
+
+
+def print_load_report(reports: List[StageReport]):
+    print("\nLoad report")
+    print("-----------")
+    for report in reports:
+        print(f"{report.collection:<10} {report.documents:>12,} docs {report.seconds:>9.2f} s "
+              f"{report.docs_per_sec:>12,.0f} docs/s {report.mb_per_sec:>9.2f} MB/s")
+
+
+@instrumented
 def print_db_size():
     stats = db.command("dbStats")
     storage_size_bytes = stats["storageSize"]
@@ -180,27 +289,87 @@ def print_db_size():
     print(f"Database size: {storage_size_mb:.2f} MB ({storage_size_gb:.2f} GB)")
 
 
-if __name__ == "__main__":
-    print_db_size()
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load dummy owners, dogs and adoptions into MongoDB.")
+    parser.add_argument("--max-entries", type=int, default=100000, help="Number of owners and dogs to generate.")
+    parser.add_argument("--parallel", action="store_true",
+                        help="Generate batches in a process pool and write them from several threads.")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Documents per insert batch.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Generator processes.")
+    parser.add_argument("--writers", type=int, default=4, help="Writer threads.")
+    parser.add_argument("--queue-depth", type=int, default=16, help="Batches buffered between generators and writers.")
+    parser.add_argument("--seed", type=int, help="Seed for reproducible data; a random seed is used if omitted.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--append", action="store_true",
+                      help="Add --max-entries more owners and dogs to the existing data instead of reloading.")
+    mode.add_argument("--resume", action="store_true", help="Finish an interrupted load from its last checkpoints.")
+    return parser.parse_args()
 
-    clear_database()
 
-    dog_breed_data = get_dog_data()
-    breed_documents = get_breed_documents(dog_breed_data)
+def load_breed_references() -> List[Dict]:
+    return [breed_reference(breed) for breed in db["breed"].find({}, {"name": 1}).sort("_id", 1)]
 
-    owner_data = get_owner_data()
-    unique_names = get_random_names()
-    unique_countries = list(set([owner["Address"]["Country"] for owner in owner_data]))
-    unique_cities = list(set([owner["Address"]["City"] for owner in owner_data]))
-    unique_addresses = list(set([owner["Address"]["Address"] for owner in owner_data]))
-    max_entries = 100000
 
-    unique_owners = generate_dummy_owners(unique_names, unique_addresses, unique_cities, unique_countries, max_entries)
-    owner_ids = insert_owners(unique_owners)
+def start_load(breeds: List[Dict], max_entries: int, batch_size: int = 10000,
+               seed: Optional[int] = None) -> Tuple[Dict, List[Dict]]:
+    """Clear the database, insert ``breeds`` and save the plan of a fresh load of ``max_entries`` owners and dogs.
 
-    dog_inserted_ids = insert_dog(unique_names, breed_documents, unique_countries, max_entry=max_entries)
+    Returns the plan and the breed references to generate dogs with.
+    """
+    clear_database()
+    breed_references = insert_breeds(breeds)
+    seed = SyntheticDataGenerator.new_seed() if seed is None else seed
+    plan = new_load_plan(seed, utc_now(), batch_size, 10, (0, max_entries), (0, max_entries))
+    save_load_plan(plan)
+    return plan, breed_references
+
+
+def plan_load(args, source: SourceData) -> Tuple[Dict, List[Dict]]:
+    """The load plan for this run and the breed references to generate dogs with."""
+    if not args.append and not args.resume:
+        if source.breed_documents is None:
+            raise SystemExit("data/dog_breed_data.json is missing; it is needed for a fresh load.")
+        return start_load(source.breed_documents, args.max_entries, args.batch_size, args.seed)
+
+    plan = get_load_plan()
+    if plan is None:
+        raise SystemExit("No previous load found; run without --append/--resume first.")
+    if args.resume:
+        if plan["status"] != "running":
+            raise SystemExit("The last load finished; nothing to resume.")
+        return plan, load_breed_references()
+
+    if plan["status"] != "done":
+        raise SystemExit("The last load did not finish; run with --resume first.")
+    # Appended documents continue the index sequence, so their ids and emails never collide with existing ones.
+    owners_end, dogs_end = plan["owner"]["end"], plan["dog"]["end"]
+    plan = new_load_plan(plan["seed"], plan["reference_time"], args.batch_size, plan["ignore_frequency"],
+                         (owners_end, owners_end + args.max_entries), (dogs_end, dogs_end + args.max_entries))
+    save_load_plan(plan)
+    return plan, load_breed_references()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print_db_size()
 
-    adoption_insertion_result = insert_adoption(owner_ids, dog_inserted_ids,
-                                                ignore_frequency=10)
+    source = load_source_data()
+    plan, breed_references = plan_load(args, source)
+
+    generator = SyntheticDataGenerator(source.names, source.addresses, source.cities, source.countries,
+                                       breed_references, seed=plan["seed"], reference_time=plan["reference_time"])
+    print(f"Generating owners {plan['owner']['start']}-{plan['owner']['end'] - 1} and dogs "
+          f"{plan['dog']['start']}-{plan['dog']['end'] - 1} with seed {generator.seed}.")
+
+    load_reports = run_load(generator, plan, parallel=args.parallel, workers=args.workers, writers=args.writers,
+                            queue_depth=args.queue_depth)
+    print_load_report(load_reports)
+    # Building indexes once after the bulk load is much cheaper than maintaining them on every insert.
+    ensure_indexes(db)
+    build_facet_counts(db)
+    build_search_index(db)
+    build_rollups(db)
+    if backend() == "memory" and snapshot_path():
+        db.snapshot()
     print("Data loading successful.")
     print_db_size()
@@ -0,0 +1,154 @@
+import argparse
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import DeleteOne, UpdateOne
+from pymongo.database import Database
+
+from adoption_analytics import utc_now
+from connection import LazyDatabase
+
+db = LazyDatabase()
+
+STATS_COLLECTION = "stats"
+
+# Facet name -> (collection, field). Counts are stored as {"_id": {"facet", "value"}, "count"} in the stats
+# collection so every count is a single _id lookup.
+FACETS = {
+    "owner.city": ("owner", "address.city"),
+    "owner.zip": ("owner", "address.zip"),
+    "owner.country": ("owner", "address.country"),
+    "dog.breed": ("dog", "breed.name"),
+}
+
+BUILT_MARKER = "facet_counts"
+# Databases already known to have facet counts, so the check costs one round trip per process at most.
+built_databases = set()
+
+
+def facet_key(facet: str, value) -> Dict:
+    return {"facet": facet, "value": value}
+
+
+def _live_count_pipeline(collection_name: str):
+    facets = [(facet, field) for facet, (collection, field) in FACETS.items() if collection == collection_name]
+    return [
+        {"$project": {"_id": 0, "facets": [facet_key(facet, {"$ifNull": [f"${field}", None]})
+                                           for facet, field in facets]}},
+        {"$unwind": "$facets"},
+        {"$group": {"_id": "$facets", "count": {"$sum": 1}}},
+    ]
+
+
+def _collections() -> Iterable[str]:
+    return sorted({collection for collection, _ in FACETS.values()})
+
+
+def build_facet_counts(database: Database):
+    """Rebuild every facet count with one $group pass per source collection, written server-side."""
+    database[STATS_COLLECTION].delete_many({"_id.facet": {"$in": list(FACETS)}})
+    for collection_name in _collections():
+        database[collection_name].aggregate(_live_count_pipeline(collection_name) + [
+            {"$merge": {"into": STATS_COLLECTION, "whenMatched": "replace", "whenNotMatched": "insert"}}
+        ])
+    database[STATS_COLLECTION].update_one({"_id": BUILT_MARKER}, {"$set": {"built_at": utc_now()}},
+                                          upsert=True)
+    print("Built facet counts.")
+
+
+def facet_counts_built(database: Database) -> bool:
+    if database.name not in built_databases:
+        if database[STATS_COLLECTION].find_one({"_id": BUILT_MARKER}, {"_id": 1}) is None:
+            return False
+        built_databases.add(database.name)
+    return True
+
+
+def get_facet_count(database: Database, facet: str, value) -> int:
+    stats = database[STATS_COLLECTION].find_one({"_id": facet_key(facet, value)}, {"count": 1})
+    return stats["count"] if stats else 0
+
+
+def increment_requests(changes: Dict[str, Dict[object, int]]) -> List[UpdateOne]:
+    return [UpdateOne({"_id": facet_key(facet, value)}, {"$inc": {"count": delta}}, upsert=True)
+            for facet, deltas in changes.items() for value, delta in deltas.items() if delta]
+
+
+def increment_facets(database: Database, changes: Dict[str, Dict[object, int]], session=None):
+    """Apply ``{facet: {value: delta}}`` to the stored counts with one unordered bulk write.
+
+    Skipped until the counts are built: the build counts everything written before it, and an upserted decrement
+    would otherwise leave a negative count behind.
+    """
+    requests = increment_requests(changes)
+    if requests and facet_counts_built(database):
+        database[STATS_COLLECTION].bulk_write(requests, ordered=False, session=session)
+
+
+def merge_facet_changes(*changes: Dict[str, Dict[object, int]]) -> Dict[str, Dict[object, int]]:
+    merged = defaultdict(lambda: defaultdict(int))
+    for change in changes:
+        for facet, deltas in change.items():
+            for value, delta in deltas.items():
+                merged[facet][value] += delta
+    return merged
+
+
+def owner_facet_changes(owner: Dict, delta: int) -> Dict[str, Dict[object, int]]:
+    address = owner.get("address", {})
+    return {
+        "owner.city": {address.get("city"): delta},
+        "owner.zip": {address.get("zip"): delta},
+        "owner.country": {address.get("country"): delta},
+    }
+
+
+def reconcile_facet_counts(database: Database) -> int:
+    """Recount every facet and repair stored counts that drifted. Returns the number of counts repaired."""
+    stats = database[STATS_COLLECTION]
+    live = {}
+    for collection_name in _collections():
+        for row in database[collection_name].aggregate(_live_count_pipeline(collection_name)):
+            live[(row["_id"]["facet"], row["_id"]["value"])] = row["count"]
+
+    requests = []
+    for stored in stats.find({"_id.facet": {"$in": list(FACETS)}}):
+        key = (stored["_id"]["facet"], stored["_id"]["value"])
+        count = live.pop(key, 0)
+        if count == 0:
+            requests.append(DeleteOne({"_id": stored["_id"]}))
+        elif count != stored["count"]:
+            requests.append(UpdateOne({"_id": stored["_id"]}, {"$set": {"count": count}}))
+    requests += [UpdateOne({"_id": facet_key(facet, value)}, {"$set": {"count": count}}, upsert=True)
+                 for (facet, value), count in live.items()]
+
+    if requests:
+        stats.bulk_write(requests, ordered=False)
+    stats.update_one({"_id": BUILT_MARKER}, {"$set": {"reconciled_at": utc_now()}}, upsert=True)
+    print(f"Reconciled facet counts; repaired {len(requests)} count(s).")
+    return len(requests)
+
+
+def run_reconcile_loop(database: Database, interval_seconds: float, iterations: Optional[int] = None):
+    completed = 0
+    while True:
+        reconcile_facet_counts(database)
+        completed += 1
+        if iterations is not None and completed >= iterations:
+            return
+        time.sleep(interval_seconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the precomputed owner and dog facet counts.")
+    parser.add_argument("command", choices=["build", "reconcile"])
+    parser.add_argument("--every", type=float, help="Keep reconciling, sleeping this many seconds between runs.")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_facet_counts(db)
+    elif args.every:
+        run_reconcile_loop(db, args.every)
+    else:
+        reconcile_facet_counts(db)
@@ -0,0 +1,107 @@
+import argparse
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.database import Database
+from pymongo.errors import OperationFailure
+
+from connection import LazyDatabase
+
+db = LazyDatabase()
+_log = logging.getLogger("pet_adoption.indexes")
+
+# Every index the queries in app.py rely on, by collection.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "owner": [
+        # Trailing _id keeps the keyset-paged searches a single index range scan.
+        IndexModel([("address.city", ASCENDING), ("_id", ASCENDING)], name="address_city_id"),
+        IndexModel([("address.zip", ASCENDING), ("_id", ASCENDING)], name="address_zip_id"),
+        IndexModel([("address.country", ASCENDING), ("_id", ASCENDING)], name="address_country_id"),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        # Owner search: prefix ranges over the normalized keys.
+        IndexModel([("search.name", ASCENDING)], name="search_name"),
+        IndexModel([("search.email", ASCENDING)], name="search_email"),
+    ],
+    "breed": [
+        IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+    ],
+    "dog": [
+        IndexModel([("breed.name", ASCENDING), ("name", ASCENDING), ("_id", ASCENDING)], name="breed_name_name_id"),
+        IndexModel([("adoption_id", ASCENDING), ("_id", ASCENDING)], name="adoption_id_id"),
+    ],
+    "stats": [
+        # Picker top-N: equality on the facet, then already in count order.
+        IndexModel([("_id.facet", ASCENDING), ("count", DESCENDING), ("_id.value", ASCENDING)],
+                   name="facet_count_value"),
+    ],
+    "adoption": [
+        IndexModel([("owner_id", ASCENDING)], name="owner_id"),
+        IndexModel([("dog_id", ASCENDING)], name="dog_id"),
+        IndexModel([("adoption_date", ASCENDING)], name="adoption_date"),
+    ],
+    "adoption_rollups": [
+        # Equality on dimension and granularity, then a range over bucket starts.
+        IndexModel([("_id.dimension", ASCENDING), ("_id.granularity", ASCENDING), ("_id.start", ASCENDING)],
+                   name="dimension_granularity_start"),
+    ],
+}
+
+
+def _build_indexes(database: Database, report: Callable[[str], None] = print, warn: Callable[[str], None] = print):
+    for collection_name, indexes in INDEXES.items():
+        collection = database[collection_name]
+        for index in indexes:
+            try:
+                collection.create_indexes([index])
+            except OperationFailure as e:
+                warn(f"Could not build index {collection_name}.{index.document['name']}: {e}")
+    report("Indexes are up to date.")
+
+
+def ensure_indexes(database: Database, wait: bool = True) -> Optional[threading.Thread]:
+    """Create any declared index that is missing.
+
+    Building an index that already exists is a no-op on the server. With ``wait=False`` the builds run on a
+    daemon thread so callers such as the console app can start serving straight away; that thread reports through
+    the ``pet_adoption.indexes`` logger instead of printing into whatever the caller is writing to stdout.
+    """
+    if wait:
+        _build_indexes(database)
+        return None
+    thread = threading.Thread(target=_build_indexes, args=(database, _log.info, _log.warning), daemon=True)
+    thread.start()
+    return thread
+
+
+def index_report(database: Database) -> Dict[str, Dict[str, List[str]]]:
+    """Compare declared indexes with the server: missing, never used since startup, and undeclared."""
+    report = {}
+    for collection_name, indexes in INDEXES.items():
+        collection = database[collection_name]
+        declared = {index.document["name"] for index in indexes}
+        usage = {stats["name"]: stats["accesses"]["ops"] for stats in collection.aggregate([{"$indexStats": {}}])}
+        report[collection_name] = {
+            "missing": sorted(declared - usage.keys()),
+            "unused": sorted(name for name, ops in usage.items() if ops == 0 and name != "_id_"),
+            "undeclared": sorted(usage.keys() - declared - {"_id_"}),
+        }
+    return report
+
+
+def print_index_report(database: Database):
+    for collection_name, findings in index_report(database).items():
+        print(f"\n{collection_name}")
+        for finding, names in findings.items():
+            print(f"  {finding}: {', '.join(names) if names else '-'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the indexes used by the pet adoption queries.")
+    parser.add_argument("--report", action="store_true", help="Only report missing, unused and undeclared indexes.")
+    args = parser.parse_args()
+
+    if not args.report:
+        ensure_indexes(db)
+    print_index_report(db)
@@ -0,0 +1,264 @@
+"""Opt-in timing, round-trip accounting and slow-query capture for the database functions.
+
+Set ``PET_ADOPTION_INSTRUMENT=1`` to enable. When it is unset, ``instrumented`` returns the function unchanged and
+no command listener is registered, so there is no overhead at all.
+
+Other settings, all optional:
+
+- ``PET_ADOPTION_SLOW_MS``: calls slower than this (default 100) have their read commands explained with
+  ``executionStats`` and written to the slow-query log, by a background thread so the caller does not wait for it.
+- ``PET_ADOPTION_SLOW_LOG``: log path (default ``slow_queries.log``), rotated at 10 MB. Failed calls are logged here
+  with their traceback too.
+- ``PET_ADOPTION_METRICS_PORT``: serve ``prometheus_text()`` over HTTP on this port from the console app.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+from typing import Callable, Dict, List
+
+import bson
+from pymongo import monitoring
+
+from connection import get_client, pool_stats
+
+ENABLED = os.environ.get("PET_ADOPTION_INSTRUMENT", "").lower() not in ("", "0", "false", "no")
+SLOW_QUERY_MS = float(os.environ.get("PET_ADOPTION_SLOW_MS", "100"))
+SLOW_QUERY_LOG = os.environ.get("PET_ADOPTION_SLOW_LOG", "slow_queries.log")
+
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct"}
+# Latency histogram bucket upper bounds, in seconds.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def sum_plan_key(document, key: str) -> int:
+    """Sum every integer ``key`` in an explain document, e.g. ``totalDocsExamined`` across all stages."""
+    if isinstance(document, dict):
+        return sum(value if name == key and isinstance(value, int) else sum_plan_key(value, key)
+                   for name, value in document.items())
+    if isinstance(document, list):
+        return sum(sum_plan_key(item, key) for item in document)
+    return 0
+
+
+class FunctionMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.round_trips = 0
+        self.docs_returned = 0
+        self.bytes_received = 0
+        self.buckets = [0] * len(BUCKETS)
+
+
+class _Call:
+    def __init__(self, name: str):
+        self.name = name
+        self.round_trips = 0
+        self.docs_returned = 0
+        self.bytes_received = 0
+        self.commands: List[Dict] = []
+
+
+_metrics: Dict[str, FunctionMetrics] = {}
+_metrics_lock = threading.Lock()
+_local = threading.local()
+# Explains and slow-query log writes run here, one at a time, after the call has been timed and returned.
+_slow_log_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-log")
+
+
+def _current_calls() -> List[_Call]:
+    return getattr(_local, "calls", None) or []
+
+
+class _CommandTracker(monitoring.CommandListener):
+    """Attributes each command to every instrumented call running on the same thread.
+
+    A public function that wraps an instrumented ``*_page`` helper is credited with the helper's commands as well as
+    the helper itself, so its round trips, documents and bytes are totals for the whole call.
+    """
+
+    def started(self, event):
+        calls = _current_calls()
+        if not calls:
+            return
+        command = None
+        if event.command_name in EXPLAINABLE_COMMANDS:
+            command = {"database": event.database_name,
+                       "command": {key: value for key, value in event.command.items()
+                                   if not key.startswith("$") and key not in ("lsid", "txnNumber")}}
+        for call in calls:
+            call.round_trips += 1
+            if command:
+                call.commands.append(command)
+
+    def succeeded(self, event):
+        calls = _current_calls()
+        if not calls:
+            return
+        reply = event.reply
+        size = len(bson.encode(reply))
+        cursor = reply.get("cursor")
+        docs = len(cursor.get("firstBatch", cursor.get("nextBatch", []))) if cursor else 0
+        for call in calls:
+            call.bytes_received += size
+            call.docs_returned += docs
+
+    def failed(self, event):
+        pass
+
+
+_logger = None
+
+
+def _log() -> logging.Logger:
+    global _logger
+    if _logger is None:
+        _logger = logging.getLogger("pet_adoption.instrumentation")
+        _logger.propagate = False
+        _logger.setLevel(logging.INFO)
+        _logger.addHandler(RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=10 * 1024 * 1024, backupCount=5))
+    return _logger
+
+
+def _explain(commands: List[Dict]) -> List[Dict]:
+    plans = []
+    for entry in commands:
+        try:
+            plan = get_client()[entry["database"]].command(
+                {"explain": entry["command"], "verbosity": "executionStats"})
+        except Exception as e:
+            plans.append({"command": entry["command"], "error": str(e)})
+            continue
+        plans.append({
+            "command": entry["command"],
+            "docs_examined": sum_plan_key(plan, "totalDocsExamined"),
+            "keys_examined": sum_plan_key(plan, "totalKeysExamined"),
+            "winning_plan": plan.get("queryPlanner", {}).get("winningPlan"),
+        })
+    return plans
+
+
+def _record(call: _Call, seconds: float, failed: bool):
+    with _metrics_lock:
+        metrics = _metrics.setdefault(call.name, FunctionMetrics())
+        metrics.calls += 1
+        metrics.errors += failed
+        metrics.seconds += seconds
+        metrics.round_trips += call.round_trips
+        metrics.docs_returned += call.docs_returned
+        metrics.bytes_received += call.bytes_received
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                metrics.buckets[index] += 1
+                break
+
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        _slow_log_executor.submit(_log_slow_call, call, seconds, time.time())
+
+
+def _log_slow_call(call: _Call, seconds: float, finished: float):
+    try:
+        _log().info(json.dumps({
+            "time": finished,
+            "function": call.name,
+            "ms": seconds * 1000,
+            "round_trips": call.round_trips,
+            "docs_returned": call.docs_returned,
+            "bytes_received": call.bytes_received,
+            "explain": _explain(call.commands),
+        }, default=str))
+    except Exception:
+        _log().exception("Could not log slow call to %s", call.name)
+
+
+def instrumented(function: Callable) -> Callable:
+    if not ENABLED:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        call = _Call(function.__name__)
+        calls = _local.__dict__.setdefault("calls", [])
+        calls.append(call)
+        started = time.perf_counter()
+        failed = False
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            failed = True
+            _log().exception("%s failed", call.name)
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            calls.pop()
+            _record(call, seconds, failed)
+
+    return wrapper
+
+
+def metrics_snapshot() -> Dict[str, FunctionMetrics]:
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+def prometheus_text() -> str:
+    counters = [
+        ("calls_total", "Calls per function.", "calls"),
+        ("errors_total", "Calls that raised.", "errors"),
+        ("round_trips_total", "Database commands sent.", "round_trips"),
+        ("docs_returned_total", "Documents received in cursor batches.", "docs_returned"),
+        ("bytes_received_total", "BSON bytes received in replies.", "bytes_received"),
+    ]
+    snapshot = metrics_snapshot()
+    lines = []
+    for suffix, help_text, attribute in counters:
+        lines += [f"# HELP pet_adoption_{suffix} {help_text}", f"# TYPE pet_adoption_{suffix} counter"]
+        lines += [f'pet_adoption_{suffix}{{function="{name}"}} {getattr(metrics, attribute)}'
+                  for name, metrics in sorted(snapshot.items())]
+
+    lines += ["# HELP pet_adoption_call_duration_seconds Wall time per call.",
+              "# TYPE pet_adoption_call_duration_seconds histogram"]
+    for name, metrics in sorted(snapshot.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS, metrics.buckets):
+            cumulative += count
+            lines.append(f'pet_adoption_call_duration_seconds_bucket{{function="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'pet_adoption_call_duration_seconds_bucket{{function="{name}",le="+Inf"}} {metrics.calls}')
+        lines.append(f'pet_adoption_call_duration_seconds_sum{{function="{name}"}} {metrics.seconds}')
+        lines.append(f'pet_adoption_call_duration_seconds_count{{function="{name}"}} {metrics.calls}')
+
+    lines += ["# HELP pet_adoption_pool Connection pool counters of the shared client.",
+              "# TYPE pet_adoption_pool gauge"]
+    lines += [f'pet_adoption_pool{{stat="{stat}"}} {value}' for stat, value in pool_stats.snapshot().items()]
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if ENABLED:
+    # Must be registered before the clients in app.py and data_loader.py are created.
+    monitoring.register(_CommandTracker())
@@ -0,0 +1,1296 @@
+"""An in-process database engine with pymongo's interface, for tests, benchmarks and offline kiosks.
+
+``MemoryDatabase`` implements the part of the pymongo Database/Collection API the modules here use: find with
+filters, projections, sorts and limits; the insert/update/delete/bulk_write family; and aggregation with the stages
+and expressions our pipelines need. Everything in ``app.py`` runs against it unchanged. Select it with
+``PET_ADOPTION_BACKEND=memory`` (see connection.py), or construct one directly.
+
+Each collection keeps its documents in a dict by ``_id``. Indexes declared with ``create_indexes`` (indexes.py
+declares the same ones as on mongod) are maintained on every write: a hash map from the leading field to ``_id``s for
+equality and ``$in`` lookups, and a sorted key list for ranges and for sorts, so a keyset page reads just the page.
+Queries no index serves scan the collection.
+
+The whole database can be written to and restored from a BSON snapshot file.
+"""
+import bisect
+import functools
+import os
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import bson
+from bson import ObjectId
+from bson.raw_bson import RawBSONDocument
+from pymongo import DeleteMany, DeleteOne, IndexModel, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+DUPLICATE_KEY = 11000
+# Sorted indexes are re-sorted on the next read, rather than updated in place, after inserts of more documents.
+RESORT_THRESHOLD = 64
+
+
+class _Missing:
+    def __repr__(self):
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+def sort_key(value) -> tuple:
+    """A key that orders values the way MongoDB does across types; missing sorts as null."""
+    if value is None or value is MISSING:
+        return (1,)
+    if isinstance(value, bool):
+        return (8, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    if isinstance(value, dict):
+        return (4, tuple((key, sort_key(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (5, tuple(sort_key(item) for item in value))
+    if isinstance(value, bytes):
+        return (6, value)
+    if isinstance(value, ObjectId):
+        return (7, value.binary)
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return (9, value)
+    return (10, str(value))
+
+
+@functools.total_ordering
+class _Descending:
+    """Reverses the order of a sort key, for descending index fields."""
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return isinstance(other, _Descending) and self.key == other.key
+
+    def __lt__(self, other):
+        if not isinstance(other, _Descending):
+            return NotImplemented
+        return self.key > other.key
+
+
+class _Max:
+    """Sorts after every key; closes a range over an index key prefix."""
+
+    def __eq__(self, other):
+        return isinstance(other, _Max)
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return not isinstance(other, _Max)
+
+
+_MAX = _Max()
+
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+# Paths and values
+
+
+def get_path(value, path: str):
+    """A dotted path's value, mapping over arrays as aggregation does; MISSING if absent."""
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, MISSING)
+        elif isinstance(value, list):
+            if part.isdigit():
+                value = value[int(part)] if int(part) < len(value) else MISSING
+            else:
+                value = [item for item in (get_path(element, part) for element in value) if item is not MISSING]
+        else:
+            return MISSING
+        if value is MISSING:
+            return MISSING
+    return value
+
+
+def _query_values(document: Dict, path: str) -> List:
+    """Every value a query on ``path`` compares against: the value itself plus, for arrays, its elements."""
+    value = get_path(document, path)
+    if value is MISSING:
+        return []
+    return [value] + value if isinstance(value, list) else [value]
+
+
+def set_path(document: Dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[last] = value
+
+
+def unset_path(document: Dict, path: str):
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(last, None)
+
+
+# Query matching
+
+_TYPES = {
+    "string": str, "object": dict, "array": list, "objectId": ObjectId, "date": datetime, "bool": bool,
+    "int": int, "long": int, "double": float, "number": (int, float), "null": type(None),
+}
+
+
+def _equal(left, right) -> bool:
+    return sort_key(left) == sort_key(right)
+
+
+def _compare(values: List, argument, test: Callable[[tuple, tuple], bool]) -> bool:
+    # Range operators only compare values of the same BSON type bracket, as on the server.
+    target = sort_key(argument)
+    return any(sort_key(value)[0] == target[0] and test(sort_key(value), target) for value in values)
+
+
+def _regex(pattern, options: str = ""):
+    if isinstance(pattern, re.Pattern):
+        return pattern
+    flags = 0
+    for option, flag in (("i", re.IGNORECASE), ("m", re.MULTILINE), ("s", re.DOTALL), ("x", re.VERBOSE)):
+        if option in options:
+            flags |= flag
+    return re.compile(pattern, flags)
+
+
+def _match_operator(values: List, operator: str, argument, condition: Dict) -> bool:
+    if operator == "$eq":
+        if argument is None and not values:
+            return True
+        if isinstance(argument, re.Pattern):
+            return any(isinstance(value, str) and argument.search(value) for value in values)
+        return any(_equal(value, argument) for value in values)
+    if operator == "$ne":
+        return not _match_operator(values, "$eq", argument, condition)
+    if operator == "$in":
+        return any(_match_operator(values, "$eq", item, condition) for item in argument)
+    if operator == "$nin":
+        return not _match_operator(values, "$in", argument, condition)
+    if operator == "$gt":
+        return _compare(values, argument, lambda left, right: left > right)
+    if operator == "$gte":
+        return _compare(values, argument, lambda left, right: left >= right)
+    if operator == "$lt":
+        return _compare(values, argument, lambda left, right: left < right)
+    if operator == "$lte":
+        return _compare(values, argument, lambda left, right: left <= right)
+    if operator == "$exists":
+        return bool(values) == bool(argument)
+    if operator == "$regex":
+        pattern = _regex(argument, condition.get("$options", ""))
+        return any(isinstance(value, str) and pattern.search(value) for value in values)
+    if operator == "$options":
+        return True
+    if operator == "$type":
+        names = argument if isinstance(argument, list) else [argument]
+        return any(isinstance(value, _TYPES[name]) and not (name != "bool" and isinstance(value, bool))
+                   for name in names for value in values)
+    if operator == "$not":
+        return not _match_condition(values, argument)
+    if operator == "$size":
+        return any(isinstance(value, list) and len(value) == argument for value in values[:1])
+    if operator == "$elemMatch":
+        return any(isinstance(value, list) and any(isinstance(item, dict) and matches(item, argument)
+                                                   for item in value) for value in values[:1])
+    raise OperationFailure(f"unknown operator: {operator}")
+
+
+def _is_operator_condition(condition) -> bool:
+    return isinstance(condition, dict) and bool(condition) and all(key.startswith("$") for key in condition)
+
+
+def _match_condition(values: List, condition) -> bool:
+    if _is_operator_condition(condition):
+        return all(_match_operator(values, operator, argument, condition) for operator, argument in condition.items())
+    return _match_operator(values, "$eq", condition, {})
+
+
+def matches(document: Dict, query: Dict) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(document, branch) for branch in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(document, branch) for branch in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(document, branch) for branch in condition):
+                return False
+        elif key == "$expr":
+            if not evaluate(condition, document):
+                return False
+        elif key.startswith("$"):
+            raise OperationFailure(f"unknown top level operator: {key}")
+        elif not _match_condition(_query_values(document, key), condition):
+            return False
+    return True
+
+
+def _equalities(query: Dict) -> Dict[str, List]:
+    """Fields the query pins to one value (or a list of values, for $in), usable for index lookups."""
+    pinned = {}
+    for key, condition in query.items():
+        if key == "$and":
+            for branch in condition:
+                pinned.update(_equalities(branch))
+        elif key.startswith("$"):
+            continue
+        elif not _is_operator_condition(condition):
+            if not isinstance(condition, (list, re.Pattern)):
+                pinned[key] = [condition]
+        elif "$eq" in condition:
+            pinned[key] = [condition["$eq"]]
+        elif "$in" in condition and not any(isinstance(item, (list, re.Pattern)) for item in condition["$in"]):
+            pinned[key] = list(condition["$in"])
+    return pinned
+
+
+def _bounds(query: Dict, field: str) -> Tuple[Optional[object], Optional[object]]:
+    """Inclusive (low, high) bounds the query puts on ``field``, None where unbounded; the query still filters.
+
+    Follows $and, and $or when every branch bounds the field, so keyset page filters become index ranges.
+    """
+    lows, highs = [], []
+    for key, condition in query.items():
+        if key == "$and":
+            for branch in condition:
+                low, high = _bounds(branch, field)
+                lows.append(low)
+                highs.append(high)
+        elif key == "$or":
+            branches = [_bounds(branch, field) for branch in condition]
+            if all(low is not None for low, _ in branches):
+                lows.append(min((low for low, _ in branches), key=sort_key))
+            if all(high is not None for _, high in branches):
+                highs.append(max((high for _, high in branches), key=sort_key))
+        elif key == field:
+            if _is_operator_condition(condition):
+                lows.append(condition.get("$gte", condition.get("$gt", condition.get("$eq"))))
+                highs.append(condition.get("$lte", condition.get("$lt", condition.get("$eq"))))
+            elif not isinstance(condition, (list, dict, re.Pattern)):
+                lows.append(condition)
+                highs.append(condition)
+    lows = [low for low in lows if low is not None]
+    highs = [high for high in highs if high is not None]
+    return (max(lows, key=sort_key) if lows else None), (min(highs, key=sort_key) if highs else None)
+
+
+# Projection and sorting
+
+
+def project(document: Dict, projection: Optional[Dict]) -> Dict:
+    """A copy of ``document`` with a find-style inclusion or exclusion projection applied."""
+    if not projection:
+        return _copy(document)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = bool(projection.get("_id", 1))
+    included = [field for field, flag in projection.items() if field != "_id" and flag]
+    if included or all(projection.values()):
+        result = {"_id": _copy(document["_id"])} if include_id and "_id" in document else {}
+        for field in included:
+            value = get_path(document, field)
+            if value is not MISSING:
+                set_path(result, field, _copy(value))
+        return result
+
+    result = _copy(document)
+    for field, flag in projection.items():
+        if not flag:
+            unset_path(result, field)
+    return result
+
+
+def _normalize_sort(sort, direction=None) -> List[Tuple[str, int]]:
+    if sort is None:
+        return []
+    if isinstance(sort, str):
+        return [(sort, direction or 1)]
+    if isinstance(sort, dict):
+        return list(sort.items())
+    return [(field, order) for field, order in sort]
+
+
+def sort_documents(documents: List[Dict], sort: List[Tuple[str, int]]) -> List[Dict]:
+    for field, direction in reversed(sort):
+        documents.sort(key=lambda document: sort_key(get_path(document, field)), reverse=direction < 0)
+    return documents
+
+
+# Indexes
+
+
+class MemoryIndex:
+    def __init__(self, name: str, keys: List[Tuple[str, int]], unique: bool = False):
+        self.name = name
+        self.keys = keys
+        self.fields = [field for field, _ in keys]
+        self.unique = unique
+        # Leading field value -> ids, for equality lookups.
+        self.hashed: Dict[tuple, set] = defaultdict(set)
+        # Sorted (key, id) entries; None until the next read after a bulk insert.
+        self.entries: Optional[List[tuple]] = []
+        self.document_keys: Dict[tuple, tuple] = {}
+        self.unique_keys: Dict[tuple, tuple] = {}
+
+    def spec(self) -> Dict:
+        return {"name": self.name, "key": [[field, direction] for field, direction in self.keys],
+                "unique": self.unique}
+
+    def key(self, document: Dict) -> tuple:
+        return tuple(sort_key(get_path(document, field)) if direction >= 0
+                     else _Descending(sort_key(get_path(document, field))) for field, direction in self.keys)
+
+    def check(self, document: Dict, id_key: tuple):
+        if self.unique:
+            owner = self.unique_keys.get(self._unique_key(document))
+            if owner is not None and owner != id_key:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection index: {self.name} dup key",
+                                        DUPLICATE_KEY)
+
+    def _unique_key(self, document: Dict) -> tuple:
+        return tuple(sort_key(get_path(document, field)) for field in self.fields)
+
+    def add(self, id_key: tuple, document: Dict, many: bool = False):
+        key = self.key(document)
+        self.document_keys[id_key] = key
+        self.hashed[sort_key(get_path(document, self.fields[0]))].add(id_key)
+        if self.unique:
+            self.unique_keys[self._unique_key(document)] = id_key
+        if self.entries is not None:
+            if many:
+                self.entries = None
+            else:
+                bisect.insort(self.entries, (key, id_key))
+
+    def remove(self, id_key: tuple, document: Dict):
+        key = self.document_keys.pop(id_key)
+        leading = sort_key(get_path(document, self.fields[0]))
+        self.hashed[leading].discard(id_key)
+        if not self.hashed[leading]:
+            del self.hashed[leading]
+        if self.unique:
+            self.unique_keys.pop(self._unique_key(document), None)
+        if self.entries is not None:
+            position = bisect.bisect_left(self.entries, (key, id_key))
+            del self.entries[position]
+
+    def sorted_entries(self) -> List[tuple]:
+        if self.entries is None:
+            self.entries = sorted((key, id_key) for id_key, key in self.document_keys.items())
+        return self.entries
+
+    def scan(self, prefix: tuple, low=None, high=None, reverse: bool = False) -> Iterator[tuple]:
+        """Ids in index order whose key starts with ``prefix``, optionally bounded on the next (ascending) field.
+
+        Ids are produced lazily, so a limited query stops reading the index once it has enough.
+        """
+        entries = self.sorted_entries()
+        lower = prefix + ((sort_key(low),) if low is not None else ())
+        upper = prefix + ((sort_key(high),) if high is not None else ()) + (_MAX,)
+        start = bisect.bisect_left(entries, (lower,))
+        end = bisect.bisect_right(entries, (upper,))
+        positions = range(end - 1, start - 1, -1) if reverse else range(start, end)
+        return (entries[position][1] for position in positions)
+
+
+# Cursor
+
+
+class MemoryCursor:
+    """A lazily run ``find``: chain ``sort``/``skip``/``limit`` then iterate."""
+
+    def __init__(self, collection: "MemoryCollection", query: Dict, projection: Optional[Dict]):
+        self.collection = collection
+        self.query = query or {}
+        self.projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: Optional[Iterator[Dict]] = None
+
+    def sort(self, key_or_list, direction=None) -> "MemoryCursor":
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count: int) -> "MemoryCursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "MemoryCursor":
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int) -> "MemoryCursor":
+        return self
+
+    def hint(self, index) -> "MemoryCursor":
+        return self
+
+    def explain(self) -> Dict:
+        """The plan this cursor runs, shaped like the server's executionStats explain output."""
+        stats = {}
+        found = self.collection.select(self.query, self._sort, self._skip, abs(self._limit), stats)
+        plan = {"stage": "IXSCAN", "indexName": stats["index"]} if stats["index"] else {"stage": "COLLSCAN"}
+        return {"queryPlanner": {"winningPlan": plan},
+                "executionStats": {"nReturned": len(found), "totalDocsExamined": stats["examined"]}}
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Dict:
+        if self._results is None:
+            documents = self.collection.select(self.query, self._sort, self._skip, abs(self._limit))
+            self._results = iter([project(document, self.projection) for document in documents])
+        return next(self._results)
+
+    def close(self):
+        self._results = iter(())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Collections
+
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self.documents: Dict[tuple, Dict] = {}
+        self.indexes: Dict[str, MemoryIndex] = {"_id_": MemoryIndex("_id_", [("_id", 1)], unique=True)}
+
+    @property
+    def _lock(self):
+        return self.database.lock
+
+    # Reads
+
+    def _plan(self, query: Dict, sort: List[Tuple[str, int]]) -> Tuple[Iterable[tuple], bool, Optional[str]]:
+        """Candidate ids for ``query``, whether they already come in ``sort`` order, and the index used.
+
+        Indexes are ranked by how many of their leading fields the query pins to one value, then by whether it is a
+        $in on their first field, whether it bounds the next field, and only then by whether they match ``sort``.
+        """
+        equalities = _equalities(query)
+        pinned = {field: values[0] for field, values in equalities.items() if len(values) == 1}
+        best, best_rank = None, None
+        for index in self.indexes.values():
+            leading = 0
+            while leading < len(index.fields) and index.fields[leading] in pinned:
+                leading += 1
+            rest = index.keys[leading:]
+            low, high = _bounds(query, rest[0][0]) if rest and rest[0][1] >= 0 else (None, None)
+            reverse = None
+            if sort and [field for field, _ in rest[:len(sort)]] == [field for field, _ in sort]:
+                same = [direction == index_direction for (_, direction), (_, index_direction) in zip(sort, rest)]
+                reverse = False if all(same) else True if not any(same) else None
+            hashed = not leading and index.fields[0] in equalities
+            rank = (leading, hashed, low is not None or high is not None, reverse is not None)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = (index, leading, low, high, reverse, hashed), rank
+
+        index, leading, low, high, reverse, hashed = best
+        if not any(best_rank):
+            return list(self.documents), False, None
+        if hashed:
+            ids = set()
+            for value in equalities[index.fields[0]]:
+                ids |= index.hashed.get(sort_key(value), set())
+            return sorted(ids), False, index.name
+        prefix = tuple(sort_key(pinned[field]) if direction >= 0 else _Descending(sort_key(pinned[field]))
+                       for field, direction in index.keys[:leading])
+        return index.scan(prefix, low, high, bool(reverse)), reverse is not None, index.name
+
+    def select(self, query: Dict, sort: List[Tuple[str, int]] = (), skip: int = 0, limit: int = 0,
+               stats: Optional[Dict] = None) -> List[Dict]:
+        """Matching stored documents (not copies), sorted, skipped and limited.
+
+        ``stats``, if given, is filled in with the index used (None for a full scan) and the documents examined.
+        """
+        sort = list(sort)
+        with self._lock:
+            ids, ordered, index_name = self._plan(query, sort)
+            # Candidates already in the order asked for (or no order at all) can stop at the limit.
+            stop = skip + limit if limit and (ordered or not sort) else 0
+            found = []
+            examined = 0
+            for id_key in ids:
+                document = self.documents.get(id_key)
+                if document is None:
+                    continue
+                examined += 1
+                if matches(document, query):
+                    found.append(document)
+                    if stop and len(found) >= stop:
+                        break
+            if sort and not ordered:
+                sort_documents(found, sort)
+            if stats is not None:
+                stats.update(index=index_name, examined=examined)
+            return found[skip:skip + limit] if limit else found[skip:]
+
+    def find(self, filter: Optional[Dict] = None, projection: Optional[Dict] = None, sort=None, skip: int = 0,
+             limit: int = 0, session=None, **kwargs) -> MemoryCursor:
+        cursor = MemoryCursor(self, filter, projection).skip(skip).limit(limit)
+        return cursor.sort(sort) if sort else cursor
+
+    def find_one(self, filter=None, projection: Optional[Dict] = None, sort=None, session=None,
+                 **kwargs) -> Optional[Dict]:
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        return next(self.find(filter, projection, sort=sort, limit=1), None)
+
+    def count_documents(self, filter: Dict, session=None, **kwargs) -> int:
+        return len(self.select(filter, skip=kwargs.get("skip", 0), limit=kwargs.get("limit", 0)))
+
+    def estimated_document_count(self, **kwargs) -> int:
+        return len(self.documents)
+
+    def distinct(self, key: str, filter: Optional[Dict] = None, session=None) -> List:
+        values = {}
+        for document in self.select(filter or {}):
+            for value in _query_values(document, key):
+                if not isinstance(value, list):
+                    values.setdefault(sort_key(value), value)
+        return list(values.values())
+
+    # Writes
+
+    def _insert(self, document: Dict, many: bool = False) -> object:
+        if isinstance(document, RawBSONDocument):
+            document = bson.decode(document.raw)
+        document.setdefault("_id", ObjectId())
+        stored = _copy(document)
+        id_key = sort_key(stored["_id"])
+        if id_key in self.documents:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_ dup key",
+                                    DUPLICATE_KEY)
+        for index in self.indexes.values():
+            index.check(stored, id_key)
+        self.documents[id_key] = stored
+        for index in self.indexes.values():
+            index.add(id_key, stored, many)
+        return stored["_id"]
+
+    def _replace_stored(self, old: Dict, new: Dict):
+        id_key = sort_key(old["_id"])
+        for index in self.indexes.values():
+            index.check(new, id_key)
+        for index in self.indexes.values():
+            index.remove(id_key, old)
+        self.documents[id_key] = new
+        for index in self.indexes.values():
+            index.add(id_key, new)
+
+    def _delete_stored(self, document: Dict):
+        id_key = sort_key(document["_id"])
+        del self.documents[id_key]
+        for index in self.indexes.values():
+            index.remove(id_key, document)
+
+    def insert_one(self, document: Dict, session=None, **kwargs) -> InsertOneResult:
+        with self._lock:
+            return InsertOneResult(self._insert(document), True)
+
+    def insert_many(self, documents: Iterable[Dict], ordered: bool = True, session=None,
+                    **kwargs) -> InsertManyResult:
+        result = self.bulk_write([InsertOne(document) for document in documents], ordered=ordered)
+        return InsertManyResult(result.bulk_api_result["insertedIds"], True)
+
+    def _update(self, query: Dict, update, upsert: bool, many: bool, replace: bool = False) -> Dict:
+        targets = self.select(query, limit=0 if many else 1)
+        if not targets:
+            if not upsert:
+                return {"n": 0, "nModified": 0}
+            document = {field: _copy(values[0]) for field, values in _equalities(query).items()
+                        if len(values) == 1 and "." not in field}
+            for field, values in _equalities(query).items():
+                if "." in field and len(values) == 1:
+                    set_path(document, field, _copy(values[0]))
+            document = dict(update, _id=document.get("_id", update.get("_id"))) if replace \
+                else apply_update(document, update, inserting=True)
+            if document.get("_id") is None:
+                document.pop("_id", None)
+            return {"n": 1, "nModified": 0, "upserted": self._insert(document)}
+
+        modified = 0
+        for target in targets:
+            new = dict(_copy(update), _id=target["_id"]) if replace else apply_update(_copy(target), update)
+            if sort_key(new) != sort_key(target):
+                self._replace_stored(target, new)
+                modified += 1
+        return {"n": len(targets), "nModified": modified}
+
+    def update_one(self, filter: Dict, update: Dict, upsert: bool = False, session=None, **kwargs) -> UpdateResult:
+        with self._lock:
+            return UpdateResult(self._update(filter, update, upsert, many=False), True)
+
+    def update_many(self, filter: Dict, update: Dict, upsert: bool = False, session=None, **kwargs) -> UpdateResult:
+        with self._lock:
+            return UpdateResult(self._update(filter, update, upsert, many=True), True)
+
+    def replace_one(self, filter: Dict, replacement: Dict, upsert: bool = False, session=None,
+                    **kwargs) -> UpdateResult:
+        with self._lock:
+            return UpdateResult(self._update(filter, replacement, upsert, many=False, replace=True), True)
+
+    def _delete(self, query: Dict, many: bool) -> int:
+        targets = self.select(query, limit=0 if many else 1)
+        for target in targets:
+            self._delete_stored(target)
+        return len(targets)
+
+    def delete_one(self, filter: Dict, session=None, **kwargs) -> DeleteResult:
+        with self._lock:
+            return DeleteResult({"n": self._delete(filter, many=False)}, True)
+
+    def delete_many(self, filter: Dict, session=None, **kwargs) -> DeleteResult:
+        with self._lock:
+            return DeleteResult({"n": self._delete(filter, many=True)}, True)
+
+    def find_one_and_delete(self, filter: Dict, projection: Optional[Dict] = None, sort=None, session=None,
+                            **kwargs) -> Optional[Dict]:
+        with self._lock:
+            targets = self.select(filter, _normalize_sort(sort), limit=1)
+            if not targets:
+                return None
+            self._delete_stored(targets[0])
+            return project(targets[0], projection)
+
+    def find_one_and_update(self, filter: Dict, update: Dict, projection: Optional[Dict] = None, sort=None,
+                            upsert: bool = False, return_document: bool = False, session=None,
+                            **kwargs) -> Optional[Dict]:
+        with self._lock:
+            targets = self.select(filter, _normalize_sort(sort), limit=1)
+            before = project(targets[0], projection) if targets else None
+            result = self._update({"_id": targets[0]["_id"]} if targets else filter, update, upsert, many=False)
+            if not return_document:
+                return before
+            _id = targets[0]["_id"] if targets else result.get("upserted")
+            return self.find_one({"_id": _id}, projection) if _id is not None else None
+
+    def bulk_write(self, requests: List, ordered: bool = True, session=None, **kwargs) -> BulkWriteResult:
+        counts = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "nUpserted": 0}
+        upserted, inserted_ids, errors = [], [], []
+        with self._lock:
+            many = sum(isinstance(request, InsertOne) for request in requests) > RESORT_THRESHOLD
+            for position, request in enumerate(requests):
+                try:
+                    if isinstance(request, InsertOne):
+                        inserted_ids.append(self._insert(request._doc, many))
+                        counts["nInserted"] += 1
+                    elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                        outcome = self._update(request._filter, request._doc, request._upsert,
+                                               many=isinstance(request, UpdateMany),
+                                               replace=isinstance(request, ReplaceOne))
+                        if "upserted" in outcome:
+                            counts["nUpserted"] += 1
+                            upserted.append({"index": position, "_id": outcome["upserted"]})
+                        else:
+                            counts["nMatched"] += outcome["n"]
+                            counts["nModified"] += outcome["nModified"]
+                    elif isinstance(request, (DeleteOne, DeleteMany)):
+                        counts["nRemoved"] += self._delete(request._filter, many=isinstance(request, DeleteMany))
+                    else:
+                        raise TypeError(f"Unsupported bulk request {request!r}")
+                except DuplicateKeyError as e:
+                    errors.append({"index": position, "code": DUPLICATE_KEY, "errmsg": str(e)})
+                    if ordered:
+                        break
+
+        result = dict(counts, upserted=upserted, insertedIds=inserted_ids, writeErrors=errors, writeConcernErrors=[])
+        if errors:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    # Indexes
+
+    def create_indexes(self, indexes: List[IndexModel], session=None, **kwargs) -> List[str]:
+        return [self._create_index(index.document) for index in indexes]
+
+    def create_index(self, keys, name: Optional[str] = None, unique: bool = False, **kwargs) -> str:
+        keys = _normalize_sort(keys, 1)
+        return self._create_index({"key": dict(keys), "name": name or "_".join(f"{f}_{d}" for f, d in keys),
+                                   "unique": unique})
+
+    def _create_index(self, document: Dict) -> str:
+        with self._lock:
+            name = document["name"]
+            if name in self.indexes:
+                return name
+            index = MemoryIndex(name, list(document["key"].items()), unique=document.get("unique", False))
+            for id_key, stored in self.documents.items():
+                index.check(stored, id_key)
+                index.add(id_key, stored, many=True)
+            self.indexes[name] = index
+            return name
+
+    def drop_index(self, name: str, **kwargs):
+        with self._lock:
+            self.indexes.pop(name, None)
+
+    def index_information(self) -> Dict[str, Dict]:
+        return {name: {"key": index.keys, "unique": index.unique} for name, index in self.indexes.items()}
+
+    def list_indexes(self) -> Iterator[Dict]:
+        return iter([index.spec() for index in self.indexes.values()])
+
+    def drop(self, session=None, **kwargs):
+        self.database.drop_collection(self.name)
+
+    def watch(self, pipeline=None, **kwargs):
+        raise NotImplementedError("The in-memory backend does not support change streams.")
+
+    def aggregate(self, pipeline: List[Dict], session=None, **kwargs) -> Iterator[Dict]:
+        with self._lock:
+            return iter(list(run_pipeline(self, pipeline)))
+
+
+# Update operators
+
+
+def apply_update(document: Dict, update, inserting: bool = False) -> Dict:
+    if isinstance(update, list):
+        return next(run_pipeline(None, update, [document]))
+    if not all(operator.startswith("$") for operator in update):
+        raise ValueError("update only works with $ operators")
+    for operator, fields in update.items():
+        for field, argument in fields.items():
+            current = get_path(document, field)
+            if operator == "$set":
+                set_path(document, field, _copy(argument))
+            elif operator == "$setOnInsert":
+                if inserting:
+                    set_path(document, field, _copy(argument))
+            elif operator == "$unset":
+                unset_path(document, field)
+            elif operator == "$inc":
+                set_path(document, field, (0 if current is MISSING else current) + argument)
+            elif operator == "$max":
+                if current is MISSING or sort_key(argument) > sort_key(current):
+                    set_path(document, field, argument)
+            elif operator == "$min":
+                if current is MISSING or sort_key(argument) < sort_key(current):
+                    set_path(document, field, argument)
+            elif operator == "$push":
+                set_path(document, field, ([] if current is MISSING else current) + [_copy(argument)])
+            elif operator == "$currentDate":
+                set_path(document, field, datetime.utcnow())
+            else:
+                raise OperationFailure(f"Unknown modifier: {operator}")
+    return document
+
+
+def _unsupported(name: str):
+    raise OperationFailure(f"Unrecognized pipeline stage name: '{name}'")
+
+
+# Aggregation expressions
+
+
+def _date_trunc(date: datetime, unit: str, start_of_week: str = "sunday") -> datetime:
+    if unit == "year":
+        return datetime(date.year, 1, 1)
+    if unit == "quarter":
+        return datetime(date.year, date.month - (date.month - 1) % 3, 1)
+    if unit == "month":
+        return datetime(date.year, date.month, 1)
+    if unit == "week":
+        first = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"].index(start_of_week.lower()[:3])
+        day = datetime(date.year, date.month, date.day)
+        return day - timedelta(days=(day.weekday() - first) % 7)
+    if unit == "day":
+        return datetime(date.year, date.month, date.day)
+    if unit == "hour":
+        return datetime(date.year, date.month, date.day, date.hour)
+    if unit == "minute":
+        return datetime(date.year, date.month, date.day, date.hour, date.minute)
+    raise OperationFailure(f"$dateTrunc: unsupported unit {unit!r}")
+
+
+def _arguments(argument, document: Dict, variables: Dict) -> List:
+    return [evaluate(item, document, variables) for item in (argument if isinstance(argument, list) else [argument])]
+
+
+def _operator(name: str, argument, document: Dict, variables: Dict):
+    if name == "$literal":
+        return argument
+    if name == "$dateTrunc":
+        return _date_trunc(evaluate(argument["date"], document, variables), argument["unit"],
+                           argument.get("startOfWeek", "sunday"))
+    if name == "$cond":
+        if isinstance(argument, dict):
+            argument = [argument["if"], argument["then"], argument["else"]]
+        condition, then, otherwise = argument
+        return evaluate(then if evaluate(condition, document, variables) else otherwise, document, variables)
+
+    values = _arguments(argument, document, variables)
+    values = [None if value is MISSING else value for value in values]
+    if name == "$eq":
+        return _equal(*values)
+    if name == "$ne":
+        return not _equal(*values)
+    if name in ("$gt", "$gte", "$lt", "$lte"):
+        left, right = sort_key(values[0]), sort_key(values[1])
+        return {"$gt": left > right, "$gte": left >= right, "$lt": left < right, "$lte": left <= right}[name]
+    if name == "$and":
+        return all(values)
+    if name == "$or":
+        return any(values)
+    if name == "$not":
+        return not values[0]
+    if name == "$in":
+        return any(_equal(values[0], item) for item in values[1])
+    if name == "$size":
+        return len(values[0])
+    if name == "$arrayElemAt":
+        array, position = values
+        return array[position] if -len(array) <= position < len(array) else MISSING
+    if name == "$ifNull":
+        return next((value for value in values[:-1] if value is not None), values[-1])
+    if name == "$add":
+        return functools.reduce(lambda left, right: left + (timedelta(milliseconds=right)
+                                                            if isinstance(left, datetime) else right), values)
+    if name == "$subtract":
+        left, right = values
+        if isinstance(left, datetime) and isinstance(right, datetime):
+            return int((left - right).total_seconds() * 1000)
+        return left - timedelta(milliseconds=right) if isinstance(left, datetime) else left - right
+    if name == "$multiply":
+        return functools.reduce(lambda left, right: left * right, values)
+    if name == "$divide":
+        return values[0] / values[1]
+    if name == "$concat":
+        return None if any(value is None for value in values) else "".join(values)
+    if name == "$toLower":
+        return (values[0] or "").lower()
+    if name == "$toUpper":
+        return (values[0] or "").upper()
+    if name in ("$sum", "$max", "$min", "$avg"):
+        items = values[0] if len(values) == 1 and isinstance(values[0], list) else values
+        numbers = [item for item in items if isinstance(item, (int, float)) and not isinstance(item, bool)]
+        if name == "$sum":
+            return sum(numbers)
+        if name == "$avg":
+            return sum(numbers) / len(numbers) if numbers else None
+        present = [item for item in items if item is not None]
+        if not present:
+            return None
+        return (max if name == "$max" else min)(present, key=sort_key)
+    raise OperationFailure(f"Unrecognized expression '{name}'")
+
+
+def evaluate(expression, document: Dict, variables: Optional[Dict] = None):
+    """An aggregation expression's value for ``document``; MISSING for a path that is not there."""
+    variables = variables or {}
+    if isinstance(expression, str) and expression.startswith("$$"):
+        name, _, path = expression[2:].partition(".")
+        value = document if name in ("ROOT", "CURRENT") else variables.get(name, MISSING)
+        return get_path(value, path) if path else value
+    if isinstance(expression, str) and expression.startswith("$"):
+        return get_path(document, expression[1:])
+    if isinstance(expression, list):
+        return [None if value is MISSING else value
+                for value in (evaluate(item, document, variables) for item in expression)]
+    if isinstance(expression, dict):
+        if len(expression) == 1 and next(iter(expression)).startswith("$"):
+            (name, argument), = expression.items()
+            return _operator(name, argument, document, variables)
+        result = {}
+        for key, item in expression.items():
+            value = evaluate(item, document, variables)
+            if value is not MISSING:
+                result[key] = value
+        return result
+    return expression
+
+
+# Aggregation stages
+
+
+def _stage_match(collection, documents, query):
+    return (document for document in documents if matches(document, query))
+
+
+def _stage_limit(collection, documents, count):
+    for position, document in enumerate(documents):
+        if position >= count:
+            return
+        yield document
+
+
+def _stage_skip(collection, documents, count):
+    for position, document in enumerate(documents):
+        if position >= count:
+            yield document
+
+
+def _stage_sort(collection, documents, sort):
+    return iter(sort_documents(list(documents), _normalize_sort(sort)))
+
+
+def _is_flag(value) -> bool:
+    return isinstance(value, (bool, int)) and not isinstance(value, float)
+
+
+def _project_stage(document: Dict, specification: Dict) -> Dict:
+    if any(not value for field, value in specification.items() if field != "_id" and _is_flag(value)):
+        return project(document, specification)
+
+    result = {}
+    identifier = specification.get("_id", 1)
+    if not _is_flag(identifier):
+        result["_id"] = evaluate(identifier, document)
+    elif identifier and "_id" in document:
+        result["_id"] = _copy(document["_id"])
+    for field, value in specification.items():
+        if field == "_id":
+            continue
+        value = get_path(document, field) if _is_flag(value) else evaluate(value, document)
+        if value is not MISSING:
+            set_path(result, field, _copy(value))
+    return result
+
+
+def _add_fields(document: Dict, specification: Dict) -> Dict:
+    result = _copy(document)
+    for field, expression in specification.items():
+        value = evaluate(expression, document)
+        if value is not MISSING:
+            set_path(result, field, _copy(value))
+    return result
+
+
+def _stage_project(collection, documents, specification):
+    return (_project_stage(document, specification) for document in documents)
+
+
+def _stage_add_fields(collection, documents, specification):
+    return (_add_fields(document, specification) for document in documents)
+
+
+def _stage_unset(collection, documents, fields):
+    fields = [fields] if isinstance(fields, str) else fields
+    return (project(document, {field: 0 for field in fields}) for document in documents)
+
+
+def _stage_unwind(collection, documents, specification):
+    if isinstance(specification, str):
+        specification = {"path": specification}
+    path = specification["path"][1:]
+    keep_empty = specification.get("preserveNullAndEmptyArrays", False)
+    for document in documents:
+        value = get_path(document, path)
+        if isinstance(value, list) and value:
+            for item in value:
+                unwound = _copy(document)
+                set_path(unwound, path, _copy(item))
+                yield unwound
+        elif value is not MISSING and value is not None and not isinstance(value, list):
+            yield document
+        elif keep_empty:
+            unwound = _copy(document)
+            unset_path(unwound, path)
+            yield unwound
+
+
+def _stage_replace_root(collection, documents, specification):
+    return (_copy(evaluate(specification["newRoot"], document)) for document in documents)
+
+
+def _stage_lookup(collection, documents, specification):
+    foreign = collection.database[specification["from"]]
+    for document in documents:
+        local = get_path(document, specification["localField"])
+        values = (local if isinstance(local, list) else [local]) if local is not MISSING else [None]
+        joined = [project(match, None) for match in foreign.select({specification["foreignField"]: {"$in": values}})]
+        if "pipeline" in specification:
+            joined = list(run_pipeline(foreign, specification["pipeline"], joined))
+        result = _copy(document)
+        set_path(result, specification["as"], joined)
+        yield result
+
+
+_ACCUMULATORS = ("$sum", "$first", "$last", "$max", "$min", "$avg", "$push", "$addToSet", "$count")
+
+
+def _stage_group(collection, documents, specification):
+    groups: Dict[tuple, Dict] = {}
+    accumulators = {field: next(iter(accumulator.items())) for field, accumulator in specification.items()
+                    if field != "_id"}
+    for document in documents:
+        key = evaluate(specification["_id"], document)
+        key = None if key is MISSING else key
+        group = groups.setdefault(sort_key(key), {"_id": key, "__values": defaultdict(list)})
+        for field, (name, expression) in accumulators.items():
+            if name not in _ACCUMULATORS:
+                raise OperationFailure(f"unknown group operator '{name}'")
+            value = 1 if name == "$count" else evaluate(expression, document)
+            group["__values"][field].append(value)
+
+    for group in groups.values():
+        values = group.pop("__values")
+        for field, (name, _) in accumulators.items():
+            items = values.get(field, [])
+            present = [item for item in items if item is not MISSING]
+            if name in ("$sum", "$count"):
+                group[field] = sum(item for item in present if isinstance(item, (int, float)))
+            elif name == "$avg":
+                numbers = [item for item in present if isinstance(item, (int, float))]
+                group[field] = sum(numbers) / len(numbers) if numbers else None
+            elif name == "$first":
+                group[field] = items[0] if items and items[0] is not MISSING else None
+            elif name == "$last":
+                group[field] = items[-1] if items and items[-1] is not MISSING else None
+            elif name in ("$max", "$min"):
+                candidates = [item for item in present if item is not None]
+                group[field] = (max if name == "$max" else min)(candidates, key=sort_key) if candidates else None
+            elif name == "$push":
+                group[field] = present
+            elif name == "$addToSet":
+                group[field] = list({sort_key(item): item for item in present}.values())
+        yield group
+
+
+def _stage_count(collection, documents, field):
+    count = sum(1 for _ in documents)
+    if count:
+        yield {field: count}
+
+
+def _stage_facet(collection, documents, specification):
+    documents = list(documents)
+    yield {name: list(run_pipeline(collection, pipeline, [_copy(document) for document in documents]))
+           for name, pipeline in specification.items()}
+
+
+def _stage_union_with(collection, documents, specification):
+    if isinstance(specification, str):
+        specification = {"coll": specification}
+    yield from documents
+    yield from run_pipeline(collection.database[specification["coll"]], specification.get("pipeline", []))
+
+
+def _stage_merge(collection, documents, specification):
+    if isinstance(specification, str):
+        specification = {"into": specification}
+    into = specification["into"]
+    target = collection.database[into if isinstance(into, str) else into["coll"]]
+    on = specification.get("on", "_id")
+    on = [on] if isinstance(on, str) else on
+    when_matched = specification.get("whenMatched", "merge")
+    when_not_matched = specification.get("whenNotMatched", "insert")
+    for document in list(documents):
+        document = _copy(document)
+        existing = target.select({field: get_path(document, field) for field in on}, limit=1)
+        if existing:
+            if when_matched == "replace":
+                target._replace_stored(existing[0], dict(document, _id=existing[0]["_id"]))
+            elif when_matched == "merge":
+                target._replace_stored(existing[0], dict(_copy(existing[0]), **document))
+            elif when_matched == "fail":
+                raise DuplicateKeyError("$merge found a matching document", DUPLICATE_KEY)
+            elif when_matched != "keepExisting":
+                raise OperationFailure(f"$merge whenMatched {when_matched!r} is not supported")
+        elif when_not_matched == "insert":
+            target._insert(document)
+        elif when_not_matched == "fail":
+            raise OperationFailure("$merge could not find a matching document")
+    return iter(())
+
+
+def _stage_out(collection, documents, name):
+    documents = list(documents)
+    collection.database.drop_collection(name)
+    target = collection.database[name]
+    for document in documents:
+        target._insert(document)
+    return iter(())
+
+
+def _stage_index_stats(collection, documents, specification):
+    # Usage is not tracked; every index reports zero accesses.
+    return iter([{"name": name, "key": dict(index.keys), "accesses": {"ops": 0}}
+                 for name, index in collection.indexes.items()])
+
+
+def _stage_sort_by_count(collection, documents, expression):
+    grouped = _stage_group(collection, documents, {"_id": expression, "count": {"$sum": 1}})
+    return _stage_sort(collection, grouped, {"count": -1})
+
+
+_STAGES = {
+    "$match": _stage_match,
+    "$limit": _stage_limit,
+    "$skip": _stage_skip,
+    "$sort": _stage_sort,
+    "$project": _stage_project,
+    "$addFields": _stage_add_fields,
+    "$set": _stage_add_fields,
+    "$unset": _stage_unset,
+    "$unwind": _stage_unwind,
+    "$replaceRoot": _stage_replace_root,
+    "$lookup": _stage_lookup,
+    "$group": _stage_group,
+    "$count": _stage_count,
+    "$facet": _stage_facet,
+    "$unionWith": _stage_union_with,
+    "$merge": _stage_merge,
+    "$out": _stage_out,
+    "$indexStats": _stage_index_stats,
+    "$sortByCount": _stage_sort_by_count,
+}
+
+
+def run_pipeline(collection: MemoryCollection, pipeline: List[Dict],
+                 documents: Optional[Iterable[Dict]] = None) -> Iterator[Dict]:
+    pipeline = list(pipeline)
+    if documents is None:
+        # A leading $match (and $sort/$limit) is answered from the collection's indexes.
+        query, sort, limit = {}, [], 0
+        if pipeline and "$match" in pipeline[0]:
+            query = pipeline.pop(0)["$match"]
+        if pipeline and "$sort" in pipeline[0]:
+            sort = _normalize_sort(pipeline.pop(0)["$sort"])
+        if pipeline and "$limit" in pipeline[0]:
+            limit = pipeline.pop(0)["$limit"]
+        documents = [project(document, None) for document in collection.select(query, sort, limit=limit)]
+    for stage in pipeline:
+        (name, argument), = stage.items()
+        if name not in _STAGES:
+            _unsupported(name)
+        documents = _STAGES[name](collection, documents, argument)
+    return iter(documents)
+
+
+# Database
+
+
+class MemorySession:
+    """No transactions here: ``connection.run_in_transaction`` falls back to running the callback directly."""
+
+
+class MemoryClient:
+    def __init__(self, database: "MemoryDatabase"):
+        self._database = database
+
+    def start_session(self, **kwargs):
+        raise NotImplementedError("The in-memory backend does not support sessions or transactions.")
+
+    def __getitem__(self, name: str) -> "MemoryDatabase":
+        return self._database
+
+    def close(self):
+        pass
+
+
+class MemoryDatabase:
+    """A database of ``MemoryCollection``s, safe to share between threads, optionally backed by a snapshot file."""
+
+    def __init__(self, name: str = "pet_adoption", path: Optional[str] = None):
+        self.name = name
+        self.path = path
+        self.lock = threading.RLock()
+        self.collections: Dict[str, MemoryCollection] = {}
+        self.client = MemoryClient(self)
+        if path and os.path.exists(path):
+            self.restore(path)
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        with self.lock:
+            if name not in self.collections:
+                self.collections[name] = MemoryCollection(self, name)
+            return self.collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **kwargs) -> MemoryCollection:
+        return self[name]
+
+    def list_collection_names(self, **kwargs) -> List[str]:
+        return [name for name, collection in self.collections.items() if collection.documents]
+
+    def drop_collection(self, name: str, **kwargs):
+        with self.lock:
+            self.collections.pop(name, None)
+
+    def command(self, command, **kwargs) -> Dict:
+        name = command if isinstance(command, str) else next(iter(command))
+        if name == "ping":
+            return {"ok": 1.0}
+        if name == "dbStats":
+            with self.lock:
+                size = sum(len(bson.encode(document)) for collection in self.collections.values()
+                           for document in collection.documents.values())
+            return {"db": self.name, "collections": len(self.collections), "dataSize": size, "storageSize": size,
+                    "ok": 1.0}
+        raise OperationFailure(f"no such command: '{name}'")
+
+    def snapshot(self, path: Optional[str] = None):
+        """Write every collection, with its index definitions, to ``path`` (default: the path restored from)."""
+        path = path or self.path
+        if path is None:
+            raise ValueError("No snapshot path given.")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.lock, open(path + ".tmp", "wb") as file:
+            for name, collection in self.collections.items():
+                file.write(bson.encode({"collection": name, "indexes": [index.spec() for index_name, index
+                                                                        in collection.indexes.items()
+                                                                        if index_name != "_id_"]}))
+                for document in collection.documents.values():
+                    file.write(bson.encode({"collection": name, "document": document}))
+        os.replace(path + ".tmp", path)
+        print(f"Wrote a snapshot of {len(self.collections)} collections to {path}.")
+
+    def restore(self, path: str):
+        """Replace the contents of this database with the snapshot at ``path``."""
+        with self.lock, open(path, "rb") as file:
+            self.collections.clear()
+            indexes = {}
+            for record in bson.decode_file_iter(file):
+                collection = self[record["collection"]]
+                if "indexes" in record:
+                    indexes[collection.name] = record["indexes"]
+                else:
+                    collection._insert(record["document"], many=True)
+            # Indexes are built once the documents are in, as after a bulk load.
+            for name, specs in indexes.items():
+                for spec in specs:
+                    self[name]._create_index({"name": spec["name"], "key": dict(spec["key"]),
+                                              "unique": spec.get("unique", False)})
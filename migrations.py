@@ -0,0 +1,179 @@
+import argparse
+from collections import defaultdict
+from itertools import islice
+from typing import Dict, Iterator
+
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+from connection import LazyDatabase
+from facet_counts import increment_facets
+from owner_search import search_keys
+
+db = LazyDatabase()
+
+
+def _next_breed_id(database: Database) -> int:
+    last = database["breed"].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    return last["_id"] + 1 if last else 1
+
+
+def migrate_embedded_breeds(database: Database, batch_size: int = 10000) -> int:
+    """Move embedded breed documents on dogs into the ``breed`` collection.
+
+    Dogs are rewritten in ``_id`` order, one batch at a time, to hold only ``{"_id", "name"}`` of their breed. Dogs
+    that are already compact are skipped, so an interrupted migration can simply be run again.
+    """
+    breeds = database["breed"]
+    dogs = database["dog"]
+    references: Dict[str, Dict] = {breed["name"]: breed for breed in breeds.find({}, {"name": 1})}
+    next_breed_id = _next_breed_id(database)
+
+    embedded = {"breed.description": {"$exists": True}}
+    last_id = None
+    migrated = 0
+    while True:
+        query = dict(embedded, _id={"$gt": last_id}) if last_id is not None else embedded
+        batch = list(dogs.find(query, {"breed": 1}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+
+        requests = []
+        for dog in batch:
+            breed = dog["breed"]
+            if breed["name"] not in references:
+                details = {key: value for key, value in breed.items() if key != "_id"}
+                breeds.insert_one(dict(details, _id=next_breed_id))
+                references[breed["name"]] = {"_id": next_breed_id, "name": breed["name"]}
+                next_breed_id += 1
+            requests.append(UpdateOne({"_id": dog["_id"]}, {"$set": {"breed": references[breed["name"]]}}))
+
+        dogs.bulk_write(requests, ordered=False)
+        migrated += len(requests)
+        last_id = batch[-1]["_id"]
+        print(f"Migrated {migrated} dogs to breed references.")
+
+    print(f"Migrated {migrated} dogs in total; {len(references)} breeds in the breed collection.")
+    return migrated
+
+
+def backfill_adoption_status(database: Database) -> int:
+    """Set ``adoption_id`` on every dog from the adoption collection, and to ``None`` on dogs never adopted.
+
+    The adoption ids are merged into the dogs server-side in a single pass over the adoption collection;
+    a dog adopted more than once keeps its latest adoption.
+    """
+    database["adoption"].aggregate([
+        {"$sort": {"adoption_date": 1}},
+        {"$group": {"_id": "$dog_id", "adoption_id": {"$last": "$_id"}}},
+        {"$merge": {"into": "dog", "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard"}}
+    ])
+    available = database["dog"].update_many({"adoption_id": {"$exists": False}}, {"$set": {"adoption_id": None}})
+    adopted = database["dog"].count_documents({"adoption_id": {"$ne": None}})
+    print(f"Marked {adopted} dogs as adopted and {available.modified_count} dogs as available.")
+    return adopted
+
+
+def backfill_search_keys(database: Database, batch_size: int = 10000) -> int:
+    """Set the normalized ``search`` keys on owners that predate owner search, in ``_id`` order, one batch at a time.
+
+    Owners that already have them are skipped, so an interrupted backfill can simply be run again.
+    """
+    owners = database["owner"]
+    missing = {"search": {"$exists": False}}
+    last_id = None
+    backfilled = 0
+    while True:
+        query = dict(missing, _id={"$gt": last_id}) if last_id is not None else missing
+        batch = list(owners.find(query, {"name": 1, "email": 1}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        owners.bulk_write([UpdateOne({"_id": owner["_id"]}, {"$set": {"search": search_keys(owner)}})
+                           for owner in batch], ordered=False)
+        backfilled += len(batch)
+        last_id = batch[-1]["_id"]
+        print(f"Backfilled search keys on {backfilled} owners.")
+
+    print(f"Backfilled search keys on {backfilled} owners in total.")
+    return backfilled
+
+
+def find_orphan_adoptions(database: Database, batch_size: int = 10000) -> Iterator[Dict]:
+    """Stream adoptions whose owner or dog no longer exists, in one pass over the adoption collection.
+
+    Each result has ``owner_id``, ``dog_id``, ``owner_missing``, ``dog_missing`` and, when the dog still exists,
+    its ``breed`` name.
+    """
+    return database["adoption"].aggregate([
+        {"$lookup": {"from": "owner", "localField": "owner_id", "foreignField": "_id", "as": "owner"}},
+        {"$lookup": {"from": "dog", "localField": "dog_id", "foreignField": "_id", "as": "dog"}},
+        {"$project": {"owner_id": 1, "dog_id": 1,
+                      "owner_missing": {"$eq": [{"$size": "$owner"}, 0]},
+                      "dog_missing": {"$eq": [{"$size": "$dog"}, 0]},
+                      "breed": {"$arrayElemAt": ["$dog.breed.name", 0]}}},
+        {"$match": {"$or": [{"owner_missing": True}, {"dog_missing": True}]}},
+    ], batchSize=batch_size)
+
+
+def repair_orphans(database: Database, batch_size: int = 10000, dry_run: bool = False) -> Dict[str, int]:
+    """Finish the cascades that were interrupted: remove orphan adoptions, and the dogs of deleted owners.
+
+    Dogs go before their adoption rows, so a repair that stops part-way is picked up by the next scan.
+    """
+    found = {"missing_owner": 0, "missing_dog": 0, "dogs_deleted": 0, "adoptions_deleted": 0}
+    orphans = find_orphan_adoptions(database, batch_size)
+    while True:
+        batch = list(islice(orphans, batch_size))
+        if not batch:
+            break
+        found["missing_owner"] += sum(orphan["owner_missing"] for orphan in batch)
+        found["missing_dog"] += sum(orphan["dog_missing"] for orphan in batch)
+        if dry_run:
+            continue
+
+        # Deleting an owner deletes the dogs they adopted, so a dog whose adopter is gone goes too.
+        stranded_dogs = {orphan["dog_id"]: orphan["breed"] for orphan in batch
+                         if orphan["owner_missing"] and not orphan["dog_missing"]}
+        if stranded_dogs:
+            breed_counts = defaultdict(int)
+            for breed in stranded_dogs.values():
+                breed_counts[breed] -= 1
+            found["dogs_deleted"] += database["dog"].delete_many({"_id": {"$in": list(stranded_dogs)}}).deleted_count
+            increment_facets(database, {"dog.breed": breed_counts})
+        found["adoptions_deleted"] += database["adoption"].delete_many(
+            {"_id": {"$in": [orphan["_id"] for orphan in batch]}}).deleted_count
+
+    print(f"Found {found['missing_owner']} adoption(s) of missing owners and {found['missing_dog']} of missing dogs.")
+    if not dry_run:
+        print(f"Deleted {found['dogs_deleted']} stranded dog(s) and {found['adoptions_deleted']} orphan adoption(s).")
+    return found
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="One-off data migrations for the pet adoption database.")
+    subparsers = parser.add_subparsers(dest="migration", required=True)
+
+    breeds_parser = subparsers.add_parser("breeds", help="Replace embedded breed documents with breed references.")
+    breeds_parser.add_argument("--batch-size", type=int, default=10000)
+
+    subparsers.add_parser("adoption-status", help="Backfill adoption_id on dogs from the adoption collection.")
+
+    search_parser = subparsers.add_parser("search-keys", help="Backfill the normalized owner search keys.")
+    search_parser.add_argument("--batch-size", type=int, default=10000)
+
+    orphans_parser = subparsers.add_parser("orphans", help="Find and repair adoptions of missing owners or dogs.")
+    orphans_parser.add_argument("--batch-size", type=int, default=10000)
+    orphans_parser.add_argument("--dry-run", action="store_true", help="Only report what would be repaired.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.migration == "breeds":
+        migrate_embedded_breeds(db, batch_size=args.batch_size)
+    elif args.migration == "adoption-status":
+        backfill_adoption_status(db)
+    elif args.migration == "search-keys":
+        backfill_search_keys(db, batch_size=args.batch_size)
+    elif args.migration == "orphans":
+        repair_orphans(db, batch_size=args.batch_size, dry_run=args.dry_run)
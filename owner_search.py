@@ -0,0 +1,407 @@
+"""Owner search by name and email: indexed prefix lookups plus an in-process trigram index for typos.
+
+Every owner stores normalized copies of its name and email under ``search`` (see ``normalize``), indexed in MongoDB,
+so a prefix query is one index range scan. Fuzzy matches come from a trigram index held in memory as sorted numpy
+posting lists: a query looks up the postings of its trigrams and ranks owners by how many they share.
+
+The trigram index is built from the owner collection (``python owner_search.py build``, also run by the loader) and
+saved under ``data/cache/owner_search/<database>``; processes load it memory-mapped and catch up on owners inserted or
+deleted since by resuming the owner change stream from where the build started. Without change streams (a standalone
+server, the memory backend) a saved index is used only while it still holds as many owners as the collection. Owners
+added or deleted through ``app.py`` are applied to the loaded index as they happen.
+"""
+import argparse
+import json
+import os
+import threading
+import unicodedata
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from bson import ObjectId
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+
+from connection import LazyDatabase
+
+db = LazyDatabase()
+
+INDEX_DIR = os.path.join("data", "cache", "owner_search")
+INDEX_VERSION = 2
+# The owner changes catch_up applies; renames are picked up by re-ranking against the owners as stored.
+CHANGE_PIPELINE = [{"$match": {"operationType": {"$in": ["insert", "delete"]}}}]
+KEYS = ("name", "email")
+# Keys are indexed up to this many characters; longer ones keep their leading trigrams.
+KEY_WIDTH = 48
+BUILD_CHUNK_SIZE = 100000
+# A query reads its rarest trigrams' postings until this many entries, so common trigrams such as the shared email
+# domain do not turn a lookup into a scan of every owner.
+MAX_POSTINGS = 2000000
+
+
+def normalize(text: Optional[str]) -> str:
+    """Lowercase, strip accents and collapse whitespace: "  José  Smith" -> "jose smith"."""
+    folded = unicodedata.normalize("NFKD", text or "")
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return " ".join(folded.casefold().split())
+
+
+def search_keys(owner: Dict) -> Dict[str, str]:
+    return {key: normalize(owner.get(key)) for key in KEYS}
+
+
+def prefix_filter(key: str, prefix: str) -> Dict:
+    """Match ``search.<key>`` values starting with the normalized ``prefix`` as an index range, not a regex."""
+    return {f"search.{key}": {"$gte": prefix, "$lt": prefix + "\U0010ffff"}}
+
+
+def trigrams(key: str) -> Set[str]:
+    padded = f" {key[:KEY_WIDTH]} "
+    return {padded[offset:offset + 3] for offset in range(len(padded) - 2)}
+
+
+def similarity(query: str, key: str) -> float:
+    """Jaccard similarity of the two strings' trigram sets."""
+    query_trigrams, key_trigrams = trigrams(query), trigrams(key)
+    common = len(query_trigrams & key_trigrams)
+    return common / (len(query_trigrams) + len(key_trigrams) - common) if common else 0.0
+
+
+def best_similarity(key: str, owner: Dict) -> float:
+    """How well the normalized ``key`` matches the owner's closest search key."""
+    stored = owner.get("search") or search_keys(owner)
+    return max(similarity(key, stored.get(field, "")) for field in KEYS)
+
+
+def _trigram_codes(keys: List[str]) -> np.ndarray:
+    """Each key's distinct trigrams packed into uint64 codes, one sorted row per key, zero-padded."""
+    fixed = np.array([key[:KEY_WIDTH] for key in keys], dtype=f"U{KEY_WIDTH}")
+    chars = np.zeros((len(keys), KEY_WIDTH + 2), dtype=np.uint64)
+    chars[:, 0] = ord(" ")
+    chars[:, 1:-1] = fixed.view(np.uint32).reshape(len(keys), KEY_WIDTH)
+    chars[np.arange(len(keys)), np.char.str_len(fixed) + 1] = ord(" ")
+
+    # A code point fits in 21 bits, so three of them pack losslessly into one integer.
+    codes = (chars[:, :-2] << np.uint64(42)) | (chars[:, 1:-1] << np.uint64(21)) | chars[:, 2:]
+    codes[chars[:, 2:] == 0] = 0
+    codes.sort(axis=1)
+    codes[:, 1:][codes[:, 1:] == codes[:, :-1]] = 0
+    return codes
+
+
+def index_directory(database: Database) -> str:
+    return os.path.join(INDEX_DIR, database.name)
+
+
+def _watch_owners(database: Database, resume_after: Optional[Dict] = None):
+    return database["owner"].watch(CHANGE_PIPELINE, resume_after=resume_after)
+
+
+def _resume_token(database: Database) -> Optional[Dict]:
+    """A token to resume the owner change stream from now, or None where there are no change streams."""
+    try:
+        with _watch_owners(database) as stream:
+            return stream.resume_token
+    except (PyMongoError, NotImplementedError):
+        return None
+
+
+class TrigramIndex:
+    """Trigram -> sorted owner slots, in CSR form: ``postings[offsets[i]:offsets[i + 1]]`` lists ``grams[i]``."""
+
+    def __init__(self, grams: np.ndarray, offsets: np.ndarray, postings: np.ndarray, gram_counts: np.ndarray):
+        self.grams = grams
+        self.offsets = offsets
+        self.postings = postings
+        self.gram_counts = gram_counts
+        # Owners added after the build: trigram code -> slots, and each slot's trigram count.
+        self.added: Dict[int, List[int]] = {}
+        self.added_counts: Dict[int, int] = {}
+
+    @classmethod
+    def build(cls, keys: Iterable[str]) -> "TrigramIndex":
+        keys = iter(keys)
+        code_chunks, slot_chunks, count_chunks = [], [], []
+        total = 0
+        while True:
+            chunk = list(islice(keys, BUILD_CHUNK_SIZE))
+            if not chunk:
+                break
+            codes = _trigram_codes(chunk)
+            present = codes != 0
+            code_chunks.append(codes[present])
+            slot_chunks.append((np.nonzero(present)[0] + total).astype(np.int32))
+            count_chunks.append(present.sum(axis=1).astype(np.uint16))
+            total += len(chunk)
+
+        codes = np.concatenate(code_chunks) if code_chunks else np.empty(0, dtype=np.uint64)
+        slots = np.concatenate(slot_chunks) if slot_chunks else np.empty(0, dtype=np.int32)
+        # Stable, so each posting list stays in slot order.
+        order = np.argsort(codes, kind="stable")
+        codes, slots = codes[order], slots[order]
+        grams, starts = np.unique(codes, return_index=True)
+        offsets = np.append(starts, len(codes)).astype(np.int64)
+        gram_counts = np.concatenate(count_chunks) if count_chunks else np.empty(0, dtype=np.uint16)
+        return cls(grams, offsets, slots, gram_counts)
+
+    def add(self, slot: int, key: str):
+        codes = _trigram_codes([key])[0]
+        codes = codes[codes != 0]
+        for code in codes.tolist():
+            self.added.setdefault(code, []).append(slot)
+        self.added_counts[slot] = len(codes)
+
+    def search(self, key: str, limit: int) -> List[Tuple[int, float]]:
+        """The ``limit`` slots sharing the most trigrams with ``key``, with their (approximate) Jaccard similarity."""
+        query = _trigram_codes([key])[0]
+        query = query[query != 0]
+        if not len(query):
+            return []
+
+        positions = np.searchsorted(self.grams, query)
+        found = positions < len(self.grams)
+        found[found] = self.grams[positions[found]] == query[found]
+        positions = positions[found]
+        lengths = self.offsets[positions + 1] - self.offsets[positions]
+        # Rarest trigrams first, always at least one.
+        order = np.argsort(lengths)
+        chosen = positions[order][np.cumsum(lengths[order]) <= MAX_POSTINGS]
+        if not len(chosen) and len(positions):
+            chosen = positions[order][:1]
+        postings = [self.postings[self.offsets[position]:self.offsets[position + 1]] for position in chosen]
+
+        slots, common = (np.unique(np.concatenate(postings), return_counts=True) if postings
+                         else (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)))
+        scores = common / (len(query) + self.gram_counts[slots].astype(np.int64) - common)
+        if len(slots) > limit:
+            top = np.argpartition(-scores, limit)[:limit]
+            slots, scores = slots[top], scores[top]
+        results = dict(zip(slots.tolist(), scores.tolist()))
+
+        added_common: Dict[int, int] = {}
+        for code in query.tolist():
+            for slot in self.added.get(code, ()):
+                added_common[slot] = added_common.get(slot, 0) + 1
+        for slot, count in added_common.items():
+            results[slot] = count / (len(query) + self.added_counts[slot] - count)
+        return sorted(results.items(), key=lambda item: -item[1])[:limit]
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"grams": self.grams, "offsets": self.offsets, "postings": self.postings,
+                "gram_counts": self.gram_counts}
+
+
+class OwnerSearchIndex:
+    """A trigram index per search key over every owner, addressed by slot; slot ``i`` is owner ``ids[i]``."""
+
+    def __init__(self, database_name: str, ids: np.ndarray, indexes: Dict[str, TrigramIndex],
+                 resume_token: Optional[Dict] = None):
+        self.database_name = database_name
+        # Built in _id order, so an owner's slot is found by binary search.
+        self.ids = ids
+        self.indexes = indexes
+        # Where the owner change stream was when the build started, and where catch_up has applied it up to.
+        self.built_token = self.resume_token = resume_token
+        self.added_ids: List[ObjectId] = []
+        self.added_slots: Dict[ObjectId, int] = {}
+        self.removed: Set[int] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """Owners in the index, counting those added and not those removed since it was built."""
+        return len(self.ids) + len(self.added_ids) - len(self.removed)
+
+    @classmethod
+    def build(cls, database: Database, batch_size: int = 10000) -> "OwnerSearchIndex":
+        # The stream is opened first: owners inserted during the scan are replayed by catch_up, which skips repeats.
+        resume_token = _resume_token(database)
+        ids, keys = [], {key: [] for key in KEYS}
+        owners = database["owner"].find({}, {"name": 1, "email": 1, "search": 1}).sort("_id", 1)
+        for owner in owners.batch_size(batch_size):
+            ids.append(owner["_id"].binary)
+            stored = owner.get("search") or search_keys(owner)
+            for key in KEYS:
+                keys[key].append(stored.get(key, ""))
+        return cls(database.name, np.array(ids, dtype="S12"), {key: TrigramIndex.build(keys[key]) for key in KEYS},
+                   resume_token)
+
+    def save(self, directory: str):
+        """Save the index as built; owners applied since are not saved, catch_up applies them again after a load."""
+        os.makedirs(directory, exist_ok=True)
+        arrays = {"ids": self.ids}
+        for key, index in self.indexes.items():
+            arrays.update({f"{key}.{name}": array for name, array in index.arrays().items()})
+        for name, array in arrays.items():
+            path = os.path.join(directory, f"{name}.npy")
+            with open(path + ".tmp", "wb") as file:
+                np.save(file, array)
+            os.replace(path + ".tmp", path)
+        # The manifest goes last, so a half-written index is never loaded.
+        with open(os.path.join(directory, "manifest.json.tmp"), "w", encoding="utf-8") as file:
+            json.dump({"version": INDEX_VERSION, "database": self.database_name, "owners": len(self.ids),
+                       "resume_token": self.built_token, "built_at": datetime.now(timezone.utc).isoformat()}, file)
+        os.replace(os.path.join(directory, "manifest.json.tmp"), os.path.join(directory, "manifest.json"))
+
+    @classmethod
+    def load(cls, database: Database, directory: Optional[str] = None) -> Optional["OwnerSearchIndex"]:
+        """The saved index of ``database``, or None if there is none or it does not match its manifest."""
+        directory = directory or index_directory(database)
+        try:
+            with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != INDEX_VERSION or manifest.get("database") != database.name:
+            return None
+
+        def array(name: str) -> np.ndarray:
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+        try:
+            ids = array("ids")
+            indexes = {key: TrigramIndex(*(array(f"{key}.{name}") for name in ("grams", "offsets", "postings",
+                                                                                  "gram_counts")))
+                       for key in KEYS}
+        except (OSError, ValueError):
+            return None
+        # Arrays from a build that was interrupted before writing its manifest do not match the manifest's count.
+        if len(ids) != manifest.get("owners") or any(len(index.gram_counts) != len(ids)
+                                                     for index in indexes.values()):
+            return None
+        return cls(database.name, ids, indexes, manifest.get("resume_token"))
+
+    def _built_id(self, slot: int) -> ObjectId:
+        # numpy drops trailing NUL bytes from "S12" items.
+        return ObjectId(bytes(self.ids[slot]).ljust(12, b"\0"))
+
+    def _slot(self, owner_id: ObjectId) -> Optional[int]:
+        if owner_id in self.added_slots:
+            return self.added_slots[owner_id]
+        slot = int(np.searchsorted(self.ids, owner_id.binary))
+        return slot if slot < len(self.ids) and self._built_id(slot) == owner_id else None
+
+    def _owner_id(self, slot: int) -> ObjectId:
+        return self._built_id(slot) if slot < len(self.ids) else self.added_ids[slot - len(self.ids)]
+
+    def add(self, owners: Iterable[Dict]):
+        with self._lock:
+            for owner in owners:
+                if self._slot(owner["_id"]) is not None:
+                    continue
+                slot = len(self.ids) + len(self.added_ids)
+                self.added_ids.append(owner["_id"])
+                self.added_slots[owner["_id"]] = slot
+                stored = owner.get("search") or search_keys(owner)
+                for key, index in self.indexes.items():
+                    index.add(slot, stored.get(key, ""))
+
+    def remove(self, owner_ids: Iterable[ObjectId]):
+        with self._lock:
+            for owner_id in owner_ids:
+                slot = self._slot(owner_id)
+                if slot is not None:
+                    self.removed.add(slot)
+
+    def catch_up(self, database: Database) -> Optional[int]:
+        """Apply owners inserted or deleted since the build (or the last catch-up) from the owner change stream.
+
+        Returns how many changes were applied, or None if the stream cannot be resumed: there are no change streams,
+        or the changes have rolled off the oplog.
+        """
+        if self.resume_token is None:
+            return None
+        applied = 0
+        try:
+            with _watch_owners(database, self.resume_token) as stream:
+                while True:
+                    change = stream.try_next()
+                    if change is not None:
+                        if change["operationType"] == "insert":
+                            self.add([change["fullDocument"]])
+                        else:
+                            self.remove([change["documentKey"]["_id"]])
+                        applied += 1
+                    self.resume_token = stream.resume_token
+                    if change is None:
+                        return applied
+        except (PyMongoError, NotImplementedError):
+            return None
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[ObjectId, float]]:
+        """Owners whose name or email is most similar to ``query``, best first, as (owner id, score)."""
+        key = normalize(query)
+        with self._lock:
+            best: Dict[int, float] = {}
+            for index in self.indexes.values():
+                for slot, score in index.search(key, limit + len(self.removed)):
+                    if slot not in self.removed and score > best.get(slot, 0.0):
+                        best[slot] = score
+            ranked = sorted(best.items(), key=lambda item: -item[1])[:limit]
+            return [(self._owner_id(slot), score) for slot, score in ranked]
+
+
+# Database name -> the process-wide index of its owners.
+_indexes: Dict[str, OwnerSearchIndex] = {}
+_index_lock = threading.Lock()
+
+
+def get_search_index(database: Database) -> OwnerSearchIndex:
+    """The process-wide index of ``database``: loaded from disk and caught up on first use, or built if it cannot be.
+
+    Without a change stream to catch up from, the saved index is only used if it holds as many owners as the
+    collection.
+    """
+    index = _indexes.get(database.name)
+    if index is None:
+        with _index_lock:
+            index = _indexes.get(database.name)
+            if index is None:
+                index = OwnerSearchIndex.load(database)
+                if (index is not None and index.catch_up(database) is None
+                        and index.size != database["owner"].estimated_document_count()):
+                    print("The saved owner search index does not match the owner collection; rebuilding it.")
+                    index = None
+                if index is None:
+                    index = build_search_index(database)
+                _indexes[database.name] = index
+    return index
+
+
+def index_owners(database: Database, owners: Iterable[Dict]):
+    """Apply inserted owners to the loaded index. Before the index is loaded, ``catch_up`` picks them up instead."""
+    index = _indexes.get(database.name)
+    if index is not None:
+        index.add(owners)
+
+
+def unindex_owners(database: Database, owner_ids: Iterable[ObjectId]):
+    index = _indexes.get(database.name)
+    if index is not None:
+        index.remove(owner_ids)
+
+
+def build_search_index(database: Database, directory: Optional[str] = None) -> OwnerSearchIndex:
+    directory = directory or index_directory(database)
+    index = OwnerSearchIndex.build(database)
+    index.save(directory)
+    print(f"Built the owner search index over {len(index.ids)} owners in {directory}.")
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the owner name/email search index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="Rebuild the trigram index from the owner collection.")
+    search_parser = subparsers.add_parser("search", help="Fuzzy-search owners by name or email.")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_search_index(db)
+    else:
+        for owner_id, score in get_search_index(db).search(args.query, args.limit):
+            print(f"{owner_id} {score:.2f}")
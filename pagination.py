@@ -0,0 +1,111 @@
+"""Keyset pagination: every page is a range scan starting after the last sort key seen, never a skip.
+
+A continuation token is an opaque, URL-safe string holding the sort fields and the last document's values for
+them. Page N therefore costs the same as page 1 as long as an index covers the query's equality fields followed
+by the sort fields.
+"""
+import base64
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import bson
+from pymongo.collection import Collection
+
+Sort = Sequence[Tuple[str, int]]
+# Larger pages are cut to this size; the continuation token picks up the rest.
+MAX_PAGE_SIZE = 10000
+
+
+def sort_key(document: Dict, sort: Sort) -> List:
+    values = []
+    for field, _ in sort:
+        value = document
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        values.append(value)
+    return values
+
+
+def encode_token(document: Dict, sort: Sort) -> str:
+    payload = bson.encode({"sort": [field for field, _ in sort], "after": sort_key(document, sort)})
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def decode_token(token: str, sort: Sort) -> List:
+    try:
+        payload = bson.decode(base64.urlsafe_b64decode(token.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"Invalid continuation token: {e}") from e
+    if payload.get("sort") != [field for field, _ in sort]:
+        raise ValueError("Continuation token belongs to a listing with a different sort order.")
+    return payload["after"]
+
+
+def _after_value(field: str, direction: int, value) -> Optional[Dict]:
+    """The condition for ``field`` to sort strictly after ``value``, or None if nothing can.
+
+    Null and missing sort before every other value, so they come first ascending and last descending, and ``$gt``
+    or ``$lt`` alone would never reach them from a non-null value, nor leave a null one.
+    """
+    if direction > 0:
+        return {field: {"$ne": None}} if value is None else {field: {"$gt": value}}
+    if value is None:
+        return None
+    return {"$or": [{field: {"$lt": value}}, {field: None}]}
+
+
+def after_filter(sort: Sort, after: List) -> Dict:
+    """Documents strictly after ``after`` in ``sort`` order, e.g. name > n OR (name == n AND _id > i)."""
+    branches = []
+    for position, (field, direction) in enumerate(sort):
+        condition = _after_value(field, direction, after[position])
+        if condition is not None:
+            branch = {previous: after[index] for index, (previous, _) in enumerate(sort[:position])}
+            branch.update(condition)
+            branches.append(branch)
+    if not branches:
+        return {sort[0][0]: {"$in": []}}
+    return branches[0] if len(branches) == 1 else {"$or": branches}
+
+
+def page_limit(page_size: int) -> int:
+    """``page_size`` capped at MAX_PAGE_SIZE. Raises ValueError if it is not at least 1."""
+    if page_size < 1:
+        raise ValueError(f"page_size must be at least 1, not {page_size}.")
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def page_query(query: Dict, sort: Sort, token: Optional[str]) -> Dict:
+    if token is None:
+        return query
+    return {"$and": [query, after_filter(sort, decode_token(token, sort))]} if query \
+        else after_filter(sort, decode_token(token, sort))
+
+
+def page_result(documents: List[Dict], sort: Sort, page_size: int) -> Tuple[List[Dict], Optional[str]]:
+    """Trim the one-document lookahead and turn it into the next token (None on the last page)."""
+    if len(documents) <= page_size:
+        return documents, None
+    documents = documents[:page_size]
+    return documents, encode_token(documents[-1], sort)
+
+
+def fetch_page(collection: Collection, query: Dict, sort: Sort, page_size: int, token: Optional[str] = None,
+               projection: Optional[Dict] = None) -> Tuple[List[Dict], Optional[str]]:
+    """One page of ``query`` in ``sort`` order and the token for the next page.
+
+    The sort must end in a unique field (normally ``_id``) so no document is skipped or repeated across pages.
+    Pages hold at most MAX_PAGE_SIZE documents, and ``page_size`` below 1 raises ValueError.
+    """
+    page_size = page_limit(page_size)
+    cursor = collection.find(page_query(query, sort, token), projection).sort(list(sort)).limit(page_size + 1)
+    return page_result(list(cursor), sort, page_size)
+
+
+def iter_documents(collection: Collection, query: Dict, sort: Sort, projection: Optional[Dict] = None,
+                   batch_size: int = 1000, token: Optional[str] = None) -> Iterator[Dict]:
+    """Yield every match lazily, one keyset page at a time, so no server cursor stays open between pages."""
+    while True:
+        documents, token = fetch_page(collection, query, sort, batch_size, token, projection)
+        yield from documents
+        if token is None:
+            return
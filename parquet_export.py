@@ -0,0 +1,234 @@
+"""Stream collections into partitioned Parquet datasets for analytics.
+
+Each collection is read in ``_id`` (or ``adoption_date``) order, one cursor batch at a time, and every batch becomes
+one Arrow record batch, so memory stays bounded by the batch size whatever the collection size. Nested fields are
+flattened (``address.city`` -> ``address_city``, ``breed.name`` -> ``breed_name``) and ObjectIds become 12-byte
+fixed-width binary. Adoptions are partitioned by month of ``adoption_date`` (``adoption_month=2024-03/``); owners
+and dogs are split into files of about ``--rows-per-file`` rows. ``adoption_details`` is the adoptions with their
+owner and dog denormalized in, joined one batch at a time by ``_id``.
+
+Datasets are written to a temporary directory and renamed into place when complete, and several datasets export in
+parallel. Needs ``pyarrow``.
+
+    python parquet_export.py --output export owner dog adoption adoption_details
+"""
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import groupby
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bson import ObjectId
+from pymongo.database import Database
+
+from connection import LazyDatabase
+
+db = LazyDatabase()
+
+OBJECT_ID = pa.binary(12)
+# (column, Arrow type, document path) per collection.
+Columns = List[Tuple[str, pa.DataType, str]]
+OWNER_COLUMNS: Columns = [
+    ("_id", OBJECT_ID, "_id"),
+    ("name", pa.string(), "name"),
+    ("email", pa.string(), "email"),
+    ("mobile", pa.string(), "mobile"),
+    ("address_street", pa.string(), "address.street"),
+    ("address_city", pa.string(), "address.city"),
+    ("address_country", pa.string(), "address.country"),
+    ("address_zip", pa.string(), "address.zip"),
+]
+DOG_COLUMNS: Columns = [
+    ("_id", OBJECT_ID, "_id"),
+    ("name", pa.string(), "name"),
+    ("country", pa.string(), "country"),
+    ("breed_id", pa.int64(), "breed._id"),
+    ("breed_name", pa.string(), "breed.name"),
+    ("adoption_id", OBJECT_ID, "adoption_id"),
+]
+ADOPTION_COLUMNS: Columns = [
+    ("_id", OBJECT_ID, "_id"),
+    ("dog_id", OBJECT_ID, "dog_id"),
+    ("owner_id", OBJECT_ID, "owner_id"),
+    ("adoption_date", pa.timestamp("ms"), "adoption_date"),
+]
+
+
+def _joined(prefix: str, columns: Columns) -> Columns:
+    return [(f"{prefix}_{name}", data_type, f"{prefix}.{path}") for name, data_type, path in columns if name != "_id"]
+
+
+def _projection(columns: Columns) -> Dict[str, int]:
+    return {path: 1 for _, _, path in columns}
+
+
+@dataclass
+class Dataset:
+    collection: str
+    columns: Columns
+    sort: List[Tuple[str, int]]
+    # Hive-style partition directory for a document, e.g. "adoption_month=2024-03"; None for unpartitioned datasets.
+    partition: Optional[Callable[[Dict], str]] = None
+    # Columns filled in by ``join``, which adds the joined documents to each batch in place.
+    joined_columns: Columns = field(default_factory=list)
+    join: Optional[Callable[[Database, List[Dict]], None]] = None
+
+
+def _adoption_month(adoption: Dict) -> str:
+    return f"adoption_month={adoption['adoption_date']:%Y-%m}"
+
+
+def _join_owners_and_dogs(database: Database, adoptions: List[Dict]):
+    for collection_name, field, columns in (("owner", "owner_id", OWNER_COLUMNS), ("dog", "dog_id", DOG_COLUMNS)):
+        ids = list({adoption[field] for adoption in adoptions})
+        found = {document["_id"]: document
+                 for document in database[collection_name].find({"_id": {"$in": ids}}, _projection(columns))}
+        for adoption in adoptions:
+            adoption[collection_name] = found.get(adoption[field], {})
+
+
+DATASETS: Dict[str, Dataset] = {
+    "owner": Dataset("owner", OWNER_COLUMNS, [("_id", 1)]),
+    "dog": Dataset("dog", DOG_COLUMNS, [("_id", 1)]),
+    # Read in date order so each month's partition is written in one go, by one open file.
+    "adoption": Dataset("adoption", ADOPTION_COLUMNS, [("adoption_date", 1), ("_id", 1)], _adoption_month),
+    "adoption_details": Dataset("adoption", ADOPTION_COLUMNS, [("adoption_date", 1), ("_id", 1)], _adoption_month,
+                                _joined("owner", OWNER_COLUMNS) + _joined("dog", DOG_COLUMNS), _join_owners_and_dogs),
+}
+
+
+DEFAULT_DATASETS = ["owner", "dog", "adoption"]
+
+
+def _value(document: Dict, path: str):
+    for part in path.split("."):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document.binary if isinstance(document, ObjectId) else document
+
+
+def schema(dataset: Dataset) -> pa.Schema:
+    return pa.schema([(name, data_type) for name, data_type, _ in dataset.columns + dataset.joined_columns])
+
+
+def record_batch(dataset: Dataset, documents: List[Dict]) -> pa.RecordBatch:
+    """One Arrow column per exported field, built straight from the batch's documents."""
+    columns = dataset.columns + dataset.joined_columns
+    return pa.RecordBatch.from_arrays([pa.array([_value(document, path) for document in documents], type=data_type)
+                                       for _, data_type, path in columns], schema=schema(dataset))
+
+
+class PartitionedWriter:
+    """Writes record batches as ``<directory>/[<partition>/]part-NNNNN.parquet``, one open file at a time."""
+
+    def __init__(self, directory: str, file_schema: pa.Schema, rows_per_file: int, compression: str):
+        self.directory = directory
+        self.schema = file_schema
+        self.rows_per_file = rows_per_file
+        self.compression = compression
+        self.writer: Optional[pq.ParquetWriter] = None
+        self.partition: Optional[str] = None
+        self.rows_in_file = 0
+        self.parts: Dict[Optional[str], int] = {}
+        self.files = 0
+
+    def write(self, partition: Optional[str], batch: pa.RecordBatch):
+        if self.writer is None or partition != self.partition or self.rows_in_file >= self.rows_per_file:
+            self._open(partition)
+        self.writer.write_batch(batch)
+        self.rows_in_file += batch.num_rows
+
+    def _open(self, partition: Optional[str]):
+        self.close()
+        directory = os.path.join(self.directory, partition) if partition else self.directory
+        os.makedirs(directory, exist_ok=True)
+        part = self.parts.get(partition, 0)
+        self.parts[partition] = part + 1
+        self.writer = pq.ParquetWriter(os.path.join(directory, f"part-{part:05d}.parquet"), self.schema,
+                                       compression=self.compression)
+        self.partition = partition
+        self.rows_in_file = 0
+        self.files += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def export_dataset(database: Database, name: str, output: str, batch_size: int = 50000,
+                   rows_per_file: int = 1000000, compression: str = "zstd") -> Dict[str, float]:
+    """Export one dataset to ``<output>/<name>``, replacing any previous export. Returns rows, files and seconds."""
+    dataset = DATASETS[name]
+    started = time.perf_counter()
+    final = os.path.join(output, name)
+    temporary = final + ".tmp"
+    shutil.rmtree(temporary, ignore_errors=True)
+    writer = PartitionedWriter(temporary, schema(dataset), rows_per_file, compression)
+
+    cursor = database[dataset.collection].find({}, _projection(dataset.columns), sort=dataset.sort,
+                                               batch_size=batch_size, allow_disk_use=True)
+    rows = 0
+    try:
+        while True:
+            documents = _next_batch(cursor, batch_size)
+            if not documents:
+                break
+            if dataset.join:
+                dataset.join(database, documents)
+            runs = groupby(documents, dataset.partition) if dataset.partition else [(None, documents)]
+            for partition, run in runs:
+                writer.write(partition, record_batch(dataset, list(run)))
+            rows += len(documents)
+    finally:
+        writer.close()
+        cursor.close()
+
+    shutil.rmtree(final, ignore_errors=True)
+    if os.path.exists(temporary):
+        os.replace(temporary, final)
+    seconds = time.perf_counter() - started
+    print(f"Exported {rows} rows of {name} to {writer.files} file(s) in {seconds:.1f}s.")
+    return {"rows": rows, "files": writer.files, "seconds": seconds}
+
+
+def _next_batch(cursor, batch_size: int) -> List[Dict]:
+    documents = []
+    for document in cursor:
+        documents.append(document)
+        if len(documents) >= batch_size:
+            break
+    return documents
+
+
+def export_datasets(database: Database, names: List[str], output: str, workers: int = 4,
+                    **options) -> Dict[str, Dict[str, float]]:
+    """Export several datasets, up to ``workers`` at a time."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {name: executor.submit(export_dataset, database, name, output, **options) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export collections to partitioned Parquet datasets.")
+    # Checked after parsing: argparse on Python 3.11 checks an empty nargs="*" list against choices and rejects it.
+    parser.add_argument("datasets", nargs="*", metavar="dataset",
+                        help=f"Datasets to export: {', '.join(DATASETS)} (default: {' '.join(DEFAULT_DATASETS)}).")
+    parser.add_argument("--output", default="export", help="Directory the datasets are written under.")
+    parser.add_argument("--batch-size", type=int, default=50000, help="Documents per cursor batch and row group.")
+    parser.add_argument("--rows-per-file", type=int, default=1000000)
+    parser.add_argument("--compression", default="zstd", help="Parquet codec: zstd, snappy, gzip or none.")
+    parser.add_argument("--workers", type=int, default=4, help="Datasets exported in parallel.")
+    args = parser.parse_args()
+    unknown = [name for name in args.datasets if name not in DATASETS]
+    if unknown:
+        parser.error(f"unknown dataset(s) {', '.join(unknown)}; choose from {', '.join(DATASETS)}.")
+
+    export_datasets(db, args.datasets or DEFAULT_DATASETS, args.output, workers=args.workers,
+                    batch_size=args.batch_size, rows_per_file=args.rows_per_file, compression=args.compression)
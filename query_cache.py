@@ -0,0 +1,115 @@
+import functools
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, Hashable, Iterable, Tuple
+
+
+class QueryCache:
+    """Size-bounded LRU cache of query results with a TTL per entry and tag-based invalidation.
+
+    Every entry is stored under the tags of the data it was computed from; a write invalidates exactly the
+    entries tagged with what it changed.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, object, Tuple[str, ...]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = defaultdict(int)
+        self.misses: Dict[str, int] = defaultdict(int)
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Tuple) -> Tuple[bool, object]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses[key[0]] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits[key[0]] += 1
+            return True, entry[1]
+
+    def put(self, key: Tuple, value: object, ttl: float, tags: Iterable[str]):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value, tuple(tags))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *tags: str):
+        tags = set(tags)
+        with self._lock:
+            stale = [key for key, (_, _, entry_tags) in self._entries.items() if tags.intersection(entry_tags)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+query_cache = QueryCache()
+
+
+def _key(function: Callable, args: Tuple, kwargs: Dict) -> Tuple:
+    # Qualified by module, so app.py and app_async.py twins of the same name keep separate entries and counters.
+    return f"{function.__module__}.{function.__qualname__}", args, tuple(sorted(kwargs.items()))
+
+
+def cached(ttl: float, tags: Iterable[str]) -> Callable:
+    """Serve a read function from ``query_cache`` for ``ttl`` seconds, keyed on its arguments.
+
+    Results are returned as shallow copies so callers cannot modify what is cached.
+    """
+    tags = tuple(tags)
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            key = _key(function, args, kwargs)
+            hit, value = query_cache.get(key)
+            if not hit:
+                value = function(*args, **kwargs)
+                query_cache.put(key, value, ttl, tags)
+            return list(value) if isinstance(value, list) else value
+
+        wrapper.uncached = function
+        return wrapper
+
+    return decorator
+
+
+def async_cached(ttl: float, tags: Iterable[str]) -> Callable:
+    """``cached`` for coroutine functions; entries share ``query_cache`` with the synchronous reads."""
+    tags = tuple(tags)
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            key = _key(function, args, kwargs)
+            hit, value = query_cache.get(key)
+            if not hit:
+                value = await function(*args, **kwargs)
+                query_cache.put(key, value, ttl, tags)
+            return list(value) if isinstance(value, list) else value
+
+        wrapper.uncached = function
+        return wrapper
+
+    return decorator
@@ -0,0 +1,389 @@
+"""An in-process copy of owners, a lean dog projection and adoptions, kept current from a change stream.
+
+The copy lives in a MemoryDatabase (memory_backend.py) with the same indexes as the server, so the hot reads in app.py
+run unchanged against it. It is bootstrapped by one streaming scan of each collection, opened after the change
+stream so nothing written during the scan is missed, and then follows the stream on a daemon thread. Every
+``SNAPSHOT_INTERVAL`` seconds, and on stop, it is snapshotted together with the stream's resume token, so a restart
+restores the snapshot and resumes the stream instead of rescanning. It rescans only when the server no longer has
+the history to resume from.
+
+Reads are served from the copy only while it is no more than ``max_staleness`` seconds behind and has caught up with
+every write this process made (functions decorated with ``@writer``); otherwise they go to the server. Lag is measured
+without comparing clocks: the server's cluster time of the last applied change against the latest cluster time the
+server reported, plus the local (monotonic) time since that report. State is kept per database, under
+``data/cache/replica/<database>/``. Change
+streams need a replica set; a single-node one is enough:
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 && mongosh --eval "rs.initiate()"
+
+Set ``PET_ADOPTION_REPLICA=1`` for app.py to start the replica, and ``PET_ADOPTION_REPLICA_MAX_STALENESS`` (seconds,
+default 5) to bound how far behind it may serve from.
+
+    python read_replica.py sync      # bootstrap or resume, then follow the change stream until Ctrl-C
+    python read_replica.py check     # compare the replica with the server
+"""
+import argparse
+import functools
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from bson import Timestamp
+from pymongo import IndexModel
+from pymongo.database import Database
+from pymongo.errors import OperationFailure, PyMongoError
+
+from connection import LazyDatabase, backend
+from indexes import INDEXES
+from memory_backend import MemoryDatabase, project
+
+db = LazyDatabase()
+
+REPLICA_DIR = os.path.join("data", "cache", "replica")
+SNAPSHOT_FILE = "replica.bson"
+# Written after the snapshot, so a resume token is only ever paired with data at least as new as it.
+STATE_FILE = "state.json"
+# Replicated collection -> projection; dogs keep what the dog listings return, plus whether they are adopted.
+COLLECTIONS: Dict[str, Optional[Dict[str, int]]] = {
+    "owner": None,
+    "dog": {"name": 1, "country": 1, "breed._id": 1, "breed.name": 1, "adoption_id": 1},
+    "adoption": None,
+}
+BATCH_SIZE = 10000
+SNAPSHOT_INTERVAL = 60.0
+MAX_STALENESS = float(os.environ.get("PET_ADOPTION_REPLICA_MAX_STALENESS", 5))
+# How long an idle getMore waits for events; also how often the replica confirms it is current.
+MAX_AWAIT_MS = 200
+RETRY_SECONDS = 5.0
+# The resume token is older than the oplog (ChangeStreamHistoryLost, and its predecessors): rescan.
+HISTORY_LOST = (136, 280, 286)
+# Change streams are only supported on replica sets.
+NOT_A_REPLICA_SET = 40573
+# Events after which the stream has to start over from a fresh scan.
+RESCAN_EVENTS = ("invalidate", "dropDatabase", "rename")
+
+
+class ReadReplica:
+    def __init__(self, source: Database, directory: Optional[str] = None, max_staleness: float = MAX_STALENESS,
+                 snapshot_interval: float = SNAPSHOT_INTERVAL):
+        self.source = source
+        self.directory = directory or os.path.join(REPLICA_DIR, source.name)
+        self.max_staleness = max_staleness
+        self.snapshot_interval = snapshot_interval
+        self.database = MemoryDatabase(f"{source.name}_replica")
+        self.resume_token: Optional[Dict] = None
+        # Server cluster time every change up to which has been applied, and the latest the server reported, with
+        # the monotonic time it was reported at.
+        self.applied_time: Optional[Timestamp] = None
+        self.server_time: Optional[Timestamp] = None
+        self.server_seen_at = 0.0
+        # Monotonic start of the last poll that found nothing left to apply, and of this process's last write.
+        self.drained_at: Optional[float] = None
+        self.last_write = 0.0
+        self.applied = 0
+        self.saved_at = 0.0
+        self.error: Optional[str] = None
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # Staleness
+
+    def lag(self) -> float:
+        """Seconds of changes the replica may be missing, in server time plus local time since the server said so."""
+        if self.applied_time is None or self.server_time is None:
+            return float("inf")
+        return max(0, self.server_time.time - self.applied_time.time) + time.monotonic() - self.server_seen_at
+
+    def current(self) -> bool:
+        """Whether reads may be served from the replica right now."""
+        return (self.resume_token is not None and self.drained_at is not None and self.drained_at >= self.last_write
+                and self.lag() <= self.max_staleness)
+
+    def wait_until_current(self, timeout: float = 30.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while not self.current():
+            if time.monotonic() > deadline or self._stopping.is_set():
+                return False
+            time.sleep(MAX_AWAIT_MS / 1000)
+        return True
+
+    # Bootstrap and persistence
+
+    def _watch(self, resume_after: Optional[Dict] = None, session=None):
+        return self.source.watch([{"$match": {"ns.coll": {"$in": list(COLLECTIONS)}}}], full_document="updateLookup",
+                                 resume_after=resume_after, max_await_time_ms=MAX_AWAIT_MS, session=session)
+
+    def _create_indexes(self):
+        # Without unique constraints: changes are applied with their documents as looked up later, so two of them
+        # can briefly hold a value only one of them holds at any moment on the server.
+        for name in COLLECTIONS:
+            self.database[name].create_indexes([IndexModel(list(index.document["key"].items()),
+                                                           name=index.document["name"]) for index in INDEXES[name]])
+
+    def bootstrap(self):
+        """Copy every replicated collection with one streaming scan each, starting from a fresh database."""
+        started = time.time()
+        with self._watch() as stream:
+            # The stream is opened first: changes made during the scan are replayed over it, which is idempotent.
+            token = stream.resume_token
+        self.database = MemoryDatabase(f"{self.source.name}_replica")
+        for name, projection in COLLECTIONS.items():
+            batch = []
+            for document in self.source[name].find({}, projection, batch_size=BATCH_SIZE):
+                batch.append(document)
+                if len(batch) >= BATCH_SIZE:
+                    self.database[name].insert_many(batch)
+                    batch = []
+            if batch:
+                self.database[name].insert_many(batch)
+        self._create_indexes()
+        self.resume_token = token
+        self.applied_time = self.drained_at = None
+        print(f"Bootstrapped the read replica in {time.time() - started:.1f}s: "
+              + ", ".join(f"{self.database[name].count_documents({})} {name}" for name in COLLECTIONS) + ".")
+
+    def save(self):
+        """Snapshot the replica and then record the resume token it is current to."""
+        os.makedirs(self.directory, exist_ok=True)
+        self.database.snapshot(os.path.join(self.directory, SNAPSHOT_FILE))
+        state_path = os.path.join(self.directory, STATE_FILE)
+        with open(state_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump({"database": self.source.name, "resume_token": self.resume_token, "saved_at": time.time(),
+                       "collections": list(COLLECTIONS)}, file)
+        os.replace(state_path + ".tmp", state_path)
+        self.saved_at = time.monotonic()
+
+    def restore(self) -> bool:
+        """Load the last snapshot and its resume token, if there is one for this database and set of collections."""
+        state_path = os.path.join(self.directory, STATE_FILE)
+        try:
+            with open(state_path, encoding="utf-8") as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if (state.get("database") != self.source.name or state.get("collections") != list(COLLECTIONS)
+                or not state.get("resume_token")):
+            return False
+        self.database = MemoryDatabase(f"{self.source.name}_replica")
+        self.database.restore(os.path.join(self.directory, SNAPSHOT_FILE))
+        self.resume_token = state["resume_token"]
+        self.applied_time = self.drained_at = None
+        print(f"Restored the read replica from {self.directory}.")
+        return True
+
+    # Following the change stream
+
+    def apply(self, change: Dict) -> bool:
+        """Apply one change event. Returns False when the replica has to be rebuilt from a scan."""
+        operation = change["operationType"]
+        if operation in RESCAN_EVENTS:
+            return False
+        collection = self.database[change["ns"]["coll"]]
+        if operation == "drop":
+            collection.delete_many({})
+        elif operation == "delete" or change.get("fullDocument") is None:
+            # Also an update whose document was deleted before it could be looked up.
+            collection.delete_one({"_id": change["documentKey"]["_id"]})
+        else:
+            document = project(change["fullDocument"], COLLECTIONS[change["ns"]["coll"]])
+            collection.replace_one({"_id": document["_id"]}, document, upsert=True)
+        self.applied += 1
+        return True
+
+    def _observe(self, session):
+        """Record the cluster time the server gossiped on the stream's latest reply."""
+        cluster_time = session.cluster_time
+        if cluster_time and (self.server_time is None or cluster_time["clusterTime"] > self.server_time):
+            self.server_time = cluster_time["clusterTime"]
+            self.server_seen_at = time.monotonic()
+
+    def _follow(self):
+        with self.source.client.start_session() as session, self._watch(self.resume_token, session) as stream:
+            while not self._stopping.is_set():
+                polled = time.monotonic()
+                change = stream.try_next()
+                if change is not None and not self.apply(change):
+                    print(f"Change stream reported {change['operationType']}; rescanning.")
+                    self.resume_token = None
+                    return
+                self.resume_token = stream.resume_token
+                self._observe(session)
+                if change is None:
+                    # Drained: everything the server had committed when this poll started has been applied.
+                    self.applied_time = self.server_time
+                    self.server_seen_at = self.drained_at = polled
+                    if self.applied and time.monotonic() - self.saved_at >= self.snapshot_interval:
+                        self.save()
+                        self.applied = 0
+                else:
+                    self.applied_time = change["clusterTime"]
+
+    def _run(self):
+        # Only a fresh start restores the snapshot; losing the stream later means it is out of date.
+        restore = True
+        while not self._stopping.is_set():
+            try:
+                if self.resume_token is None:
+                    if not (restore and self.restore()):
+                        self.bootstrap()
+                        self.save()
+                    restore = False
+                self._follow()
+                self.error = None
+            except OperationFailure as e:
+                if e.code == NOT_A_REPLICA_SET:
+                    self.error = f"{e}; the read replica needs a replica set."
+                    print(self.error)
+                    return
+                self.error = str(e)
+                if e.code in HISTORY_LOST:
+                    print("The change stream can no longer resume from the saved token; rescanning.")
+                    self.resume_token = None
+                    continue
+                print(f"Read replica stopped following the change stream: {e}")
+                self._stopping.wait(RETRY_SECONDS)
+            except PyMongoError as e:
+                self.error = str(e)
+                print(f"Read replica stopped following the change stream: {e}")
+                self._stopping.wait(RETRY_SECONDS)
+
+    def start(self) -> "ReadReplica":
+        self._thread = threading.Thread(target=self._run, name="read-replica", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, save: bool = True):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        if save and self.resume_token is not None:
+            self.save()
+
+    # Consistency
+
+    def _differences(self, name: str, ids: Optional[List] = None) -> List:
+        """Ids whose documents differ between the server and the replica, walking both in _id order."""
+        query = {} if ids is None else {"_id": {"$in": ids}}
+        projection = COLLECTIONS[name]
+        server = iter(self.source[name].find(query, projection, sort=[("_id", 1)], batch_size=BATCH_SIZE))
+        local = iter(self.database[name].find(query, sort=[("_id", 1)]))
+        differences = []
+        expected, actual = next(server, None), next(local, None)
+        while expected is not None or actual is not None:
+            if actual is None or (expected is not None and expected["_id"] < actual["_id"]):
+                differences.append(expected["_id"])
+                expected = next(server, None)
+            elif expected is None or actual["_id"] < expected["_id"]:
+                differences.append(actual["_id"])
+                actual = next(local, None)
+            else:
+                if expected != actual:
+                    differences.append(expected["_id"])
+                expected, actual = next(server, None), next(local, None)
+        return differences
+
+    def check_consistency(self, timeout: float = 30.0) -> Dict[str, Dict[str, object]]:
+        """Compare every replicated document with the server.
+
+        Documents that differ are compared again once the replica has caught up with the time the check started,
+        so only differences that outlast replication lag are reported as ``mismatched``.
+        """
+        started = time.monotonic()
+        report = {}
+        for name in COLLECTIONS:
+            report[name] = {"server": self.source[name].count_documents({}),
+                            "replica": self.database[name].count_documents({}),
+                            "suspect": self._differences(name)}
+        deadline = time.monotonic() + timeout
+        while (self.drained_at is None or self.drained_at < started) and time.monotonic() < deadline:
+            time.sleep(MAX_AWAIT_MS / 1000)
+        for name, row in report.items():
+            suspect = row.pop("suspect")
+            row["lagging"] = len(suspect)
+            row["mismatched"] = self._differences(name, suspect) if suspect else []
+        return report
+
+
+_replica: Optional[ReadReplica] = None
+
+
+def enabled() -> bool:
+    return os.environ.get("PET_ADOPTION_REPLICA", "").lower() in ("1", "true", "yes", "on")
+
+
+def start_replica(source: Database, **options) -> Optional[ReadReplica]:
+    """Start following ``source`` and serve reads from the replica once it is current."""
+    global _replica
+    if backend() == "memory":
+        print("The read replica follows a MongoDB change stream; it is not available with the memory backend.")
+        return None
+    if _replica is None:
+        _replica = ReadReplica(source, **options).start()
+    return _replica
+
+
+def stop_replica():
+    global _replica
+    if _replica is not None:
+        _replica.stop()
+        _replica = None
+
+
+def serving() -> Optional[MemoryDatabase]:
+    """The replica's database, if reads may be served from it now."""
+    replica = _replica
+    return replica.database if replica is not None and replica.current() else None
+
+
+def note_write():
+    if _replica is not None:
+        _replica.last_write = time.monotonic()
+
+
+def writer(function: Callable) -> Callable:
+    """Mark a function that writes to the server: reads then skip the replica until it has caught up."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        finally:
+            note_write()
+
+    return wrapper
+
+
+def print_consistency(report: Dict[str, Dict[str, object]]):
+    for name, row in report.items():
+        print(f"{name}: {row['server']} on the server, {row['replica']} in the replica, "
+              f"{row['lagging']} behind during the check, {len(row['mismatched'])} mismatched")
+        for document_id in row["mismatched"][:20]:
+            print(f"  {document_id}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-process read replica fed by a change stream.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("sync", help="Bootstrap or resume the replica, then follow the change stream.")
+    check_parser = subparsers.add_parser("check", help="Compare the replica with the server.")
+    check_parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for the replica.")
+    args = parser.parse_args()
+
+    replica = start_replica(db)
+    if replica is None:
+        raise SystemExit(1)
+    try:
+        if args.command == "check":
+            if not replica.wait_until_current(args.timeout):
+                raise SystemExit(f"The replica did not catch up within {args.timeout:.0f}s: {replica.error}")
+            print_consistency(replica.check_consistency(args.timeout))
+        else:
+            while True:
+                time.sleep(10)
+                print(f"{'current' if replica.current() else 'behind'}, {replica.lag():.1f}s lag"
+                      + (f", {replica.error}" if replica.error else ""))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_replica()
@@ -0,0 +1,173 @@
+"""The loader's source data (names, owner addresses, breeds), compiled once into a binary cache.
+
+The raw JSON files are parsed only when the cache is missing or a source changed. String lists are stored as
+fixed-width ``.npy`` arrays that load memory-mapped; breed documents are stored as one BSON file. A source counts
+as changed when its size or mtime differs and its SHA-256 does too, so touching a file costs one hash, not a
+rebuild.
+
+Build or refresh the cache explicitly with ``python source_data.py [--rebuild]``.
+"""
+import argparse
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import bson
+import numpy as np
+
+DATA_DIR = "./data"
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+MANIFEST = os.path.join(CACHE_DIR, "manifest.json")
+CACHE_VERSION = 1
+
+NAMES_FILE = os.path.join(DATA_DIR, "random_names.json")
+OWNERS_FILE = os.path.join(DATA_DIR, "owner_data.json")
+BREEDS_FILE = os.path.join(DATA_DIR, "dog_breed_data.json")
+STRING_ARRAYS = ("names", "addresses", "cities", "countries")
+
+
+def get_dog_data() -> List[Dict]:
+    with open(BREEDS_FILE, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def get_owner_data() -> List[Dict]:
+    with open(OWNERS_FILE, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def get_random_names() -> List[str]:
+    with open(NAMES_FILE, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def get_breed_documents(dog_breeds: List[Dict]):
+    breeds = []
+    for breed_id, dog_breed in enumerate(sorted(dog_breeds, key=lambda dog_breed: dog_breed["Name"]), start=1):
+        breed_document = {
+            "_id": breed_id,
+            "name": dog_breed["Name"],
+            "description": "\n".join(dog_breed["Description"]).replace("'", ""),
+            "profile_url": dog_breed["ProfileUrl"],
+            "breed_characteristics": dog_breed["BreedCharacteristics"],
+            "vital_stats": dog_breed["VitalStats"],
+            "more_about": dog_breed["MoreAbout"],
+            "images_urls": dog_breed["ImagesUrls"],
+        }
+        breeds.append(breed_document)
+    return breeds
+
+
+@dataclass
+class SourceData:
+    names: np.ndarray
+    addresses: np.ndarray
+    cities: np.ndarray
+    countries: np.ndarray
+    # None when the breed source file is not present.
+    breed_documents: Optional[List[Dict]]
+
+
+def _fingerprint(path: str, hash_contents: bool = True) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if hash_contents:
+        with open(path, "rb") as file:
+            fingerprint["sha256"] = hashlib.sha256(file.read()).hexdigest()
+    return fingerprint
+
+
+def _sources() -> List[str]:
+    return [NAMES_FILE, OWNERS_FILE, BREEDS_FILE]
+
+
+def _cache_is_current() -> bool:
+    try:
+        with open(MANIFEST, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return False
+    if manifest.get("version") != CACHE_VERSION:
+        return False
+
+    touched = False
+    for path in _sources():
+        cached, current = manifest["sources"].get(path), _fingerprint(path, hash_contents=False)
+        if cached is None or current is None:
+            if cached != current:
+                return False
+            continue
+        if (cached["size"], cached["mtime_ns"]) == (current["size"], current["mtime_ns"]):
+            continue
+        if _fingerprint(path)["sha256"] != cached["sha256"]:
+            return False
+        cached["mtime_ns"] = current["mtime_ns"]
+        touched = True
+
+    if touched:
+        _write_manifest(manifest["sources"])
+    return True
+
+
+def _write_manifest(sources: Dict):
+    temporary = MANIFEST + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump({"version": CACHE_VERSION, "sources": sources}, file, indent=2)
+    os.replace(temporary, MANIFEST)
+
+
+def _save_array(name: str, values: List[str]):
+    path = os.path.join(CACHE_DIR, f"{name}.npy")
+    with open(path + ".tmp", "wb") as file:
+        np.save(file, np.array(values, dtype=str))
+    os.replace(path + ".tmp", path)
+
+
+def build_cache():
+    """Parse the JSON sources and write the cache. Lists are sorted so a seed reproduces the same data."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    owner_data = get_owner_data()
+    _save_array("names", get_random_names())
+    _save_array("addresses", sorted({owner["Address"]["Address"] for owner in owner_data}))
+    _save_array("cities", sorted({owner["Address"]["City"] for owner in owner_data}))
+    _save_array("countries", sorted({owner["Address"]["Country"] for owner in owner_data}))
+
+    breeds_path = os.path.join(CACHE_DIR, "breeds.bson")
+    if os.path.exists(BREEDS_FILE):
+        with open(breeds_path + ".tmp", "wb") as file:
+            file.write(bson.encode({"breeds": get_breed_documents(get_dog_data())}))
+        os.replace(breeds_path + ".tmp", breeds_path)
+    elif os.path.exists(breeds_path):
+        os.remove(breeds_path)
+
+    # The manifest goes last: a build interrupted before this point is simply redone next time.
+    _write_manifest({path: _fingerprint(path) for path in _sources()})
+    print(f"Built the source data cache in {CACHE_DIR}.")
+
+
+def load_source_data(rebuild: bool = False) -> SourceData:
+    if rebuild or not _cache_is_current():
+        build_cache()
+
+    arrays = {name: np.load(os.path.join(CACHE_DIR, f"{name}.npy"), mmap_mode="r") for name in STRING_ARRAYS}
+    breeds_path = os.path.join(CACHE_DIR, "breeds.bson")
+    breed_documents = None
+    if os.path.exists(breeds_path):
+        with open(breeds_path, "rb") as file:
+            breed_documents = bson.decode(file.read())["breeds"]
+    return SourceData(breed_documents=breed_documents, **arrays)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the loader's JSON source data into a binary cache.")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild even if the cache is current.")
+    args = parser.parse_args()
+
+    source = load_source_data(rebuild=args.rebuild)
+    print(f"{len(source.names)} names, {len(source.addresses)} addresses, {len(source.cities)} cities, "
+          f"{len(source.countries)} countries, "
+          f"{'no' if source.breed_documents is None else len(source.breed_documents)} breeds.")
@@ -0,0 +1,159 @@
+import datetime
+import struct
+from typing import Dict, List, Optional
+
+import numpy as np
+from bson import ObjectId
+
+from adoption_analytics import utc_now
+from owner_search import normalize
+
+# Loader documents get client-side ObjectIds derived from (collection tag, sequence number) so adoptions can be
+# linked to owners and dogs by index alone, without holding any inserted ids in memory.
+ID_EPOCH = 1577836800  # 2020-01-01T00:00:00Z
+OWNER_ID_TAG = 1
+DOG_ID_TAG = 2
+ADOPTION_ID_TAG = 3
+# Seeds the address shuffle table rather than any ids.
+ADDRESS_SHUFFLE_TAG = 4
+# Shuffled orderings kept per street address; repeats are fine, long addresses no longer cost factorial time.
+ADDRESS_SHUFFLES = 24
+
+
+def make_object_id(tag: int, index: int) -> ObjectId:
+    return ObjectId(struct.pack(">IB", ID_EPOCH, tag) + index.to_bytes(7, "big"))
+
+
+def make_object_ids(tag: int, indexes: np.ndarray) -> List[ObjectId]:
+    raw = np.empty((len(indexes), 12), dtype=np.uint8)
+    raw[:, :5] = np.frombuffer(struct.pack(">IB", ID_EPOCH, tag), dtype=np.uint8)
+    raw[:, 5:] = indexes.astype(">u8").view(np.uint8).reshape(-1, 8)[:, 1:]
+    buffer = raw.tobytes()
+    return [ObjectId(buffer[offset:offset + 12]) for offset in range(0, len(buffer), 12)]
+
+
+def adopted_mask(dog_indexes: np.ndarray, ignore_frequency: int) -> np.ndarray:
+    """Every ``ignore_frequency``-th generated dog is left available for adoption."""
+    return (dog_indexes + 1) % ignore_frequency != 0
+
+
+def _digit_strings(rng: np.random.Generator, count: int, width: int) -> List[str]:
+    digits = rng.integers(ord("0"), ord("9") + 1, size=count * width, dtype=np.uint8).tobytes().decode("ascii")
+    return [digits[offset:offset + width] for offset in range(0, len(digits), width)]
+
+
+class SyntheticDataGenerator:
+    """Column-at-a-time generator for owner, dog and adoption documents.
+
+    Every batch draws from its own ``numpy`` generator seeded with ``(seed, collection tag, first index)``, so a
+    given seed produces the same documents regardless of batch order or which process generates them.
+    """
+
+    def __init__(self, names: List[str], addresses: List[str], cities: List[str], countries: List[str],
+                 breeds: List[Dict], seed: Optional[int] = None, reference_time: Optional[datetime.datetime] = None,
+                 past_years: int = 5):
+        self.seed = self.new_seed() if seed is None else seed
+        self.names = np.array(names, dtype=object)
+        self.email_names = np.array([name.lower() for name in names], dtype=object)
+        # Normalized per name once, so owners get their search keys by concatenation.
+        self.search_names = np.array([normalize(name) for name in names], dtype=object)
+        self.search_email_names = np.array([normalize(name) for name in self.email_names], dtype=object)
+        self.cities = np.array(cities, dtype=object)
+        self.countries = np.array(countries, dtype=object)
+        self.breeds = np.empty(len(breeds), dtype=object)
+        self.breeds[:] = breeds
+
+        # Street addresses are stored with their words shuffled. ADDRESS_SHUFFLES orderings of each address are
+        # drawn once from the seed, so a shuffle becomes a single index into this table.
+        shuffle_rng = self._rng(ADDRESS_SHUFFLE_TAG, 0)
+        self.shuffled_addresses = np.empty((len(addresses), ADDRESS_SHUFFLES), dtype=object)
+        for address_index, address in enumerate(addresses):
+            words = np.tile(np.array(address.split(), dtype=object), (ADDRESS_SHUFFLES, 1))
+            self.shuffled_addresses[address_index] = [" ".join(row) for row in shuffle_rng.permuted(words, axis=1)]
+
+        reference_time = reference_time or utc_now()
+        self.past_start = np.datetime64(reference_time - datetime.timedelta(days=past_years * 365), "s")
+        self.past_days = past_years * 365
+
+    @staticmethod
+    def new_seed() -> int:
+        # Fresh entropy, kept within 63 bits so the seed can be stored as a BSON int64.
+        return np.random.SeedSequence().entropy % (2 ** 63)
+
+    def _rng(self, tag: int, start: int) -> np.random.Generator:
+        return np.random.default_rng([self.seed, tag, start])
+
+    def owners(self, start: int, count: int) -> List[Dict]:
+        rng = self._rng(OWNER_ID_TAG, start)
+        first, last = rng.integers(0, len(self.names), size=(2, count))
+        addresses = rng.integers(0, len(self.shuffled_addresses), size=count)
+        shuffles = rng.integers(0, ADDRESS_SHUFFLES, size=count)
+
+        indexes = np.arange(start, start + count)
+        ids = make_object_ids(OWNER_ID_TAG, indexes)
+        names = (self.names[first] + " " + self.names[last]).tolist()
+        # The sequence number keeps emails unique across any number of owners.
+        sequence = indexes.astype(str).astype(object)
+        emails = (self.email_names[first] + "." + self.email_names[last] + sequence + "@puppyworld.in").tolist()
+        search_names = (self.search_names[first] + " " + self.search_names[last]).tolist()
+        search_emails = (self.search_email_names[first] + "." + self.search_email_names[last] + sequence
+                         + "@puppyworld.in").tolist()
+        mobiles = _digit_strings(rng, count, 10)
+        streets = self.shuffled_addresses[addresses, shuffles].tolist()
+        cities = self.cities[rng.integers(0, len(self.cities), size=count)].tolist()
+        countries = self.countries[rng.integers(0, len(self.countries), size=count)].tolist()
+        zip_codes = _digit_strings(rng, count, 5)
+
+        return [{
+            "_id": owner_id,
+            "name": name,
+            "email": email,
+            "mobile": mobile,
+            "address": {
+                "street": street,
+                "city": city,
+                "country": country,
+                "zip": zip_code
+            },
+            "search": {"name": search_name, "email": search_email}
+        } for owner_id, name, email, mobile, street, city, country, zip_code, search_name, search_email
+            in zip(ids, names, emails, mobiles, streets, cities, countries, zip_codes, search_names, search_emails)]
+
+    def dogs(self, start: int, count: int, ignore_frequency: int = 10) -> List[Dict]:
+        rng = self._rng(DOG_ID_TAG, start)
+        dog_indexes = np.arange(start, start + count)
+        ids = make_object_ids(DOG_ID_TAG, dog_indexes)
+        adoption_ids = make_object_ids(ADOPTION_ID_TAG, dog_indexes)
+        adopted = adopted_mask(dog_indexes, ignore_frequency).tolist()
+        breeds = self.breeds[rng.integers(0, len(self.breeds), size=count)].tolist()
+        names = self.names[rng.integers(0, len(self.names), size=count)].tolist()
+        countries = self.countries[rng.integers(0, len(self.countries), size=count)].tolist()
+
+        return [{
+            "_id": dog_id,
+            "breed": breed,
+            "name": name,
+            "country": country,
+            "adoption_id": adoption_id if is_adopted else None
+        } for dog_id, breed, name, country, adoption_id, is_adopted
+            in zip(ids, breeds, names, countries, adoption_ids, adopted)]
+
+    def adoptions(self, start: int, count: int, num_owners: int, ignore_frequency: int = 10) -> List[Dict]:
+        """Adoptions for dogs ``start .. start + count - 1``, skipping every ``ignore_frequency``-th dog."""
+        rng = self._rng(ADOPTION_ID_TAG, start)
+        dog_indexes = np.arange(start, start + count)
+        dog_indexes = dog_indexes[adopted_mask(dog_indexes, ignore_frequency)]
+        adopted = len(dog_indexes)
+
+        ids = make_object_ids(ADOPTION_ID_TAG, dog_indexes)
+        dog_ids = make_object_ids(DOG_ID_TAG, dog_indexes)
+        owner_ids = make_object_ids(OWNER_ID_TAG, rng.integers(0, num_owners, size=adopted))
+        offsets = rng.integers(0, self.past_days + 1, size=adopted) * 86400 + rng.integers(0, 86400, size=adopted)
+        adoption_dates = (self.past_start + offsets.astype("timedelta64[s]")).tolist()
+
+        return [{
+            "_id": adoption_id,
+            "dog_id": dog_id,
+            "owner_id": owner_id,
+            "adoption_date": adoption_date
+        } for adoption_id, dog_id, owner_id, adoption_date in zip(ids, dog_ids, owner_ids, adoption_dates)]
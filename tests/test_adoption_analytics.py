@@ -0,0 +1,75 @@
+import contextlib
+import io
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import adoption_analytics
+import app
+from adoption_analytics import adoption_counts, build_rollups
+from indexes import ensure_indexes
+from memory_backend import MemoryDatabase
+
+START, END = datetime(2024, 1, 1), datetime(2025, 1, 1)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    rng = random.Random(11)
+    database = MemoryDatabase("analytics_test")
+    owners = [{"_id": ObjectId(), "name": f"Owner {number}", "email": f"owner{number}@example.com",
+               "address": {"city": "City", "zip": "00000", "country": rng.choice(["NL", "DE"])}}
+              for number in range(60)]
+    dogs = [{"_id": ObjectId(), "name": f"Dog {number}", "breed": {"_id": number % 3, "name": f"Breed {number % 3}"}}
+            for number in range(200)]
+    adoptions = []
+    for dog in dogs:
+        adoption = {"_id": ObjectId(), "dog_id": dog["_id"], "owner_id": rng.choice(owners)["_id"],
+                    "adoption_date": START + timedelta(hours=rng.randrange(24 * 365))}
+        dog["adoption_id"] = adoption["_id"]
+        adoptions.append(adoption)
+    database.owner.insert_many(owners)
+    database.dog.insert_many(dogs)
+    database.adoption.insert_many(adoptions)
+    with contextlib.redirect_stdout(io.StringIO()):
+        ensure_indexes(database)
+        build_rollups(database)
+    monkeypatch.setattr(app, "db", database)
+    app.query_cache.clear()
+    return database
+
+
+def _counts(database, granularity, dimension):
+    return [(row["start"], row["value"], row["count"])
+            for row in adoption_counts(database, START, END, granularity, dimension)]
+
+
+def _live_counts(database, granularity, dimension):
+    # With no watermark every segment is counted live from the adoptions.
+    watermark = adoption_analytics.get_watermark
+    adoption_analytics.get_watermark = lambda database, session=None: None
+    try:
+        return _counts(database, granularity, dimension)
+    finally:
+        adoption_analytics.get_watermark = watermark
+
+
+@pytest.mark.parametrize("granularity", ["day", "month"])
+@pytest.mark.parametrize("dimension", ["all", "breed", "country"])
+def test_deletes_are_taken_out_of_the_rollups(database, granularity, dimension):
+    owner = database.adoption.find_one({})["owner_id"]
+    dogs = [str(adoption["dog_id"]) for adoption in database.adoption.find({"owner_id": {"$ne": owner}}).limit(6)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        app.delete_owner(owner)
+        app.delete_dog_entry(dogs[0])
+        app.delete_dogs(dogs[1:])
+
+    assert database.adoption.count_documents({}) < 193
+    assert _counts(database, granularity, dimension) == _live_counts(database, granularity, dimension)
+
+
+def test_utc_now_is_naive_utc():
+    now = adoption_analytics.utc_now()
+    assert now.tzinfo is None and abs((now - datetime.utcnow()).total_seconds()) < 5
@@ -0,0 +1,99 @@
+import contextlib
+import io
+
+import pytest
+from bson import ObjectId
+
+import app
+import data_loader
+import facet_counts
+from adoption_analytics import utc_now
+from facet_counts import build_facet_counts, get_facet_count
+from indexes import ensure_indexes
+from memory_backend import MemoryDatabase
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = MemoryDatabase("writes_test")
+    database.owner.insert_many([{"_id": ObjectId(), "name": f"Owner {number}", "email": f"owner{number}@example.com",
+                                 "address": {"city": "City", "zip": "00000", "country": "NL"}}
+                                for number in range(3)])
+    database.dog.insert_many([{"_id": ObjectId(), "name": f"Dog {number}", "breed": {"_id": 0, "name": "Breed"},
+                               "adoption_id": None} for number in range(4)])
+    with contextlib.redirect_stdout(io.StringIO()):
+        ensure_indexes(database)
+    monkeypatch.setattr(app, "db", database)
+    app.query_cache.clear()
+    facet_counts.built_databases.discard(database.name)
+    return database
+
+
+def _ids(database, collection_name):
+    return [document["_id"] for document in database[collection_name].find({}).sort("_id", 1)]
+
+
+def test_a_dog_is_adopted_only_once(database):
+    owners, dogs = _ids(database, "owner"), _ids(database, "dog")
+    adoption_id = app.adopt_new_pet(str(owners[0]), str(dogs[0]))
+
+    with pytest.raises(ValueError):
+        app.adopt_new_pet(str(owners[1]), str(dogs[0]))
+    with pytest.raises(ValueError):
+        app.adopt_new_pet(str(owners[1]), str(ObjectId()))
+    assert [adoption["_id"] for adoption in database.adoption.find({})] == [adoption_id]
+    assert database.dog.find_one({"_id": dogs[0]})["adoption_id"] == adoption_id
+
+
+def test_bulk_adoptions_report_dogs_that_are_taken(database):
+    owner, dogs = str(_ids(database, "owner")[0]), [str(dog_id) for dog_id in _ids(database, "dog")]
+    app.adopt_new_pet(owner, dogs[0])
+    result = app.adopt_pets([(owner, dogs[0]), (owner, dogs[1]), (owner, dogs[1]), (owner, str(ObjectId())),
+                             ("not an id", dogs[2]), (owner, dogs[3])], chunk_size=4)
+
+    assert sorted(result.errors) == [0, 2, 3, 4] and result.succeeded == 2
+    assert result.results[0] is None and result.results[1] and result.results[5]
+    adoptions = {adoption["_id"]: adoption["dog_id"] for adoption in database.adoption.find({})}
+    assert len(adoptions) == 3
+    for adoption_id, dog_id in adoptions.items():
+        assert database.dog.find_one({"_id": dog_id})["adoption_id"] == adoption_id
+
+
+def test_bulk_renames_and_deletes_fail_for_missing_dogs(database):
+    dogs = [str(dog_id) for dog_id in _ids(database, "dog")]
+    missing = str(ObjectId())
+    renamed = app.rename_dogs([(dogs[0], "Rex"), (missing, "Ghost"), ("not an id", "Nobody")])
+    assert renamed.results == [True, False, False] and sorted(renamed.errors) == [1, 2] and renamed.succeeded == 1
+    assert database.dog.find_one({"_id": ObjectId(dogs[0])})["name"] == "Rex"
+
+    deleted = app.delete_dogs([dogs[0], missing, dogs[0], dogs[1]])
+    assert deleted.results == [True, False, False, True] and sorted(deleted.errors) == [1, 2]
+    assert deleted.succeeded == 2 and database.dog.count_documents({}) == 2
+
+
+def test_adoption_dates_are_naive_utc(database):
+    owner, dogs = str(_ids(database, "owner")[0]), [str(dog_id) for dog_id in _ids(database, "dog")]
+    before = utc_now()
+    app.adopt_new_pet(owner, dogs[0])
+    app.adopt_pets([(owner, dogs[1])])
+    for adoption in database.adoption.find({}):
+        assert adoption["adoption_date"].tzinfo is None and before <= adoption["adoption_date"] <= utc_now()
+
+
+def test_facet_counts_are_left_alone_until_built(database, monkeypatch):
+    dogs = [str(dog_id) for dog_id in _ids(database, "dog")]
+    with contextlib.redirect_stdout(io.StringIO()):
+        app.delete_dog_entry(dogs[0])
+    assert database.stats.count_documents({}) == 0
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        build_facet_counts(database)
+        app.delete_dog_entry(dogs[1])
+    assert get_facet_count(database, "dog.breed", "Breed") == 2
+
+    monkeypatch.setattr(data_loader, "db", database)
+    with contextlib.redirect_stdout(io.StringIO()):
+        data_loader.clear_database()
+    assert not facet_counts.facet_counts_built(database)
+    app.add_owner({"name": "New Owner", "email": "new@example.com", "address": {"city": "City", "country": "NL"}})
+    assert database.stats.count_documents({}) == 0
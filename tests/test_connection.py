@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from pymongo.errors import OperationFailure
+
+import connection
+from connection import ILLEGAL_OPERATION, run_in_transaction, run_in_transaction_async
+from memory_backend import MemoryDatabase
+
+
+class _Session:
+    def __init__(self, error=None):
+        self.error = error
+
+    def with_transaction(self, callback):
+        if self.error:
+            raise self.error
+        return callback(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class _AsyncSession(_Session):
+    async def with_transaction(self, callback):
+        if self.error:
+            raise self.error
+        return await callback(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class _Client:
+    def __init__(self, session):
+        self.session = session
+
+    def start_session(self):
+        return self.session
+
+
+class _Database:
+    def __init__(self, name, session):
+        self.name = name
+        self.client = _Client(session)
+
+
+@pytest.fixture(autouse=True)
+def without_transactions(monkeypatch):
+    monkeypatch.setattr(connection, "_without_transactions", set())
+
+
+def _run_async(database):
+    async def callback(session):
+        return session
+
+    return asyncio.run(run_in_transaction_async(database, callback))
+
+
+def test_callback_runs_in_a_session_when_transactions_are_supported():
+    session = _Session()
+    assert run_in_transaction(_Database("replica_set", session), lambda session: session) is session
+    session = _AsyncSession()
+    assert _run_async(_Database("replica_set", session)) is session
+
+
+@pytest.mark.parametrize("error", [OperationFailure("no transactions", ILLEGAL_OPERATION), NotImplementedError()])
+def test_callback_runs_without_a_session_where_transactions_are_unsupported(error):
+    assert run_in_transaction(_Database("standalone", _Session(error)), lambda session: session) is None
+    assert _run_async(_Database("standalone_async", _AsyncSession(error))) is None
+    assert connection._without_transactions == {"standalone", "standalone_async"}
+
+
+def test_memory_backend_runs_without_a_session():
+    assert _run_async(MemoryDatabase("memory")) is None
+    assert run_in_transaction(MemoryDatabase("memory"), lambda session: session) is None
+
+
+def test_other_server_errors_are_raised():
+    error = OperationFailure("write conflict", 112)
+    with pytest.raises(OperationFailure):
+        run_in_transaction(_Database("replica_set", _Session(error)), lambda session: session)
+    with pytest.raises(OperationFailure):
+        _run_async(_Database("replica_set", _AsyncSession(error)))
+    assert not connection._without_transactions
@@ -0,0 +1,126 @@
+import argparse
+import contextlib
+import io
+
+import bson
+import pytest
+from pymongo.errors import BulkWriteError
+
+import data_loader
+from indexes import ensure_indexes
+from memory_backend import MemoryDatabase
+from synthetic_data import DOG_ID_TAG, OWNER_ID_TAG, SyntheticDataGenerator, make_object_id
+
+BREEDS = [{"_id": number, "name": f"Breed {number}"} for number in range(3)]
+ENTRIES, BATCH_SIZE = 50, 10
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = MemoryDatabase("loader_test")
+    monkeypatch.setattr(data_loader, "db", database)
+    return database
+
+
+def _generator(plan, breed_references) -> SyntheticDataGenerator:
+    return SyntheticDataGenerator(["Ann", "Bob", "Cy"], ["1 Main Street", "22 Side Road West"], ["Delft", "Gouda"],
+                                  ["NL", "BE"], breed_references, seed=plan["seed"],
+                                  reference_time=plan["reference_time"])
+
+
+def _quietly(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def _start(seed: int = 3):
+    plan, breed_references = _quietly(data_loader.start_load, BREEDS, ENTRIES, BATCH_SIZE, seed)
+    return plan, _generator(plan, breed_references)
+
+
+def _contents(database):
+    return {name: sorted(database[name].find({}), key=lambda document: document["_id"])
+            for name in ("owner", "dog", "adoption")}
+
+
+def _plan(append: bool = False, resume: bool = False, **options):
+    return _quietly(data_loader.plan_load, argparse.Namespace(append=append, resume=resume, **options), None)
+
+
+def test_resumed_load_finishes_without_duplicates(database, monkeypatch):
+    plan, generator = _start()
+    _quietly(data_loader.run_load, generator, plan)
+    expected = _contents(database)
+
+    plan, generator = _start()
+    record_batch, recorded = data_loader.record_batch, []
+
+    def interrupted(collection_name, start, size):
+        # The third batch is written but stops before its checkpoint, so resuming replays it.
+        if len(recorded) == 7:
+            raise KeyboardInterrupt
+        recorded.append((collection_name, start))
+        record_batch(collection_name, start, size)
+
+    monkeypatch.setattr(data_loader, "record_batch", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        _quietly(data_loader.run_load, generator, plan)
+    monkeypatch.setattr(data_loader, "record_batch", record_batch)
+    assert database.dog.count_documents({}) == 3 * BATCH_SIZE
+
+    plan, breed_references = _plan(resume=True)
+    assert [start for _, start in recorded[5:]] == [0, 10]
+    assert data_loader.pending_batches(plan, "dog") == [(20, 10), (30, 10), (40, 10)]
+    _quietly(data_loader.run_load, _generator(plan, breed_references), plan)
+
+    assert _contents(database) == expected
+    assert data_loader.get_load_plan()["status"] == "done"
+    with pytest.raises(SystemExit):
+        _plan(resume=True)
+
+
+def test_append_continues_the_id_and_email_sequences(database):
+    plan, generator = _start()
+    _quietly(data_loader.run_load, generator, plan)
+    _quietly(ensure_indexes, database)
+
+    plan, breed_references = _plan(append=True, max_entries=20, batch_size=BATCH_SIZE)
+    assert (plan["owner"], plan["dog"]) == ({"start": 50, "end": 70}, {"start": 50, "end": 70})
+    reports = _quietly(data_loader.run_load, _generator(plan, breed_references), plan)
+
+    assert [report.documents for report in reports[:2]] == [20, 20]
+    owners = list(database.owner.find({}).sort("_id", 1))
+    assert [owner["_id"] for owner in owners] == [make_object_id(OWNER_ID_TAG, index) for index in range(70)]
+    assert len({owner["email"] for owner in owners}) == 70
+    assert owners[69]["email"].endswith("69@puppyworld.in")
+    assert database.dog.find_one({"_id": make_object_id(DOG_ID_TAG, 69)}) is not None
+    # Appended adoptions can go to any owner, old or new, but only to owners that exist.
+    owner_ids = {owner["_id"] for owner in owners}
+    assert all(adoption["owner_id"] in owner_ids for adoption in database.adoption.find({}))
+
+
+def test_replayed_batch_inserts_only_the_missing_documents(database):
+    plan, generator = _start()
+    raw_documents = [bson.encode(owner) for owner in generator.owners(0, 10)]
+    assert data_loader.insert_raw_batch(database.owner, raw_documents[:4]) == 4
+    assert data_loader.insert_raw_batch(database.owner, raw_documents) == 6
+    assert database.owner.count_documents({}) == 10
+
+    _quietly(ensure_indexes, database)
+    clash = generator.owners(10, 1)[0]
+    clash["email"] = bson.decode(raw_documents[0])["email"]
+    with pytest.raises(BulkWriteError):
+        data_loader.insert_raw_batch(database.owner, raw_documents + [bson.encode(clash)])
+
+
+def test_pipelined_load_matches_the_serial_one(database):
+    plan, generator = _start(seed=8)
+    _quietly(data_loader.run_load, generator, plan)
+    expected = _contents(database)
+
+    plan, generator = _start(seed=8)
+    reports = _quietly(data_loader.run_load, generator, plan, parallel=True, workers=2, writers=3, queue_depth=2)
+    assert [report.documents for report in reports] == [len(expected[name]) for name in ("owner", "dog", "adoption")]
+    assert _contents(database) == expected
+    assert data_loader.get_load_plan()["status"] == "done"
+
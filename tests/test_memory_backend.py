@@ -0,0 +1,188 @@
+import contextlib
+import io
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+import app
+import pagination
+from indexes import ensure_indexes
+from memory_backend import MemoryDatabase
+from pagination import fetch_page
+
+OWNERS = 3000
+CITIES = [f"City {number}" for number in range(40)]
+BREEDS = [f"Breed {number}" for number in range(8)]
+
+
+@pytest.fixture(scope="module")
+def database():
+    rng = random.Random(7)
+    database = MemoryDatabase("test")
+    owners = [{"_id": ObjectId(), "name": f"Owner {rng.randrange(500)}", "email": f"owner{number}@example.com",
+               "address": {"city": rng.choice(CITIES), "zip": f"{rng.randrange(300):05d}",
+                           "country": rng.choice(["NL", "DE", "FR"])}} for number in range(OWNERS)]
+    dogs = [{"_id": ObjectId(), "name": f"Dog {rng.randrange(200)}", "country": "NL",
+             "breed": {"_id": number % len(BREEDS), "name": BREEDS[number % len(BREEDS)]}, "adoption_id": None}
+            for number in range(OWNERS)]
+    adoptions = []
+    for dog in dogs[::3]:
+        adoption = {"_id": ObjectId(), "dog_id": dog["_id"], "owner_id": rng.choice(owners)["_id"],
+                    "adoption_date": datetime(2024, 1, 1) + timedelta(hours=rng.randrange(24 * 365))}
+        dog["adoption_id"] = adoption["_id"]
+        adoptions.append(adoption)
+    database.owner.insert_many(owners)
+    database.dog.insert_many(dogs)
+    database.adoption.insert_many(adoptions)
+    with contextlib.redirect_stdout(io.StringIO()):
+        ensure_indexes(database)
+    return database
+
+
+@pytest.fixture
+def app_database(database, monkeypatch):
+    monkeypatch.setattr(app, "db", database)
+    app.query_cache.clear()
+    return database
+
+
+def _all(database, collection_name):
+    return list(database[collection_name].documents.values())
+
+
+def _explain(cursor):
+    explain = cursor.explain()
+    return explain["queryPlanner"]["winningPlan"].get("indexName"), explain["executionStats"]["totalDocsExamined"]
+
+
+def test_equality_on_leading_field_beats_id_sort(database):
+    city = CITIES[3]
+    index, examined = _explain(database.owner.find({"address.city": city}).sort("_id", 1).limit(10))
+    assert index == "address_city_id"
+    assert examined == 10
+
+
+def test_keyset_page_scans_only_its_page(database):
+    city = CITIES[5]
+    first = sorted((owner for owner in _all(database, "owner") if owner["address"]["city"] == city),
+                   key=lambda owner: owner["_id"])
+    query = {"address.city": city, "_id": {"$gt": first[9]["_id"]}}
+    index, examined = _explain(database.owner.find(query).sort("_id", 1).limit(10))
+    assert index == "address_city_id"
+    # Index bounds are inclusive, so the entry the page starts after is read too.
+    assert examined <= min(10, len(first) - 10) + 1
+
+
+def test_equality_and_sort_on_compound_index(database):
+    index, examined = _explain(database.dog.find({"breed.name": BREEDS[2]}).sort([("name", 1), ("_id", 1)]).limit(5))
+    assert index == "breed_name_name_id"
+    assert examined == 5
+
+
+def test_in_uses_index_and_unindexed_falls_back_to_scan(database):
+    ids = [owner["_id"] for owner in _all(database, "owner")[:3]]
+    assert _explain(database.owner.find({"_id": {"$in": ids}})) == ("_id_", 3)
+    assert _explain(database.owner.find({"mobile": "none"}))[0] is None
+
+
+def test_unsorted_limit_stops_at_limit(database):
+    assert _explain(database.owner.find({"name": {"$regex": "^Owner"}}).limit(5)) == (None, 5)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ({"address.country": "NL", "address.city": {"$in": CITIES[:5]}},
+     lambda owner: owner["address"]["country"] == "NL" and owner["address"]["city"] in CITIES[:5]),
+    ({"$or": [{"address.zip": "00001"}, {"name": "Owner 7"}]},
+     lambda owner: owner["address"]["zip"] == "00001" or owner["name"] == "Owner 7"),
+    ({"address.zip": {"$gte": "00100", "$lt": "00110"}}, lambda owner: "00100" <= owner["address"]["zip"] < "00110"),
+    ({"name": {"$not": {"$regex": "1"}}, "address.country": {"$ne": "DE"}},
+     lambda owner: "1" not in owner["name"] and owner["address"]["country"] != "DE"),
+    ({"mobile": {"$exists": False}, "email": {"$nin": ["owner1@example.com"]}},
+     lambda owner: owner["email"] != "owner1@example.com"),
+])
+def test_find_matches_like_python(database, query, expected):
+    found = {owner["_id"] for owner in database.owner.find(query)}
+    assert found == {owner["_id"] for owner in _all(database, "owner") if expected(owner)}
+
+
+def test_sort_orders_by_type_then_value_in_both_directions():
+    database = MemoryDatabase("sort")
+    database.items.insert_many([{"value": value} for value in ["b", 2, None, "a", 1.5, True]])
+    database.items.insert_one({})
+    ascending = [document.get("value", "missing") for document in database.items.find({}).sort("value", 1)]
+    assert ascending[:2] in ([None, "missing"], ["missing", None])
+    assert ascending[2:] == [1.5, 2, "a", "b", True]
+    descending = [document.get("value", "missing") for document in database.items.find({}).sort("value", -1)]
+    assert descending[:5] == [True, "b", "a", 2, 1.5]
+
+
+def test_keyset_pages_cover_the_collection_in_order(database):
+    seen, token = [], None
+    while True:
+        page, token = fetch_page(database.dog, {}, [("name", 1), ("_id", 1)], 250, token, {"name": 1})
+        seen += page
+        if token is None:
+            break
+    expected = sorted(_all(database, "dog"), key=lambda dog: (dog["name"], dog["_id"]))
+    assert [dog["_id"] for dog in seen] == [dog["_id"] for dog in expected]
+
+
+@pytest.mark.parametrize("page_size", [0, -1])
+def test_page_size_below_one_is_rejected(database, page_size):
+    with pytest.raises(ValueError):
+        fetch_page(database.owner, {}, [("_id", 1)], page_size)
+
+
+def test_page_size_is_capped(database, monkeypatch):
+    monkeypatch.setattr(pagination, "MAX_PAGE_SIZE", 100)
+    page, token = fetch_page(database.owner, {}, [("_id", 1)], 10 ** 9)
+    assert len(page) == 100 and token is not None
+    assert fetch_page(database.owner, {}, [("_id", 1)], 10 ** 9, token)[0][0]["_id"] > page[-1]["_id"]
+
+
+def test_group_and_lookup(database):
+    counts = {row["_id"]: row["count"] for row in database.dog.aggregate([
+        {"$match": {"adoption_id": {"$ne": None}}},
+        {"$group": {"_id": "$breed.name", "count": {"$sum": 1}}},
+    ])}
+    expected = {}
+    for dog in _all(database, "dog"):
+        if dog["adoption_id"] is not None:
+            expected[dog["breed"]["name"]] = expected.get(dog["breed"]["name"], 0) + 1
+    assert counts == expected
+
+    adoption = _all(database, "adoption")[0]
+    joined = list(database.adoption.aggregate([
+        {"$match": {"_id": adoption["_id"]}},
+        {"$lookup": {"from": "dog", "localField": "dog_id", "foreignField": "_id", "as": "dog",
+                     "pipeline": [{"$project": {"name": 1}}]}},
+    ]))
+    assert [dog["_id"] for dog in joined[0]["dog"]] == [adoption["dog_id"]]
+    assert set(joined[0]["dog"][0]) == {"_id", "name"}
+
+
+def test_app_queries(app_database):
+    owner = _all(app_database, "owner")[0]
+    city = owner["address"]["city"]
+    expected = sorted((other["_id"] for other in _all(app_database, "owner") if other["address"]["city"] == city))
+    assert [found["_id"] for found in app.search_owners_by_city(city)] == expected[:10]
+
+    adopted = [adoption["dog_id"] for adoption in _all(app_database, "adoption")
+               if adoption["owner_id"] == _all(app_database, "adoption")[0]["owner_id"]]
+    dogs = app.find_top_5_dogs_by_owner(str(_all(app_database, "adoption")[0]["owner_id"]))
+    assert {dog["_id"] for dog in dogs} <= set(adopted) and dogs == sorted(dogs, key=lambda dog: dog["name"])
+
+
+def test_unique_index_rejects_duplicates(database):
+    with pytest.raises(DuplicateKeyError):
+        database.owner.insert_one({"email": "owner0@example.com"})
+
+
+def test_background_index_build_does_not_print(capsys):
+    database = MemoryDatabase("background_indexes")
+    ensure_indexes(database, wait=False).join()
+    assert capsys.readouterr().out == ""
+    assert "email_unique" in database.owner.index_information()
@@ -0,0 +1,106 @@
+import contextlib
+import io
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import adoption_analytics
+import app
+from adoption_analytics import adoption_counts, build_rollups
+from facet_counts import FACETS, build_facet_counts, get_facet_count
+from indexes import ensure_indexes
+from memory_backend import MemoryDatabase
+from migrations import find_orphan_adoptions, repair_orphans
+
+START, END = datetime(2024, 1, 1), datetime(2025, 1, 1)
+CITIES = ["Delft", "Gouda", "Breda"]
+BREEDS = ["Beagle", "Collie"]
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = MemoryDatabase("owner_delete_test")
+    owners = [{"_id": ObjectId(), "name": f"Owner {number}", "email": f"owner{number}@example.com",
+               "address": {"city": CITIES[number % 3], "zip": f"{number % 2:05d}",
+                           "country": ["NL", "BE"][number % 2]}}
+              for number in range(6)]
+    dogs = [{"_id": ObjectId(), "name": f"Dog {number}", "breed": {"_id": number % 2, "name": BREEDS[number % 2]},
+             "adoption_id": None} for number in range(12)]
+    adoptions = []
+    # Owners 0-3 adopt two dogs each, owners 4 and 5 none; dogs 8-11 stay available.
+    for number, dog in enumerate(dogs[:8]):
+        adoption = {"_id": ObjectId(), "dog_id": dog["_id"], "owner_id": owners[number // 2]["_id"],
+                    "adoption_date": START + timedelta(days=40 * number)}
+        dog["adoption_id"] = adoption["_id"]
+        adoptions.append(adoption)
+    database.owner.insert_many(owners)
+    database.dog.insert_many(dogs)
+    database.adoption.insert_many(adoptions)
+    with contextlib.redirect_stdout(io.StringIO()):
+        ensure_indexes(database)
+        build_facet_counts(database)
+        build_rollups(database)
+    monkeypatch.setattr(app, "db", database)
+    app.query_cache.clear()
+    return database
+
+
+def _owner_ids(database):
+    return [owner["_id"] for owner in database.owner.find({}).sort("_id", 1)]
+
+
+def _counts(database, dimension):
+    return [(row["start"], row["value"], row["count"]) for row in adoption_counts(database, START, END, "month",
+                                                                                  dimension)]
+
+
+def _assert_facet_counts_are_live(database):
+    for facet, (collection_name, field) in FACETS.items():
+        stored = database.stats.distinct("_id.value", {"_id.facet": facet})
+        for value in database[collection_name].distinct(field) + stored:
+            assert get_facet_count(database, facet, value) == database[collection_name].count_documents({field: value})
+
+
+def _assert_rollups_match_adoptions(database, monkeypatch):
+    rolled_up = {dimension: _counts(database, dimension) for dimension in ("all", "breed", "country")}
+    monkeypatch.setattr(adoption_analytics, "get_watermark", lambda database, session=None: None)
+    assert rolled_up == {dimension: _counts(database, dimension) for dimension in ("all", "breed", "country")}
+
+
+def test_deleting_owners_removes_their_dogs_and_adoptions(database, monkeypatch):
+    owners = _owner_ids(database)
+    monkeypatch.setattr(app, "OWNERS_PER_TRANSACTION", 2)
+    with contextlib.redirect_stdout(io.StringIO()):
+        deleted = app.delete_owners([str(owners[0]), owners[1], owners[4], ObjectId()], chunk_size=1)
+
+    assert deleted == {"owners": 3, "dogs": 4, "adoptions": 4}
+    assert _owner_ids(database) == [owners[2], owners[3], owners[5]]
+    assert database.dog.count_documents({}) == 8 and database.adoption.count_documents({}) == 4
+    assert list(find_orphan_adoptions(database)) == []
+    assert get_facet_count(database, "owner.city", CITIES[1]) == 0
+    _assert_facet_counts_are_live(database)
+    _assert_rollups_match_adoptions(database, monkeypatch)
+
+
+def test_orphans_left_by_an_interrupted_cascade_are_repaired(database):
+    owners = _owner_ids(database)
+    # As if cascades stopped part-way: an owner deleted before its dogs, and a dog deleted before its adoption row.
+    database.owner.delete_one({"_id": owners[0]})
+    lost_dog = database.dog.find_one_and_delete({"_id": database.adoption.find_one({"owner_id": owners[1]})["dog_id"]},
+                                                {"breed.name": 1})
+
+    orphans = list(find_orphan_adoptions(database))
+    assert sorted((orphan["owner_missing"], orphan["dog_missing"]) for orphan in orphans) == [
+        (False, True), (True, False), (True, False)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert repair_orphans(database, dry_run=True)["adoptions_deleted"] == 0
+        found = repair_orphans(database, batch_size=2)
+
+    assert found == {"missing_owner": 2, "missing_dog": 1, "dogs_deleted": 2, "adoptions_deleted": 3}
+    assert list(find_orphan_adoptions(database)) == []
+    assert database.dog.count_documents({}) == 9 and database.adoption.count_documents({}) == 5
+    for breed in BREEDS:
+        # The directly deleted dog was never decremented; the stranded dogs the repair removed were.
+        live = database.dog.count_documents({"breed.name": breed})
+        assert get_facet_count(database, "dog.breed", breed) - live == (breed == lost_dog["breed"]["name"])
@@ -0,0 +1,95 @@
+import contextlib
+import io
+from datetime import datetime
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+import owner_search
+from memory_backend import MemoryDatabase
+from owner_search import OwnerSearchIndex, get_search_index, search_keys
+
+
+def _owner(name: str, owner_id: ObjectId = None):
+    owner = {"_id": owner_id or ObjectId(), "name": name, "email": f"{name.split()[0].lower()}@example.com"}
+    owner["search"] = search_keys(owner)
+    return owner
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(owner_search, "INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(owner_search, "_indexes", {})
+    database = MemoryDatabase("search_test")
+    database.owner.insert_many([_owner(name) for name in ("Alice Smith", "Bob Jones", "Carol White")])
+    return database
+
+
+def _build(database) -> OwnerSearchIndex:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return owner_search.build_search_index(database)
+
+
+def _found(index: OwnerSearchIndex, query: str):
+    return [owner_id for owner_id, _ in index.search(query, 1)]
+
+
+def test_saved_index_loads_only_for_its_database(database):
+    _build(database)
+    loaded = OwnerSearchIndex.load(database)
+    assert loaded is not None and loaded.size == 3
+    assert OwnerSearchIndex.load(MemoryDatabase("other")) is None
+
+
+def test_arrays_that_do_not_match_the_manifest_are_not_loaded(database):
+    _build(database)
+    np.save(f"{owner_search.index_directory(database)}/ids.npy", np.array([b"x" * 12], dtype="S12"))
+    assert OwnerSearchIndex.load(database) is None
+
+
+def test_index_is_rebuilt_when_owners_were_added_without_a_change_stream(database):
+    _build(database)
+    # A loader ObjectId from 2020 sorts below every id in the index, so an _id watermark would miss it.
+    old = _owner("Dmitri Ivanov", ObjectId.from_datetime(datetime(2020, 1, 1)))
+    database.owner.insert_one(old)
+    with contextlib.redirect_stdout(io.StringIO()):
+        index = get_search_index(database)
+    assert index.size == 4 and _found(index, "dmitri ivanov") == [old["_id"]]
+
+
+class _Stream:
+    def __init__(self, changes):
+        self.changes = list(changes)
+        self.resume_token = {"_data": "0"}
+
+    def try_next(self):
+        if not self.changes:
+            return None
+        self.resume_token = {"_data": str(len(self.changes))}
+        return self.changes.pop(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def test_catch_up_applies_inserts_and_deletes_from_the_change_stream(database, monkeypatch):
+    index = OwnerSearchIndex.build(database)
+    index.resume_token = {"_data": "start"}
+    alice = database.owner.find_one({"name": "Alice Smith"})["_id"]
+    old = _owner("Dmitri Ivanov", ObjectId.from_datetime(datetime(2020, 1, 1)))
+    changes = [{"operationType": "insert", "fullDocument": old},
+               {"operationType": "delete", "documentKey": {"_id": alice}}]
+    monkeypatch.setattr(owner_search, "_watch_owners", lambda database, resume_after=None: _Stream(changes))
+
+    assert index.catch_up(database) == 2
+    assert index.size == 3 and index.resume_token == {"_data": "1"}
+    assert _found(index, "dmitri ivanov") == [old["_id"]]
+    assert alice not in [owner_id for owner_id, _ in index.search("alice smith", 3)]
+
+
+def test_catch_up_without_a_change_stream_reports_it(database):
+    assert OwnerSearchIndex.build(database).catch_up(database) is None
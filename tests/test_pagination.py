@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from memory_backend import MemoryDatabase
+from pagination import decode_token, encode_token, iter_documents, page_query
+
+BY_BREED = [("breed.name", 1), ("name", -1), ("_id", 1)]
+
+
+def test_token_round_trips_the_last_sort_values():
+    dog = {"_id": ObjectId(), "name": None, "breed": {"name": "Beagle"}, "born": datetime(2024, 2, 3)}
+    sort = BY_BREED + [("born", 1), ("missing.field", 1)]
+    token = encode_token(dog, sort)
+    assert token.isascii() and "/" not in token and "+" not in token
+    assert decode_token(token, sort) == ["Beagle", None, dog["_id"], datetime(2024, 2, 3), None]
+
+
+@pytest.mark.parametrize("token", ["not a token", encode_token({"_id": 1}, [("_id", 1)])])
+def test_foreign_or_corrupt_tokens_are_rejected(token):
+    with pytest.raises(ValueError):
+        decode_token(token, BY_BREED)
+
+
+def test_tokenless_query_is_left_unchanged():
+    assert page_query({"breed.name": "Beagle"}, BY_BREED, None) == {"breed.name": "Beagle"}
+
+
+@pytest.mark.parametrize("sort", [BY_BREED, [("breed.name", -1), ("name", 1), ("_id", -1)]])
+def test_pages_continue_past_null_and_missing_sort_values(sort):
+    collection = MemoryDatabase("pagination_test")["dog"]
+    names = ["Rex", None, "Ace", None, "Max", "Bo", None]
+    breeds = ["Beagle", None, "Collie"]
+    dogs = []
+    for number, name in enumerate(names * 2):
+        dog = {"_id": ObjectId(), "breed": {"name": breeds[number % 3]} if number % 5 else {}}
+        if name is not None or number % 2:
+            dog["name"] = name
+        dogs.append(dog)
+    collection.insert_many(dogs)
+
+    expected = [dog["_id"] for dog in collection.find({}).sort(sort)]
+    for batch_size in (1, 2, 5):
+        assert [dog["_id"] for dog in iter_documents(collection, {}, sort, batch_size=batch_size)] == expected
@@ -0,0 +1,84 @@
+import contextlib
+import io
+import os
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+import parquet_export  # noqa: E402
+from memory_backend import MemoryDatabase  # noqa: E402
+from parquet_export import DATASETS, export_dataset, record_batch  # noqa: E402
+
+
+@pytest.fixture
+def database():
+    database = MemoryDatabase("export_test")
+    owners = [{"_id": ObjectId(), "name": f"Owner {number}", "email": f"owner{number}@example.com", "mobile": "1",
+               "address": {"street": "1 Road", "city": f"City {number}", "country": "NL", "zip": "00001"}}
+              for number in range(4)]
+    dogs = [{"_id": ObjectId(), "name": f"Dog {number}", "country": "NL",
+             "breed": {"_id": number, "name": f"B{number}"}, "adoption_id": None} for number in range(6)]
+    adoptions = [{"_id": ObjectId(), "dog_id": dog["_id"], "owner_id": owners[number % 4]["_id"],
+                  "adoption_date": datetime(2024, 1 + number % 3, 10 + number)} for number, dog in enumerate(dogs)]
+    database.owner.insert_many(owners)
+    database.dog.insert_many(dogs)
+    database.adoption.insert_many(adoptions)
+    return database
+
+
+def _export(database, name, output, **options):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return export_dataset(database, name, str(output), **options)
+
+
+def test_record_batch_flattens_nested_fields_and_object_ids():
+    dog_id = ObjectId()
+    dog = {"_id": dog_id, "name": "Rex", "breed": {"_id": 3, "name": "Lab"}}
+    batch = record_batch(DATASETS["dog"], [dog, {"_id": ObjectId(), "breed": "not a document"}])
+    rows = batch.to_pylist()
+    assert rows[0]["_id"] == dog_id.binary
+    assert (rows[0]["breed_id"], rows[0]["breed_name"], rows[0]["country"]) == (3, "Lab", None)
+    assert rows[1]["breed_name"] is None and rows[1]["name"] is None
+
+
+def test_adoptions_are_partitioned_by_month(database, tmp_path):
+    report = _export(database, "adoption", tmp_path)
+    assert report["rows"] == 6
+    directory = tmp_path / "adoption"
+    assert sorted(os.listdir(directory)) == ["adoption_month=2024-01", "adoption_month=2024-02",
+                                             "adoption_month=2024-03"]
+    assert not os.path.exists(str(directory) + ".tmp")
+    for month in ("01", "02", "03"):
+        table = pq.read_table(directory / f"adoption_month=2024-{month}")
+        assert {date.month for date in table.column("adoption_date").to_pylist()} == {int(month)}
+        assert table.num_rows == 2
+
+
+def test_unpartitioned_datasets_split_by_rows_per_file(database, tmp_path):
+    report = _export(database, "dog", tmp_path, batch_size=2, rows_per_file=4)
+    assert report == {"rows": 6, "files": 2, "seconds": report["seconds"]}
+    table = pq.read_table(tmp_path / "dog")
+    assert sorted(table.column("name").to_pylist()) == [f"Dog {number}" for number in range(6)]
+
+
+def test_adoption_details_join_owner_and_dog(database, tmp_path):
+    _export(database, "adoption_details", tmp_path, batch_size=4)
+    rows = pq.read_table(tmp_path / "adoption_details").to_pylist()
+    owners = {owner["_id"].binary: owner for owner in database.owner.find({})}
+    dogs = {dog["_id"].binary: dog for dog in database.dog.find({})}
+    assert len(rows) == 6
+    for row in rows:
+        assert row["owner_address_city"] == owners[row["owner_id"]]["address"]["city"]
+        assert row["dog_breed_name"] == dogs[row["dog_id"]]["breed"]["name"]
+
+
+def test_reexport_replaces_the_previous_one(database, tmp_path):
+    _export(database, "owner", tmp_path)
+    database.owner.delete_many({"name": "Owner 0"})
+    _export(database, "owner", tmp_path)
+    assert pq.read_table(tmp_path / "owner").num_rows == 3
+    assert parquet_export.schema(DATASETS["owner"]).names[0] == "_id"
@@ -0,0 +1,95 @@
+import asyncio
+import contextlib
+import io
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+import app
+import query_cache
+from indexes import ensure_indexes
+from memory_backend import MemoryDatabase
+from query_cache import QueryCache, async_cached, cached
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(query_cache, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(query_cache, "query_cache", QueryCache())
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = QueryCache()
+    cache.put(("count", (), ()), 3, ttl=60, tags=["owner.list"])
+    clock.now += 59
+    assert cache.get(("count", (), ())) == (True, 3)
+    clock.now += 2
+    assert cache.get(("count", (), ())) == (False, None)
+    assert cache.stats() == {"entries": 0, "hits": {"count": 1}, "misses": {"count": 1}, "evictions": 0,
+                             "invalidations": 0}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_entries=2)
+    cache.put(("a", (), ()), 1, ttl=60, tags=[])
+    cache.put(("b", (), ()), 2, ttl=60, tags=[])
+    cache.get(("a", (), ()))
+    cache.put(("c", (), ()), 3, ttl=60, tags=[])
+    assert [cache.get((name, (), ()))[0] for name in "abc"] == [True, False, True]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidation_drops_only_entries_with_a_matching_tag():
+    cache = QueryCache()
+    cache.put(("owners", (), ()), 1, ttl=60, tags=["owner.list", "owner.address"])
+    cache.put(("breeds", (), ()), 2, ttl=60, tags=["dog.breed"])
+    cache.invalidate("owner.address", "unused")
+    assert cache.get(("owners", (), ()))[0] is False and cache.get(("breeds", (), ()))[0] is True
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_cached_reads_are_keyed_by_module_and_arguments(clock):
+    calls = []
+
+    def lookup(value, scale=1):
+        calls.append(value)
+        return [value * scale]
+
+    async def async_lookup(value, scale=1):
+        return [-value * scale]
+
+    async_lookup.__name__ = async_lookup.__qualname__ = "lookup"
+    async_lookup.__module__ = "twin"
+    sync_read, async_read = cached(60, ["t"])(lookup), async_cached(60, ["t"])(async_lookup)
+
+    assert sync_read(2) == sync_read(2) == [2] and sync_read(2, scale=3) == [6]
+    assert asyncio.run(async_read(2)) == [-2]
+    assert calls == [2, 2]
+    sync_read(2).append("changed")
+    assert sync_read(2) == [2]
+    clock.now += 61
+    assert sync_read(2) == [2] and calls == [2, 2, 2]
+    assert set(query_cache.query_cache.stats()["hits"]) == {f"{__name__}.{lookup.__qualname__}"}
+
+
+def test_writes_invalidate_cached_owner_reads(monkeypatch):
+    database = MemoryDatabase("cache_test")
+    with contextlib.redirect_stdout(io.StringIO()):
+        ensure_indexes(database)
+    monkeypatch.setattr(app, "db", database)
+    monkeypatch.setattr(app, "query_cache", query_cache.query_cache)
+    assert app.get_top_10_owners() == []
+
+    owner_id = app.add_owner({"_id": ObjectId(), "name": "Ann", "email": "ann@example.com",
+                              "address": {"city": "Delft", "zip": "00000", "country": "NL"}})
+    assert [owner["_id"] for owner in app.get_top_10_owners()] == [owner_id]
+    with contextlib.redirect_stdout(io.StringIO()):
+        app.delete_owner(owner_id)
+    assert app.get_top_10_owners() == []